@@ -1,32 +1,43 @@
 # app.py
-from flask import Flask, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, request, jsonify, session, redirect, url_for, stream_with_context
 # Note: render_template removed - app is fully React-based
 # Only auth routes (login/register) use templates, which is fine
 from db_handler import (
     get_mcqs_by_subject,
+    get_mcqs_page_by_subject,
+    get_mcq_question,
+    iter_mcqs_by_subject,
+    InvalidCursor,
     get_mcqs_by_exam_date,
-    get_connection,
     ensure_all_tables_exist,
-    get_mcqs_by_exam_table
+    get_mcqs_by_exam_month,
+    sample_mock_test_mcqs,
+    parse_mock_test_seed,
+    MOCK_TEST_SUBJECT_LIMITS,
+    parse_month,
+    get_pool_stats,
+    get_cache_stats,
+    VALID_SUBJECTS
 )
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
+import json
+import itertools
 from datetime import datetime
 from auth import auth, login_required, init_oauth
 from flask_wtf.csrf import CSRFProtect, CSRFError
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from email_handler import mail
+from near_duplicates import get_repeated_question_clusters
+from mock_test_pool import claim_paper, request_refill, POOL_LOW_WATER
+from responses import bank_json_response, stream_json_array, get_response_cache_stats
+from static_assets import init_static, shell_response
+from session_store import init_session_store
+from explanations import generate_explanation, stream_explanation, get_explanation_cache_stats, get_model_stats
 
 load_dotenv()
 
-api_key = os.getenv('GEMINI_API_KEY')
-genai.configure(api_key=api_key)
-
-# Initialize Gemini model
-model = genai.GenerativeModel("models/gemini-1.5-pro-latest")
-
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 # Require SECRET_KEY - no default fallback for security
 app.secret_key = os.getenv('SECRET_KEY')
@@ -62,10 +73,13 @@ try:
 except Exception:
     pass
 
+# Keep session data server-side; the cookie only carries a signed session id
+init_session_store(app)
+
 # Configure Flask-Mail
 app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
 app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
@@ -78,9 +92,6 @@ PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', '')
 if PUBLIC_BASE_URL.startswith('https://'):
     app.config['PREFERRED_URL_SCHEME'] = 'https'
 
-# Initialize database and ensure all tables exist
-ensure_all_tables_exist()
-
 # Register the auth blueprint
 app.register_blueprint(auth)
 
@@ -91,6 +102,9 @@ auth.limiter = limiter
 # Initialize OAuth (Google)
 init_oauth(app)
 
+# Long-lived caching and precompressed variants for /static
+init_static(app)
+
 # Friendly CSRF error handling so users see a clear message on form failures
 @app.errorhandler(CSRFError)
 def handle_csrf_error(e):
@@ -98,36 +112,54 @@ def handle_csrf_error(e):
     flash('Your session expired or the form is invalid. Please try again.', 'error')
     return redirect(url_for('auth.login'))
 
-def generate_explanation(question, correct_option):
-    try:
-        prompt = f"Explain why the correct answer to the following MCQ is option {correct_option}:\n\n{question}"
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        return f"Error generating explanation: {str(e)}"
-
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 @login_required
 def index(path):
     """Main entry point - serves React app only (fully React-based)"""
-    react_index = os.path.join('static', 'index.html')
-    if not os.path.exists(react_index):
-        return "React app not found. Please build the frontend first.", 500
-    
     try:
-        with open(react_index, 'r', encoding='utf-8') as f:
-            return f.read()
+        response = shell_response()
     except Exception as e:
         print(f"Error serving React app: {e}")
         return f"Error loading React app: {str(e)}", 500
+    if response is None:
+        return "React app not found. Please build the frontend first.", 500
+    return response
+
+@app.route('/health/db_pool')
+@login_required
+def db_pool_stats():
+    """Connection pool statistics for the worker that serves this request"""
+    return jsonify(get_pool_stats())
+
+@app.route('/health/mcq_cache')
+@login_required
+def mcq_cache_stats():
+    """Question-bank cache hit/miss/eviction counters for this worker"""
+    return jsonify({
+        'question_banks': get_cache_stats(),
+        'explanations': get_explanation_cache_stats(),
+        'responses': get_response_cache_stats(),
+    })
+
+@app.route('/health/gemini')
+@login_required
+def gemini_stats():
+    """Gemini latency, error, bulkhead and circuit breaker counters for this worker"""
+    return jsonify(get_model_stats())
 
 # Removed /prep route - all functionality is now in React app
 # The React app handles routing internally via App.js
 
+def _is_page_request():
+    return 'cursor' in request.args or 'page_size' in request.args
+
 @app.route('/get_mcqs/<subject>')
 @login_required
-@limiter.limit("100 per hour")
+# Loading a subject page by page takes a couple of dozen small keyset
+# requests, so pages get their own, larger budget
+@limiter.limit("100 per hour", exempt_when=_is_page_request)
+@limiter.limit("2000 per hour", exempt_when=lambda: not _is_page_request())
 def get_mcqs(subject):
     """Get MCQs for a specific subject - STRICTLY filtered by subject"""
     try:
@@ -136,48 +168,79 @@ def get_mcqs(subject):
         if subject not in valid_subjects:
             return jsonify({'error': f'Invalid subject. Must be one of: {", ".join(valid_subjects)}'}), 400
         
-        # Get MCQs filtered strictly by subject
-        mcqs = get_mcqs_by_subject(subject)
-        
-        # Double-check: Verify all returned MCQs are for the requested subject
-        if mcqs:
-            for mcq in mcqs:
+        # Paginated form: ?page_size=N[&cursor=...] returns one keyset page
+        if _is_page_request():
+            try:
+                page_size = int(request.args.get('page_size', 50))
+            except ValueError:
+                return jsonify({'error': 'page_size must be a number'}), 400
+            cursor = request.args.get('cursor') or None
+            try:
+                response = bank_json_response(
+                    ('subject_page', subject, cursor, page_size),
+                    lambda: get_mcqs_page_by_subject(subject, cursor, page_size)
+                )
+            except InvalidCursor as e:
+                return jsonify({'error': str(e)}), 400
+            return response
+
+        # Streaming form: ?stream=1 sends the bank straight from a server-side
+        # cursor, so memory per request stays bounded (no ETag/compression)
+        if request.args.get('stream') == '1':
+            chunks = iter_mcqs_by_subject(subject)
+            # Peek before the 200 goes out, so an empty subject gets the same 404
+            first = next(chunks, None)
+            if not first:
+                chunks.close()
+                return jsonify({'error': f'No MCQs found for subject: {subject}'}), 404
+            return stream_json_array(itertools.chain([first], chunks))
+
+        def load():
+            # Get MCQs filtered strictly by subject
+            mcqs = get_mcqs_by_subject(subject)
+
+            # Double-check: Verify all returned MCQs are for the requested subject
+            for mcq in mcqs or []:
                 # If MCQ has a subject field, verify it matches
                 if hasattr(mcq, 'get') and mcq.get('subject'):
                     if mcq.get('subject') != subject:
                         print(f"⚠️ WARNING: MCQ {mcq.get('id')} has subject '{mcq.get('subject')}' but was requested for '{subject}'")
-        
-        if not mcqs:
+            if mcqs:
+                print(f"✅ Serializing {len(mcqs)} MCQs for subject: {subject}")
+            return mcqs
+
+        # Served from the per-version body cache; 304 when the client is up to date
+        response = bank_json_response(('subject', subject), load)
+        if response is None:
             return jsonify({'error': f'No MCQs found for subject: {subject}'}), 404
-        
-        print(f"✅ Returning {len(mcqs)} MCQs for subject: {subject}")
-        return jsonify(mcqs)
+        return response
     except Exception as e:
         import traceback
         print(f"❌ Error in get_mcqs for subject '{subject}': {e}")
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
-def get_month_table_name(year, month):
-    """Get table name for a specific year and month"""
-    month_lower = month.lower()
-    year_suffix = str(year)[-2:]  # Get last 2 digits of year (e.g., 25 for 2025)
-    return f"{month_lower}{year_suffix}_mcqs"
-
-MONTH_TABLES_2025 = {
-    'january': 'january25_mcqs',
-    'february': 'february25_mcqs',
-    'march': 'march25_mcqs',
-    'april': 'april25_mcqs',
-    'may': 'may25_mcqs',
-    'june': 'june25_mcqs',
-    'july': 'july25_mcqs',
-    'august': 'august25_mcqs',
-    'september': 'september25_mcqs',
-    'october': 'october25_mcqs',
-    'november': 'november25_mcqs',
-    'december': 'december25_mcqs'
-}
+@app.route('/get_mcqs/repeated')
+@login_required
+@limiter.limit("30 per hour")
+def get_repeated_mcqs():
+    """Clusters of questions that recur (possibly reworded) across exam months"""
+    subject = request.args.get('subject')
+    if subject and subject not in VALID_SUBJECTS:
+        return jsonify({'error': f'Invalid subject. Must be one of: {", ".join(VALID_SUBJECTS)}'}), 400
+    try:
+        threshold = float(request.args.get('threshold', 0.5))
+    except ValueError:
+        return jsonify({'error': 'threshold must be a number between 0 and 1'}), 400
+    if not 0 < threshold <= 1:
+        return jsonify({'error': 'threshold must be a number between 0 and 1'}), 400
+    try:
+        return jsonify(get_repeated_question_clusters(threshold, subject))
+    except Exception as e:
+        import traceback
+        print(f"❌ Error in get_repeated_mcqs: {e}")
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/get_mcqs/exam/<int:year>/<month>')
 @login_required
@@ -185,30 +248,18 @@ MONTH_TABLES_2025 = {
 def get_exam_mcqs(year, month):
     """Get MCQs for a specific exam year and month"""
     try:
-        # For now, only 2025 has MCQs. This structure supports future years
-        if year == 2025:
-            table_name = MONTH_TABLES_2025.get(month.lower())
-            if not table_name:
-                return jsonify({'error': f"No MCQ table configured for {month} {year}."}), 404
-
-            mcqs = get_mcqs_by_exam_table(table_name)
-            if not mcqs or len(mcqs) == 0:
-                return jsonify({'error': f"This Month's MCQs for {year} will be updated soon"}), 404
-            return jsonify(mcqs)
-
-        # Years without data yet
-        if year == 2023 or year == 2024:
-            return jsonify({'error': f"Data for {month} {year} will be updated soon"}), 404
-
-        # Future extensibility: other years can map to dynamic table names
-        table_name = get_month_table_name(year, month)
-        if not table_name:
-            return jsonify({'error': f"No MCQ table configured for {month} {year}."}), 404
-
-        mcqs = get_mcqs_by_exam_table(table_name)
-        if not mcqs or len(mcqs) == 0:
+        # Any year works once its MCQs are ingested - partitions are created on demand
+        month_number = parse_month(month)
+        if not month_number:
+            return jsonify({'error': f"No MCQs configured for {month} {year}."}), 404
+
+        response = bank_json_response(
+            ('exam', year, month_number),
+            lambda: get_mcqs_by_exam_month(year, month_number)
+        )
+        if response is None:
             return jsonify({'error': f"This Month's MCQs for {year} will be updated soon"}), 404
-        return jsonify(mcqs)
+        return response
     except Exception as e:
         import traceback
         print(f"Error in get_exam_mcqs: {e}")
@@ -233,6 +284,33 @@ def gemini_explanation():
     explanation = generate_explanation(question, correct_option)
     return jsonify({'explanation': explanation})
 
+@app.route('/gemini_explanation/stream/<int:mcq_id>')
+@login_required
+@limiter.limit("50 per hour")
+def gemini_explanation_stream(mcq_id):
+    """Server-Sent Events version of /gemini_explanation: model output is
+    forwarded chunk by chunk, then a final 'done' (or 'error') event.
+    Keyed by MCQ id so the question text never travels in the URL."""
+    row = get_mcq_question(mcq_id)
+    if row is None:
+        return jsonify({'error': 'MCQ not found'}), 404
+    question, correct_option = row
+
+    def events():
+        try:
+            for text in stream_explanation(question, correct_option):
+                yield f"data: {json.dumps({'text': text})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"❌ Error streaming explanation: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': 'Error generating explanation. Please try again later.'})}\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/get_mcqs/mock_test')
 @login_required
 @limiter.limit("10 per hour")
@@ -240,130 +318,31 @@ def get_mock_test_mcqs():
     """Get 210 random MCQs from all months for mock test:
     Medicine: 63, Obstetrics & Gynecology: 53, Pediatrics: 52, General Surgery: 42
     Total time: 4 hours"""
+    seed = request.args.get('seed')
+    if seed is not None and parse_mock_test_seed(seed) is None:
+        return jsonify({'error': 'Invalid mock test seed'}), 400
     try:
-        from psycopg2 import sql
-        import random
-        
-        # Subject distribution
-        subject_limits = {
-            'Medicine': 63,
-            'Gynae': 53,
-            'Paeds': 52,
-            'Surgery': 42
-        }
-        
-        # All month tables for 2025 (check which ones exist)
-        month_tables = [
-            'january25_mcqs',
-            'february25_mcqs',
-            'march25_mcqs',
-            'april25_mcqs',
-            'may25_mcqs',
-            'june25_mcqs',
-            'july25_mcqs',
-            'august25_mcqs',
-            'september25_mcqs',
-            'october25_mcqs',
-            'november25_mcqs',
-            'december25_mcqs'
-        ]
-        
-        all_mcqs = []
-        with get_connection() as conn:
-            # Set autocommit to handle errors per query
-            conn.autocommit = False
-            with conn.cursor() as cur:
-                # Optimized: Check all tables at once instead of one by one
-                cur.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = ANY(%s)
-                """, (month_tables,))
-                existing_tables = [row[0] for row in cur.fetchall()]
-                
-                if not existing_tables:
-                    return jsonify({'error': 'No MCQ tables found'}), 404
-                
-                # Optimized: Query each subject separately with LIMIT to reduce data transfer
-                # This is much faster than fetching all rows and filtering in Python
-                for subject, limit in subject_limits.items():
-                    union_parts = []
-                    params = []
-                    for table in existing_tables:
-                        union_parts.append(sql.SQL("""
-                            SELECT 
-                                id, question_number, question_text, 
-                                option_a, option_b, option_c, option_d,
-                                correct_answer, subject, explanation
-                            FROM {table}
-                            WHERE subject = %s
-                        """).format(table=sql.Identifier(table)))
-                        params.append(subject)  # Add subject parameter for each UNION part
-                    
-                    if not union_parts:
-                        continue
-                    
-                    # Combine all tables for this subject
-                    combined_query = sql.SQL(" UNION ALL ").join(union_parts)
-                    
-                    # Use ORDER BY RANDOM() with LIMIT
-                    # Fetch 2x the limit to ensure we have enough after deduplication
-                    final_query = sql.SQL("""
-                        SELECT * FROM (
-                            {combined}
-                        ) AS all_mcqs
-                        ORDER BY RANDOM()
-                        LIMIT %s
-                    """).format(combined=combined_query)
-                    
-                    # Add LIMIT parameter
-                    params.append(limit * 2)
-                    
-                    try:
-                        cur.execute(final_query, params)
-                        rows = cur.fetchall()
-                        
-                        # Convert to MCQ format
-                        subject_mcqs = []
-                        seen_ids = set()  # Deduplicate by ID
-                        for row in rows:
-                            if len(subject_mcqs) >= limit:
-                                break
-                            if row[0] in seen_ids:
-                                continue
-                            seen_ids.add(row[0])
-                            
-                            mcq = {
-                                'id': row[0],
-                                'question_number': row[1],
-                                'question_text': row[2],
-                                'options': {},
-                                'correct_answer': row[7],
-                                'subject': row[8],
-                                'explanation': row[9]
-                            }
-                            if row[3]:
-                                mcq['options']['A'] = row[3]
-                            if row[4]:
-                                mcq['options']['B'] = row[4]
-                            if row[5]:
-                                mcq['options']['C'] = row[5]
-                            if row[6]:
-                                mcq['options']['D'] = row[6]
-                            subject_mcqs.append(mcq)
-                        
-                        # If we got fewer than needed, take what we have
-                        all_mcqs.extend(subject_mcqs[:limit])
-                    except Exception as e:
-                        print(f"⚠️ Error querying {subject}: {e}")
-                        continue
-                
-                conn.commit()
-        
-        # Shuffle all_mcqs so subjects are mixed
-        random.shuffle(all_mcqs)
-        return jsonify(all_mcqs)
+        if seed is None:
+            # Normal case: hand out a pre-generated paper this user has not seen
+            claimed = claim_paper(session['user_id'])
+            if claimed:
+                payload, seed, available = claimed
+                if available < POOL_LOW_WATER:
+                    request_refill()
+                response = app.response_class(payload, mimetype='application/json')
+                response.headers['X-Mock-Test-Seed'] = seed
+                return response
+            request_refill()
+
+        # Pool empty or a specific paper requested: sample one inline.
+        # Draws from cached per-subject id arrays; the seed token reproduces the paper
+        all_mcqs, seed = sample_mock_test_mcqs(MOCK_TEST_SUBJECT_LIMITS, seed=seed)
+        if not all_mcqs:
+            return jsonify({'error': 'No MCQs found for mock test'}), 404
+
+        response = jsonify(all_mcqs)
+        response.headers['X-Mock-Test-Seed'] = seed
+        return response
     except Exception as e:
         import traceback
         print(f"Error in get_mock_test_mcqs: {e}")
@@ -374,6 +353,9 @@ def get_mock_test_mcqs():
  
 
 if __name__ == '__main__':
+    # Development server: bring the schema up to date before serving.
+    # In production run `python migrations.py` as a deploy step instead.
+    ensure_all_tables_exist()
     # Only enable debug mode if explicitly set in environment
     debug_mode = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     app.run(debug=debug_mode, host='0.0.0.0', port=int(os.getenv('PORT', 5000)))
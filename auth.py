@@ -1,9 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
-from werkzeug.security import generate_password_hash, check_password_hash
+import psycopg2.errors
 from db_handler import get_connection
+from passwords import hash_password, verify_password, upgraded_hash, PasswordCheckBusy
+from session_store import regenerate_session
 import os
+import threading
+import time
 from functools import wraps
-from email_handler import mail, generate_verification_code, send_verification_email
+from email_handler import mail, generate_verification_code, queue_verification_email
 from authlib.integrations.flask_client import OAuth
 from forms import RegistrationForm, LoginForm, VerificationForm
 
@@ -51,6 +55,52 @@ def init_oauth(app):
     except Exception:
         pass
 
+# How often each worker re-reads Google's OIDC discovery document and JWKS
+GOOGLE_METADATA_REFRESH = float(os.getenv('GOOGLE_METADATA_REFRESH', 3600))
+GOOGLE_METADATA_RETRY = 60
+
+def refresh_google_metadata():
+    """Re-fetch the discovery document and signing keys into the client's cache,
+    so logins never wait on them"""
+    # authlib only fetches the discovery document while '_loaded_at' is absent;
+    # both fetches write the cache only on success
+    loaded_at = google.server_metadata.pop('_loaded_at', None)
+    try:
+        google.load_server_metadata()
+        google.fetch_jwk_set(force=True)
+    except Exception:
+        # Keep serving the previous copy
+        if loaded_at is not None:
+            google.server_metadata.setdefault('_loaded_at', loaded_at)
+        raise
+
+class GoogleMetadataRefresher(threading.Thread):
+    """Background thread keeping the Google OIDC metadata and JWKS fresh"""
+
+    def __init__(self):
+        super().__init__(name='google-oidc-metadata', daemon=True)
+
+    def run(self):
+        while True:
+            try:
+                refresh_google_metadata()
+                delay = GOOGLE_METADATA_REFRESH
+            except Exception as e:
+                print(f"⚠️ Could not refresh Google OIDC metadata: {e}")
+                delay = GOOGLE_METADATA_RETRY
+            time.sleep(delay)
+
+_metadata_refresher = None
+
+def start_google_metadata_refresher():
+    """Start this process's refresher (gunicorn post_worker_init calls it)"""
+    global _metadata_refresher
+    if google is None or not os.getenv('GOOGLE_CLIENT_ID') or _metadata_refresher is not None:
+        return _metadata_refresher
+    _metadata_refresher = GoogleMetadataRefresher()
+    _metadata_refresher.start()
+    return _metadata_refresher
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -94,7 +144,7 @@ def register():
                         }
                         
                         # Send verification email
-                        if send_verification_email(email, verification_code):
+                        if queue_verification_email(email, verification_code):
                             flash('Please check your email for verification code to complete registration.', 'info')
                             return redirect(url_for('auth.verify_email'))
                         else:
@@ -139,7 +189,7 @@ def verify_email():
                             """, (
                                 registration_data['username'],
                                 registration_data['email'],
-                                generate_password_hash(registration_data['password'])
+                                hash_password(registration_data['password'])
                             ))
                             user_id = cur.fetchone()[0]
                             conn.commit()
@@ -192,7 +242,7 @@ def resend_verification():
         session['pending_registration'] = registration_data
         
         # Send new verification email
-        if send_verification_email(registration_data['email'], new_verification_code):
+        if queue_verification_email(registration_data['email'], new_verification_code):
             flash('New verification code sent! Please check your email.', 'success')
         else:
             flash('Error sending verification email. Please try again.', 'error')
@@ -216,27 +266,53 @@ def login():
             try:
                 with get_connection() as conn:
                     with conn.cursor() as cur:
-                        # Match by exact username OR case-insensitive email
-                        cur.execute("""
-                            SELECT id, password_hash, is_verified 
-                            FROM users 
-                            WHERE username = %s OR LOWER(email) = LOWER(%s)
-                        """, (identifier, identifier))
-                        user = cur.fetchone()
-                        
-                        if user and check_password_hash(user[1], password):
-                            if not user[2]:  # if not verified
-                                flash('Please verify your email first', 'error')
-                                return redirect(url_for('auth.login'))
-                            
-                            session['user_id'] = user[0]
-                            # Preserve what user typed as their handle for greeting
-                            session['username'] = identifier
-                            return redirect(url_for('index'))
-                        else:
-                            flash('Invalid username or password', 'error')
-                            return redirect(url_for('auth.login'))
-                            
+                        # One index lookup: usernames cannot contain '@', so an
+                        # identifier with one is an email (users_lower_email_idx)
+                        user = None
+                        if '@' in identifier:
+                            conn.execute_prepared(cur, 'login_lookup_email', """
+                                SELECT id, password_hash, is_verified
+                                FROM users
+                                WHERE LOWER(email) = LOWER(%s)
+                            """, (identifier,))
+                            user = cur.fetchone()
+                        if user is None:
+                            conn.execute_prepared(cur, 'login_lookup_username', """
+                                SELECT id, password_hash, is_verified
+                                FROM users
+                                WHERE username = %s
+                            """, (identifier,))
+                            user = cur.fetchone()
+
+                # Verify with the connection back in the pool (hashing is the slow part)
+                if not user or not verify_password(user[1], password):
+                    flash('Invalid username or password', 'error')
+                    return redirect(url_for('auth.login'))
+                if not user[2]:  # if not verified
+                    flash('Please verify your email first', 'error')
+                    return redirect(url_for('auth.login'))
+
+                # Upgrade hashes made with older cost parameters
+                new_hash = upgraded_hash(user[1], password)
+                if new_hash:
+                    with get_connection() as conn:
+                        with conn.cursor() as cur:
+                            cur.execute("""
+                                UPDATE users SET password_hash = %s
+                                WHERE id = %s AND password_hash = %s
+                            """, (new_hash, user[0], user[1]))
+                        conn.commit()
+
+                # New session id on login (no session fixation)
+                regenerate_session(session)
+                session['user_id'] = user[0]
+                # Preserve what user typed as their handle for greeting
+                session['username'] = identifier
+                return redirect(url_for('index'))
+
+            except PasswordCheckBusy as e:
+                flash(str(e), 'error')
+                return redirect(url_for('auth.login'))
             except Exception as e:
                 flash(f'Error during login: {str(e)}', 'error')
                 return redirect(url_for('auth.login'))
@@ -284,6 +360,69 @@ def login_google():
         print(f"[Google OAuth] Error: {e}")
         return redirect(url_for('auth.login'))
 
+# Leave room for a numeric suffix within users.username VARCHAR(50)
+GOOGLE_USERNAME_MAX = 40
+
+def find_or_create_google_user(google_id, email, name):
+    """(id, username) for a Google account: found by google_id, linked by email,
+    or created. Two statements at most, whatever the username collisions."""
+    with get_connection() as conn:
+        for attempt in range(3):
+            try:
+                with conn.cursor() as cur:
+                    # Existing Google user, or link the account registered with this email
+                    cur.execute("""
+                        WITH by_google AS (
+                            SELECT id, username FROM users WHERE google_id = %(google_id)s
+                        ), linked AS (
+                            UPDATE users SET google_id = %(google_id)s, is_verified = TRUE
+                            WHERE LOWER(email) = LOWER(%(email)s)
+                              AND NOT EXISTS (SELECT 1 FROM by_google)
+                            RETURNING id, username
+                        )
+                        SELECT id, username FROM by_google
+                        UNION ALL
+                        SELECT id, username FROM linked
+                        LIMIT 1
+                    """, {'google_id': google_id, 'email': email})
+                    row = cur.fetchone()
+                    if row is None:
+                        row = _insert_google_user(cur, google_id, email, name)
+                conn.commit()
+                return row
+            except psycopg2.errors.UniqueViolation:
+                # Lost a race for the same username or account; look again
+                conn.rollback()
+                if attempt == 2:
+                    raise
+
+def _insert_google_user(cur, google_id, email, name):
+    """Create the user as ``name``, or ``name`` plus the next free numeric suffix"""
+    base = (name or email.split('@')[0]).strip()[:GOOGLE_USERNAME_MAX]
+    pattern = base.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    # The LIKE prefix scan uses users_username_pattern_idx
+    cur.execute("""
+        INSERT INTO users (username, email, password_hash, is_verified, google_id)
+        SELECT CASE
+                   WHEN NOT EXISTS (SELECT 1 FROM users WHERE username = %(base)s) THEN %(base)s
+                   ELSE %(base)s || (
+                       SELECT COALESCE(MAX(substr(username, length(%(base)s) + 1)::bigint), 0) + 1
+                       FROM users
+                       WHERE username LIKE %(pattern)s
+                         AND substr(username, length(%(base)s) + 1) ~ '^[0-9]{1,9}$'
+                   )
+               END,
+               %(email)s, %(password_hash)s, TRUE, %(google_id)s
+        RETURNING id, username
+    """, {
+        'base': base,
+        'pattern': pattern,
+        'email': email,
+        'password_hash': hash_password(os.urandom(16).hex()),
+        'google_id': google_id,
+    })
+    return cur.fetchone()
+
 @auth.route('/auth/google/callback')
 def google_callback():
     try:
@@ -295,16 +434,19 @@ def google_callback():
             return redirect(url_for('auth.login'))
 
         token = google.authorize_access_token()
-        # Fetch userinfo using discovered endpoint
-        resp = google.get('userinfo')
-        if resp.status_code != 200:
-            try:
-                details = resp.json()
-            except Exception:
-                details = resp.text
-            flash(f'Google login failed: userinfo error {resp.status_code}: {details}', 'error')
-            return redirect(url_for('auth.login'))
-        userinfo = resp.json()
+        # Claims from the verified ID token (keys come from the cached JWKS);
+        # only fall back to the userinfo endpoint if they are missing
+        userinfo = token.get('userinfo')
+        if not userinfo or not userinfo.get('email'):
+            resp = google.get('userinfo')
+            if resp.status_code != 200:
+                try:
+                    details = resp.json()
+                except Exception:
+                    details = resp.text
+                flash(f'Google login failed: userinfo error {resp.status_code}: {details}', 'error')
+                return redirect(url_for('auth.login'))
+            userinfo = resp.json()
         # Support both Google APIs (id) and OIDC (sub)
         google_id = userinfo.get('id') or userinfo.get('sub')
         # Email can be in 'email' (OIDC) or nested arrays in old APIs
@@ -322,65 +464,14 @@ def google_callback():
             flash('Google authentication failed: missing id or email', 'error')
             return redirect(url_for('auth.login'))
 
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Ensure google_id column exists (safe no-op if already added)
-                try:
-                    cur.execute("""
-                        ALTER TABLE users
-                        ADD COLUMN IF NOT EXISTS google_id VARCHAR(64) UNIQUE
-                    """)
-                    conn.commit()
-                except Exception:
-                    conn.rollback()
-
-                # Look up by google_id first
-                cur.execute("""
-                    SELECT id, username FROM users WHERE google_id = %s
-                """, (google_id,))
-                row = cur.fetchone()
-
-                if not row:
-                    # If not found by google_id, try existing email to link account
-                    cur.execute("""
-                        SELECT id, username FROM users WHERE email = %s
-                    """, (email,))
-                    row = cur.fetchone()
-                    if row:
-                        # Link google_id to existing user
-                        cur.execute("""
-                            UPDATE users SET google_id = %s, is_verified = TRUE WHERE id = %s
-                        """, (google_id, row[0]))
-                        conn.commit()
-                    else:
-                        # Create new user
-                        username = name
-                        # Ensure username is unique
-                        cur.execute("SELECT 1 FROM users WHERE username = %s", (username,))
-                        if cur.fetchone():
-                            base = username
-                            suffix = 1
-                            while True:
-                                candidate = f"{base}{suffix}"
-                                cur.execute("SELECT 1 FROM users WHERE username = %s", (candidate,))
-                                if not cur.fetchone():
-                                    username = candidate
-                                    break
-                                suffix += 1
-                        cur.execute("""
-                            INSERT INTO users (username, email, password_hash, is_verified, google_id)
-                            VALUES (%s, %s, %s, TRUE, %s)
-                            RETURNING id
-                        """, (username, email, generate_password_hash(os.urandom(16).hex()), google_id))
-                        user_id = cur.fetchone()[0]
-                        conn.commit()
-                        row = (user_id, username)
+        row = find_or_create_google_user(google_id, email, name)
 
-                # Log the user in
-                session['user_id'] = row[0]
-                session['username'] = row[1]
-                # Successful Google login – no need to show a success banner on the login screen
-                return redirect(url_for('index'))
+        # Log the user in under a new session id (no session fixation)
+        regenerate_session(session)
+        session['user_id'] = row[0]
+        session['username'] = row[1]
+        # Successful Google login – no need to show a success banner on the login screen
+        return redirect(url_for('index'))
     except Exception as e:
         # Print full details to console for debugging
         try:
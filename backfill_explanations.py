@@ -0,0 +1,298 @@
+"""
+Backfill missing MCQ explanations offline.
+
+Scans the mcqs store for questions with an empty explanation and asks the
+model for several of them per prompt, with bounded concurrency and a
+requests-per-minute budget. Results are written back in bulk (and into the
+explanation_cache used by /gemini_explanation). Progress is checkpointed in
+job_checkpoints, so an interrupted run resumes where it stopped.
+
+Usage:
+    python backfill_explanations.py [--batch-size 5] [--concurrency 4] [--rpm 30]
+                                    [--subject Medicine] [--limit N] [--restart] [--stub]
+
+--stub uses a local fake model (no network, no API key) to exercise the
+whole pipeline against a development database.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from psycopg2.extras import execute_values
+from db_handler import get_connection, bump_bank_version, VALID_SUBJECTS
+
+JOB_NAME = 'backfill_explanations'
+SCAN_PAGE_SIZE = 500
+MAX_ATTEMPTS = 3
+
+class RateLimiter:
+    """Token bucket: at most ``rpm`` acquisitions per minute, bursts up to ``burst``"""
+
+    def __init__(self, rpm, burst=1):
+        self.rate = rpm / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+class StubModel:
+    """Stands in for the Gemini client: answers batch prompts with canned JSON"""
+
+    def __init__(self, delay=0.0, fail_every=0):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_every and call % self.fail_every == 0:
+            raise RuntimeError("stub model failure")
+        items = json.loads(prompt[prompt.index('['):])
+        return _StubResponse(json.dumps([
+            {'id': item['id'], 'explanation': f"**1. Correct answer** Option {item['correct_answer']} is correct (stub)."}
+            for item in items
+        ]))
+
+def build_batch_prompt(rows):
+    """One prompt for several MCQs; the model answers with a JSON array keyed by id"""
+    items = [
+        {
+            'id': r['id'],
+            'question': r['question_text'],
+            'options': {'A': r['option_a'], 'B': r['option_b'], 'C': r['option_c'], 'D': r['option_d']},
+            'correct_answer': r['correct_answer'],
+        }
+        for r in rows
+    ]
+    return (
+        "For each MCQ below, explain why the correct answer is right and why the other options are wrong. "
+        "Respond with JSON only: an array of objects {\"id\": <id>, \"explanation\": \"<text>\"}, "
+        "one per MCQ, in the same order.\n\n"
+        + json.dumps(items, ensure_ascii=False)
+    )
+
+def parse_batch_response(text, expected_ids):
+    """{id: explanation} for the ids the model answered"""
+    text = re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', text or '')
+    try:
+        items = json.loads(text)
+    except ValueError:
+        return {}
+    results = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        mcq_id, explanation = item.get('id'), item.get('explanation')
+        if mcq_id in expected_ids and isinstance(explanation, str) and explanation.strip():
+            results[mcq_id] = explanation.strip()
+    return results
+
+def load_checkpoint(restart=False):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if restart:
+                cur.execute("DELETE FROM job_checkpoints WHERE job_name = %s", (JOB_NAME,))
+                return 0
+            cur.execute("SELECT last_id FROM job_checkpoints WHERE job_name = %s", (JOB_NAME,))
+            row = cur.fetchone()
+    return row[0] if row else 0
+
+def save_checkpoint(conn, last_id, counts):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO job_checkpoints (job_name, last_id, state, updated_at)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (job_name) DO UPDATE
+            SET last_id = EXCLUDED.last_id, state = EXCLUDED.state, updated_at = EXCLUDED.updated_at
+        """, (JOB_NAME, last_id, json.dumps(counts)))
+
+def scan_pending(after_id, subject=None, limit=None):
+    """Yield MCQs with no explanation in id order, a page at a time"""
+    yielded = 0
+    while limit is None or yielded < limit:
+        page = SCAN_PAGE_SIZE if limit is None else min(SCAN_PAGE_SIZE, limit - yielded)
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, exam_year, exam_month, question_text,
+                           option_a, option_b, option_c, option_d, correct_answer
+                    FROM mcqs
+                    WHERE id > %s
+                      AND (explanation IS NULL OR btrim(explanation) = '')
+                      AND (%s::medical_subject IS NULL OR subject = %s::medical_subject)
+                    ORDER BY id
+                    LIMIT %s
+                """, (after_id, subject, subject, page))
+                columns = [c[0] for c in cur.description]
+                rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        yielded += len(rows)
+        after_id = rows[-1]['id']
+
+def write_explanations(conn, rows, results):
+    """Bulk-write explanations into mcqs and the explanation cache"""
+    from explanations import explanation_key
+    by_id = {r['id']: r for r in rows}
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            UPDATE mcqs AS m SET explanation = v.explanation
+            FROM (VALUES %s) AS v(exam_year, exam_month, id, explanation)
+            WHERE m.exam_year = v.exam_year AND m.exam_month = v.exam_month AND m.id = v.id
+              AND (m.explanation IS NULL OR btrim(m.explanation) = '')
+        """, [
+            (by_id[i]['exam_year'], by_id[i]['exam_month'], i, text) for i, text in results.items()
+        ], template="(%s::smallint, %s::smallint, %s::bigint, %s)")
+        bump_bank_version(cur)
+        cache_rows = {}
+        for i, text in results.items():
+            cache_rows[explanation_key(by_id[i]['question_text'], by_id[i]['correct_answer'])] = text
+        execute_values(cur, """
+            INSERT INTO explanation_cache (question_hash, correct_option, explanation)
+            VALUES %s
+            ON CONFLICT (question_hash, correct_option) DO UPDATE
+            SET explanation = EXCLUDED.explanation, lease_owner = NULL, lease_expires = NULL
+            WHERE explanation_cache.explanation IS NULL
+        """, [(h, o, text) for (h, o), text in cache_rows.items()])
+
+def explain_batch(model, limiter, rows):
+    """Ask the model about one batch, retrying with backoff. Returns {id: explanation}."""
+    expected = {r['id'] for r in rows}
+    prompt = build_batch_prompt(rows)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        limiter.acquire()
+        try:
+            results = parse_batch_response(model.generate_content(prompt).text, expected)
+            if results or attempt == MAX_ATTEMPTS:
+                return results
+        except Exception as e:
+            if attempt == MAX_ATTEMPTS:
+                print(f"⚠️ Batch {min(expected)}..{max(expected)} failed: {e}")
+                return {}
+        time.sleep(2 ** attempt)
+    return {}
+
+def backfill(model, batch_size=5, concurrency=4, rpm=30, subject=None, limit=None, restart=False):
+    """Fill in missing explanations. Returns counts of written/failed questions."""
+    start_id = load_checkpoint(restart)
+    limiter = RateLimiter(rpm, burst=concurrency)
+    counts = {'written': 0, 'failed': 0, 'batches': 0}
+    started = time.monotonic()
+    if start_id:
+        print(f"⏩ Resuming after MCQ id {start_id}")
+
+    # Batches finish out of order; the checkpoint only advances past batches
+    # whose predecessors are all done, and never past a batch with failed
+    # questions, so a resume never skips a question. (Questions written after
+    # such a batch are simply not pending any more when the scan comes back.)
+    pending_batches = []  # [(last_id, future)] in submission order
+    checkpoint = start_id
+    held_back = False
+    lock = threading.Lock()
+
+    def drain(block):
+        nonlocal checkpoint, held_back
+        if block and pending_batches:
+            # Only the head can move the checkpoint, so wait for it specifically
+            wait([pending_batches[0][1]])
+        advanced = False
+        while pending_batches and pending_batches[0][1].done():
+            last_id, future = pending_batches.pop(0)
+            failed = future.result()  # also surfaces database errors from the worker
+            if failed:
+                held_back = True
+            if not held_back:
+                checkpoint = last_id
+                advanced = True
+        if advanced:
+            with get_connection() as conn:
+                save_checkpoint(conn, checkpoint, counts)
+
+    def run(rows):
+        """Explain and store one batch; returns how many of its questions failed"""
+        results = explain_batch(model, limiter, rows)
+        if results:
+            with get_connection() as conn:
+                write_explanations(conn, rows, results)
+        with lock:
+            counts['written'] += len(results)
+            counts['failed'] += len(rows) - len(results)
+            counts['batches'] += 1
+        print(f"📝 {counts['written']} written, {counts['failed']} failed "
+              f"({counts['batches']} batches, {time.monotonic() - started:.0f}s)")
+        return len(rows) - len(results)
+
+    batch = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for row in scan_pending(start_id, subject, limit):
+            batch.append(row)
+            if len(batch) < batch_size:
+                continue
+            pending_batches.append((batch[-1]['id'], pool.submit(run, batch)))
+            batch = []
+            # Bounded window: never queue far ahead of the workers
+            while len(pending_batches) >= concurrency * 2:
+                drain(block=True)
+        if batch:
+            pending_batches.append((batch[-1]['id'], pool.submit(run, batch)))
+        while pending_batches:
+            drain(block=True)
+
+    # Final counts (the checkpoint itself only moved where it was safe to)
+    with get_connection() as conn:
+        save_checkpoint(conn, checkpoint, counts)
+    if held_back:
+        print(f"⏸️ Checkpoint held at MCQ id {checkpoint}: failed questions will be retried on the next run")
+    print(f"\n📊 Backfill done: {counts['written']} explanations written, {counts['failed']} failed "
+          f"in {time.monotonic() - started:.1f}s")
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate missing MCQ explanations in bulk")
+    parser.add_argument('--batch-size', type=int, default=5, help="Questions per prompt")
+    parser.add_argument('--concurrency', type=int, default=4, help="Model calls in flight")
+    parser.add_argument('--rpm', type=float, default=float(os.getenv('BACKFILL_RPM', 30)),
+                        help="Model requests per minute (default: BACKFILL_RPM or 30)")
+    parser.add_argument('--subject', choices=VALID_SUBJECTS)
+    parser.add_argument('--limit', type=int, help="Stop after this many questions")
+    parser.add_argument('--restart', action='store_true', help="Ignore the saved checkpoint")
+    parser.add_argument('--stub', action='store_true', help="Use a local fake model (no network)")
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        model = StubModel()
+    else:
+        from explanations import model
+    counts = backfill(model, args.batch_size, args.concurrency, args.rpm,
+                      args.subject, args.limit, args.restart)
+    return 0 if not counts['failed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
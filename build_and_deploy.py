@@ -1,67 +1,220 @@
 """
 Script to build React app and copy to Flask static folder
 Run this after making changes to the React frontend
+
+  - The build is skipped when nothing under frontend/src, frontend/public or
+    the package files changed since the last deploy (use --force to rebuild).
+  - Every compressible asset gets .br and .gz siblings, written in parallel
+    across cores, which static_assets.serve_static sends to clients that
+    accept them.
+  - static/asset-hashes.json records the source fingerprint and the content
+    hash, size, precompressed encodings and immutability of every deployed
+    file; the Flask side uses it for cache headers and to pick siblings.
+  - Files are swapped in atomically: each is written to a temporary name and
+    renamed into place, and index.html (which references the new bundle) is
+    replaced last, so running workers never serve a half-copied bundle.
+    Hashed assets from the previous deploy are kept for clients that still
+    have the old shell open; older ones are pruned.
+
+Usage:
+    python build_and_deploy.py [--force] [--no-compress]
 """
+import argparse
+import gzip
+import hashlib
+import json
 import os
 import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from static_assets import HASHED_NAME
+
+try:
+    import brotli
+except ImportError:  # optional: gzip siblings only
+    brotli = None
+
+FRONTEND_DIR = 'frontend'
+BUILD_DIR = os.path.join(FRONTEND_DIR, 'build')
+STATIC_DIR = 'static'
+MANIFEST_NAME = 'asset-hashes.json'
+FINGERPRINT_INPUTS = ['src', 'public', 'package.json', 'package-lock.json']
+
+COMPRESSIBLE = ('.js', '.css', '.html', '.json', '.svg', '.txt', '.map', '.ico')
+COMPRESS_MIN_BYTES = 1024
+
+def source_fingerprint():
+    """sha256 over the paths and contents of everything the build reads"""
+    digest = hashlib.sha256()
+    for name in FINGERPRINT_INPUTS:
+        root = os.path.join(FRONTEND_DIR, name)
+        if os.path.isfile(root):
+            paths = [root]
+        else:
+            paths = []
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                paths.extend(os.path.join(dirpath, f) for f in sorted(filenames))
+        for path in paths:
+            digest.update(os.path.relpath(path, FRONTEND_DIR).replace(os.sep, '/').encode())
+            digest.update(b'\0')
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 16), b''):
+                    digest.update(block)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+def load_manifest():
+    try:
+        with open(os.path.join(STATIC_DIR, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
 def build_react_app():
     """Build the React application"""
     print("Building React app...")
-    os.chdir('frontend')
     try:
-        result = subprocess.run(['npm', 'run', 'build'], check=True, capture_output=True, text=True)
+        subprocess.run(['npm', 'run', 'build'], cwd=FRONTEND_DIR, check=True, capture_output=True, text=True)
         print("React app built successfully!")
         return True
     except subprocess.CalledProcessError as e:
         print(f"Error building React app: {e.stderr}")
         return False
-    finally:
-        os.chdir('..')
 
-def copy_build_to_static():
-    """Copy React build to Flask static folder"""
+def _atomic_write(path, data):
+    """Write ``data`` next to ``path`` and rename it into place"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _atomic_copy(src, dest):
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    tmp = f"{dest}.tmp-{os.getpid()}"
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dest)
+
+def process_asset(src, dest, compress=True):
+    """Copy one build file into place (plus .br/.gz siblings) and return its manifest entry.
+    Runs in a worker process."""
+    with open(src, 'rb') as f:
+        data = f.read()
+    entry = {
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'size': len(data),
+        'immutable': bool(HASHED_NAME.search(dest)),
+        'encodings': [],
+    }
+    if compress and dest.endswith(COMPRESSIBLE) and len(data) >= COMPRESS_MIN_BYTES:
+        variants = [('gzip', '.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.insert(0, ('br', '.br', brotli.compress(data, quality=11)))
+        for encoding, suffix, body in variants:
+            # Only worth keeping if it actually saves something
+            if len(body) < len(data):
+                _atomic_write(dest + suffix, body)
+                entry['encodings'].append(encoding)
+    _atomic_copy(src, dest)
+    return entry
+
+def _build_files():
+    """(source path, path relative to static/) for every file to deploy, except index.html"""
+    files = []
+    for dirpath, _dirnames, filenames in os.walk(BUILD_DIR):
+        for filename in filenames:
+            src = os.path.join(dirpath, filename)
+            rel = os.path.relpath(src, BUILD_DIR).replace(os.sep, '/')
+            if rel == 'index.html':
+                continue
+            # CRA emits build/static/js/main.<hash>.js referenced as /static/js/...
+            if rel.startswith('static/'):
+                rel = rel[len('static/'):]
+            files.append((src, rel))
+    return files
+
+def copy_build_to_static(fingerprint, compress=True):
+    """Deploy the build into static/ (see module docstring)"""
     print("Copying build files...")
-    build_dir = 'frontend/build'
-    static_dir = 'static'
-    
-    if not os.path.exists(build_dir):
-        print(f"Build directory {build_dir} does not exist!")
+    index_src = os.path.join(BUILD_DIR, 'index.html')
+    if not os.path.exists(index_src):
+        print(f"Build directory {BUILD_DIR} does not exist or has no index.html!")
         return False
-    
-    # Copy static files
-    if os.path.exists(os.path.join(build_dir, 'static')):
-        static_dest = os.path.join(static_dir, 'react')
-        if os.path.exists(static_dest):
-            shutil.rmtree(static_dest)
-        shutil.copytree(os.path.join(build_dir, 'static'), static_dest)
-        print(f"Copied static files to {static_dest}")
-    
-    # Copy index.html
-    if os.path.exists(os.path.join(build_dir, 'index.html')):
-        shutil.copy(
-            os.path.join(build_dir, 'index.html'),
-            os.path.join(static_dir, 'index.html')
-        )
-        print("Copied index.html to static folder")
-    
+    if compress and brotli is None:
+        print("⚠️ brotli is not installed; writing gzip siblings only")
+
+    started = time.monotonic()
+    files = _build_files()
+    with ProcessPoolExecutor() as pool:
+        futures = {
+            rel: pool.submit(process_asset, src, os.path.join(STATIC_DIR, rel), compress)
+            for src, rel in files
+        }
+        entries = {rel: future.result() for rel, future in futures.items()}
+    print(f"Copied {len(entries)} files in {time.monotonic() - started:.1f}s")
+
+    previous = load_manifest()
+    manifest = {
+        'source_fingerprint': fingerprint,
+        'deployed_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'files': entries,
+    }
+    _atomic_write(os.path.join(STATIC_DIR, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+    # The new shell goes in last: from here on clients load the new bundle
+    _atomic_copy(index_src, os.path.join(STATIC_DIR, 'index.html'))
+    print("Copied index.html to static folder")
+
+    if previous.get('files'):
+        prune_stale_assets(set(entries) | set(previous['files']))
     return True
 
-if __name__ == '__main__':
+def prune_stale_assets(keep):
+    """Remove hashed assets (and their siblings) that belong to neither the
+    current nor the previous deploy"""
+    removed = 0
+    for dirpath, _dirnames, filenames in os.walk(STATIC_DIR):
+        for filename in filenames:
+            base = filename[:-3] if filename.endswith(('.br', '.gz')) else filename
+            if not HASHED_NAME.search(base):
+                continue
+            path = os.path.join(dirpath, filename)
+            rel = os.path.relpath(os.path.join(dirpath, base), STATIC_DIR).replace(os.sep, '/')
+            if rel not in keep:
+                os.remove(path)
+                removed += 1
+    if removed:
+        print(f"🧹 Removed {removed} stale asset files")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the React frontend and deploy it into static/")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the sources did not change")
+    parser.add_argument('--no-compress', action='store_true', help="Skip the .br/.gz siblings")
+    args = parser.parse_args(argv)
+
     print("=" * 50)
     print("Building and deploying React frontend")
     print("=" * 50)
-    
-    if build_react_app():
-        if copy_build_to_static():
-            print("\n✅ Deployment completed successfully!")
-            print("\nYou can now run the Flask app and the React frontend will be served.")
-        else:
-            print("\n❌ Failed to copy build files")
-            sys.exit(1)
-    else:
+
+    fingerprint = source_fingerprint()
+    if (not args.force and load_manifest().get('source_fingerprint') == fingerprint
+            and os.path.exists(os.path.join(STATIC_DIR, 'index.html'))):
+        print("\n✅ Frontend sources unchanged since the last deploy; nothing to do (use --force to rebuild)")
+        return 0
+
+    if not build_react_app():
         print("\n❌ Failed to build React app")
-        sys.exit(1)
+        return 1
+    if not copy_build_to_static(fingerprint, compress=not args.no_compress):
+        print("\n❌ Failed to copy build files")
+        return 1
+    print("\n✅ Deployment completed successfully!")
+    print("\nYou can now run the Flask app and the React frontend will be served.")
+    return 0
 
+if __name__ == '__main__':
+    sys.exit(main())
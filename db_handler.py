@@ -3,42 +3,47 @@ from psycopg2 import sql
 import os
 from dotenv import load_dotenv
 import hashlib
+import io
+import base64
+import json
 import string
+import re
+import threading
+import time
+import random
+import secrets
+from array import array
+from collections import deque, OrderedDict
 
 load_dotenv()
 
-def get_connection():
-    """Get database connection using environment variables"""
-    try:
-        db_url = os.getenv("DB_URL") or os.getenv("DATABASE_URL")
+# Cache server-side prepared statements for the hot SELECTs on each pooled connection
+PREPARED_STATEMENTS_ENABLED = os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
 
-        if db_url:
-            print("\nDEBUG - Attempting database connection using DB_URL")
-            conn = psycopg2.connect(db_url)
-        else:
-            # Print connection parameters for debugging (excluding password)
-            print("\nDEBUG - Attempting database connection with:")
-            print(f"Host: {os.getenv('DB_HOST', 'localhost')}")
-            print(f"Database: {os.getenv('DB_NAME', 'mcq_db')}")
-            print(f"User: {os.getenv('DB_USER', 'postgres')}")
-            print(f"Port: {os.getenv('DB_PORT', '5432')}")
-            print(f"SSL Mode: {os.getenv('DB_SSLMODE', 'require')}")
-            
-            # Require DB_PASSWORD - no default fallback for security
-            db_password = os.getenv("DB_PASSWORD")
-            if not db_password:
-                raise ValueError("DB_PASSWORD environment variable is required")
-            
-            conn = psycopg2.connect(
-                host=os.getenv("DB_HOST", "localhost"),
-                dbname=os.getenv("DB_NAME", "mcq_db"),
-                user=os.getenv("DB_USER", "postgres"),
-                password=db_password,
-                port=os.getenv("DB_PORT", "5432"),
-                sslmode=os.getenv("DB_SSLMODE", "require")
-            )
-        print("✅ Database connection successful")
-        return conn
+def _connection_kwargs():
+    """Build psycopg2.connect() keyword arguments from environment variables"""
+    db_url = os.getenv("DB_URL") or os.getenv("DATABASE_URL")
+    if db_url:
+        return {'dsn': db_url}
+
+    # Require DB_PASSWORD - no default fallback for security
+    db_password = os.getenv("DB_PASSWORD")
+    if not db_password:
+        raise ValueError("DB_PASSWORD environment variable is required")
+
+    return {
+        'host': os.getenv("DB_HOST", "localhost"),
+        'dbname': os.getenv("DB_NAME", "mcq_db"),
+        'user': os.getenv("DB_USER", "postgres"),
+        'password': db_password,
+        'port': os.getenv("DB_PORT", "5432"),
+        'sslmode': os.getenv("DB_SSLMODE", "require"),
+    }
+
+def _open_connection():
+    """Open a new physical database connection (used by the connection pool)"""
+    try:
+        return psycopg2.connect(**_connection_kwargs())
     except psycopg2.Error as e:
         print(f"❌ Database connection error: {e}")
         # If database doesn't exist, try to create it
@@ -62,12 +67,318 @@ def get_connection():
                 conn.close()
                 print(f"✅ Created database {os.getenv('DB_NAME', 'mcq_db')}")
                 # Try connecting again
-                return get_connection()
+                return psycopg2.connect(**_connection_kwargs())
             except Exception as create_error:
                 print(f"❌ Error creating database: {create_error}")
                 raise
         raise
 
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no pooled connection becomes available within DB_POOL_TIMEOUT"""
+
+class _PoolEntry:
+    """A physical connection plus the bookkeeping the pool needs for it"""
+    __slots__ = ('conn', 'created_at', 'last_used', 'prepared')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # Names of server-side prepared statements that exist on this connection
+        self.prepared = set()
+
+class ConnectionPool:
+    """Thread-safe, per-process pool of psycopg2 connections.
+
+    Connections are validated on checkout when they have been idle for longer
+    than ``ping_after`` seconds and are recycled once they are older than
+    ``max_age`` seconds. The pool notices when it is used from a forked child
+    (e.g. gunicorn with --preload) and starts over with fresh connections.
+    """
+
+    def __init__(self, connect, max_size=10, max_age=1800, ping_after=30, timeout=10):
+        self._connect = connect
+        self.max_size = max_size
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._in_use = 0
+        self._pid = os.getpid()
+        # Connections inherited from a parent process. They are kept referenced
+        # (never closed) so their sockets are not torn down under the parent.
+        self._inherited = []
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'connections_recycled': 0,
+            'validation_failures': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            self._inherited.extend(self._idle)
+            self._idle.clear()
+            self._in_use = 0
+            self._pid = os.getpid()
+
+    def acquire(self):
+        """Check out a connection, waiting up to ``timeout`` seconds for one"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    # LIFO keeps the hottest connections busy and lets extras age out
+                    entry = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self.timeout}s "
+                        f"(DB_POOL_MAX_SIZE={self.max_size})"
+                    )
+                if not waited:
+                    waited = True
+                    self._stats['waits'] += 1
+                self._cond.wait(remaining)
+            # Reserve the slot before doing any network I/O outside the lock
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            wait_time = time.monotonic() - started
+            self._stats['wait_time_total'] += wait_time
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        try:
+            return self._prepare_checkout(entry)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def _prepare_checkout(self, entry):
+        now = time.monotonic()
+        if entry is not None and now - entry.created_at > self.max_age:
+            self._discard(entry)
+            self._count('connections_recycled')
+            entry = None
+        if entry is not None and (entry.conn.closed or now - entry.last_used > self.ping_after):
+            if not self._is_alive(entry.conn):
+                self._discard(entry)
+                self._count('validation_failures')
+                entry = None
+        if entry is None:
+            entry = _PoolEntry(self._connect())
+            self._count('connections_opened')
+        return entry
+
+    @staticmethod
+    def _is_alive(conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def release(self, entry):
+        """Return a connection to the pool, resetting any leftover session state"""
+        keep = os.getpid() == self._pid and not entry.conn.closed
+        if keep:
+            try:
+                if entry.conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    entry.conn.rollback()
+                if entry.conn.autocommit:
+                    entry.conn.autocommit = False
+            except psycopg2.Error:
+                keep = False
+        entry.last_used = time.monotonic()
+        with self._cond:
+            if os.getpid() != self._pid:
+                # Checked out before a fork; the slot belongs to the parent
+                self._inherited.append(entry)
+                return
+            self._in_use -= 1
+            if keep:
+                self._idle.append(entry)
+            self._cond.notify()
+        if not keep:
+            self._discard(entry)
+
+    def _discard(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+        self._count('connections_closed')
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones are closed on release)"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for entry in idle:
+            self._discard(entry)
+
+    def stats(self):
+        """Snapshot of pool counters, useful for sizing against max_connections"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pid': self._pid,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'wait_time_avg': (
+                    stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+                ),
+            })
+        return stats
+
+class PooledConnection:
+    """Proxy handed out by get_connection().
+
+    Behaves like a psycopg2 connection. Used as a context manager it commits
+    (or rolls back on error) like psycopg2 does, and then returns the
+    underlying connection to the pool instead of leaving it open.
+    """
+    __slots__ = ('_pool', '_entry')
+
+    def __init__(self, pool, entry):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_entry', entry)
+
+    @property
+    def raw(self):
+        return self._entry.conn
+
+    def __getattr__(self, name):
+        entry = self._entry
+        if entry is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(entry.conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.raw, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self.raw.closed:
+                if exc_type is None:
+                    self.raw.commit()
+                else:
+                    self.raw.rollback()
+        finally:
+            self.close()
+        return False
+
+    def close(self):
+        """Return the connection to the pool (idempotent)"""
+        entry = self._entry
+        if entry is not None:
+            object.__setattr__(self, '_entry', None)
+            self._pool.release(entry)
+
+    def execute_prepared(self, cur, name, query, params=()):
+        """Execute ``query`` through a per-connection server-side prepared statement.
+
+        ``query`` uses the usual %s placeholders. The statement is PREPAREd the
+        first time ``name`` is seen on this connection and EXECUTEd afterwards,
+        so Postgres skips parsing and planning on the hot path. Falls back to a
+        plain execute when DB_PREPARED_STATEMENTS is disabled.
+        """
+        if isinstance(query, sql.Composable):
+            query = query.as_string(cur)
+        if not PREPARED_STATEMENTS_ENABLED:
+            cur.execute(query, params)
+            return
+        entry = self._entry
+        if name not in entry.prepared:
+            counter = iter(range(1, len(params) + 1))
+            server_query = re.sub(r'%s', lambda _m: f"${next(counter)}", query)
+            cur.execute(
+                sql.SQL("PREPARE {} AS ").format(sql.Identifier(name)).as_string(cur)
+                + server_query.replace('%%', '%')
+            )
+            entry.prepared.add(name)
+        if params:
+            placeholders = ', '.join(['%s'] * len(params))
+            cur.execute(
+                sql.SQL("EXECUTE {} ").format(sql.Identifier(name)).as_string(cur) + f"({placeholders})",
+                params
+            )
+        else:
+            cur.execute(sql.SQL("EXECUTE {}").format(sql.Identifier(name)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the per-process connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                db_url = os.getenv("DB_URL") or os.getenv("DATABASE_URL")
+                if db_url:
+                    print("\nDEBUG - Creating database connection pool using DB_URL")
+                else:
+                    # Print connection parameters for debugging (excluding password)
+                    print("\nDEBUG - Creating database connection pool with:")
+                    print(f"Host: {os.getenv('DB_HOST', 'localhost')}")
+                    print(f"Database: {os.getenv('DB_NAME', 'mcq_db')}")
+                    print(f"User: {os.getenv('DB_USER', 'postgres')}")
+                    print(f"Port: {os.getenv('DB_PORT', '5432')}")
+                    print(f"SSL Mode: {os.getenv('DB_SSLMODE', 'require')}")
+                _pool = ConnectionPool(
+                    _open_connection,
+                    max_size=int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+                    max_age=float(os.getenv('DB_POOL_MAX_AGE', 1800)),
+                    ping_after=float(os.getenv('DB_POOL_PING_AFTER', 30)),
+                    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+                )
+                print(f"✅ Database pool ready (max {_pool.max_size} connections per process)")
+    return _pool
+
+def get_connection():
+    """Check out a pooled database connection.
+
+    Use it as ``with get_connection() as conn:`` - the transaction is committed
+    (or rolled back on error) and the connection goes back to the pool on exit.
+    """
+    pool = get_pool()
+    return PooledConnection(pool, pool.acquire())
+
+def connect_unpooled():
+    """A standalone connection outside the pool, for long-lived sessions (e.g. LISTEN)"""
+    return psycopg2.connect(**_connection_kwargs())
+
+def get_pool_stats():
+    """Connection pool statistics for this worker process"""
+    return get_pool().stats()
+
 def normalize_question(question):
     """Normalize question text to prevent duplicates while preserving content"""
     if not question:
@@ -98,179 +409,410 @@ def normalize_question(question):
     # Return MD5 hash of the cleaned question
     return hashlib.md5(cleaned.encode()).hexdigest()
 
-def initialize_database():
-    """Initialize the database and create necessary tables - MINIMAL VERSION"""
+VALID_SUBJECTS = ('Surgery', 'Medicine', 'Gynae', 'Paeds')
+
+MONTH_NAMES = (
+    'january', 'february', 'march', 'april', 'may', 'june',
+    'july', 'august', 'september', 'october', 'november', 'december'
+)
+
+# Old per-month table names, e.g. march25_mcqs -> (2025, 3)
+LEGACY_TABLE_PATTERN = re.compile(r'^(' + '|'.join(MONTH_NAMES) + r')(\d{2})_mcqs$')
+
+# MCQs that cannot be dated from their source file used to land in march25_mcqs
+DEFAULT_EXAM_YEAR, DEFAULT_EXAM_MONTH = 2025, 3
+
+# Sort question numbers like '12', '12a', 'Q3' numerically where possible.
+# question_sort_key is a stored generated column (migration 0003), so this
+# ordering is served by mcqs_exam_sort_idx instead of a sort.
+QUESTION_ORDER_SQL = "question_sort_key, question_number"
+
+# Subject-wise order across months, made total (NULL-safe, id tie-break) so
+# keyset pages line up exactly with the full list. mcqs_subject_keyset_idx
+# (migration 0014) indexes exactly these expressions; keep the two in sync.
+SUBJECT_ORDER_COLUMNS_SQL = "exam_year, exam_month, question_sort_key, COALESCE(question_number, ''), id"
+
+MCQ_COLUMNS_SQL = """
+    id,
+    question_number,
+    question_text,
+    option_a,
+    option_b,
+    option_c,
+    option_d,
+    correct_answer,
+    subject,
+    explanation
+"""
+
+def parse_month(month):
+    """Return the month number (1-12) for a month name, or None"""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Create users table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        username VARCHAR(50) UNIQUE NOT NULL,
-                        email VARCHAR(100) UNIQUE NOT NULL,
-                        password_hash VARCHAR(255) NOT NULL,
-                        is_verified BOOLEAN DEFAULT TRUE,
-                        google_id VARCHAR(64) UNIQUE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                print("✅ Users table ready")
+        return MONTH_NAMES.index(str(month).strip().lower()) + 1
+    except ValueError:
+        return None
 
-                # Create medical_subject enum type if it doesn't exist
-                cur.execute("""
-                    DO $$ 
-                    BEGIN
-                        IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'medical_subject') THEN
-                            CREATE TYPE medical_subject AS ENUM ('Surgery', 'Medicine', 'Gynae', 'Paeds');
-                        END IF;
-                    END $$;
-                """)
-                print("✅ Medical subject enum type ready")
+def legacy_table_exam_month(table_name):
+    """Map a legacy month table name (e.g. 'march25_mcqs') to (year, month), or None"""
+    match = LEGACY_TABLE_PATTERN.match(table_name or '')
+    if not match:
+        return None
+    return 2000 + int(match.group(2)), MONTH_NAMES.index(match.group(1)) + 1
 
-                # Create march25_mcqs table (the main table)
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS march25_mcqs (
-                        id SERIAL PRIMARY KEY,
-                        question_number VARCHAR(20),
-                        question_text TEXT NOT NULL,
-                        normalized_question VARCHAR(32) UNIQUE,
-                        option_a TEXT,
-                        option_b TEXT,
-                        option_c TEXT,
-                        option_d TEXT,
-                        correct_answer CHAR(1) NOT NULL,
-                        explanation TEXT,
-                        subject medical_subject NOT NULL,
-                        source_file VARCHAR(100),
-                        exam_date DATE,
-                        appearance_count INTEGER DEFAULT 1,
-                        last_appearance DATE DEFAULT CURRENT_DATE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                print("✅ march25_mcqs table ready")
+def clean_text(text):
+    """Replace literal '\\n' sequences and collapse whitespace"""
+    if text:
+        # Replace literal '\n' string with actual newline
+        text = text.replace('\\n', '\n')
+        # Replace newlines and multiple spaces with single space
+        text = ' '.join(text.split())
+    return text
 
-                print("✅ Minimal database setup completed (users + march25_mcqs only)")
+def _row_to_mcq(row):
+    """Convert a row selected with MCQ_COLUMNS_SQL into the API dict shape"""
+    options = {}
+    if row[3]: options['A'] = row[3]
+    if row[4]: options['B'] = row[4]
+    if row[5]: options['C'] = row[5]
+    if row[6]: options['D'] = row[6]
+    return {
+        'id': row[0],
+        'question_number': row[1],
+        'question_text': row[2],
+        'options': options,
+        'correct_answer': row[7],
+        'subject': row[8],
+        'explanation': row[9]
+    }
 
+def initialize_database():
+    """Create or upgrade the database schema by applying pending migrations"""
+    from migrations import run_migrations
+    try:
+        run_migrations()
     except Exception as e:
         print(f"Error initializing database: {e}")
         raise
 
+# Partitions known to exist in this process, so DDL only runs once per month.
+# Only committed partitions go in here (see partitions_committed()): a pair
+# recorded inside a transaction that later rolls back would skip the DDL forever.
+_known_partitions = set()
+
+def ensure_mcq_partition(cur, year, month):
+    """Create the mcqs partitions for an exam year/month if they don't exist yet.
+
+    Returns the (year, month) pair; hand it to partitions_committed() once the
+    transaction has committed so later calls skip the DDL."""
+    year, month = int(year), int(month)
+    if (year, month) in _known_partitions:
+        return year, month
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid exam month: {month}")
+    # Serialize partition DDL across workers and ingestion jobs
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext('mcqs_partitions'))")
+    year_table = f"mcqs_{year}"
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {year_table}
+        PARTITION OF mcqs FOR VALUES IN ({year})
+        PARTITION BY LIST (exam_month)
+    """).format(year_table=sql.Identifier(year_table), year=sql.Literal(year)))
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {month_table}
+        PARTITION OF {year_table} FOR VALUES IN ({month})
+    """).format(
+        month_table=sql.Identifier(f"{year_table}_{month:02d}"),
+        year_table=sql.Identifier(year_table),
+        month=sql.Literal(month)
+    ))
+    return year, month
+
+def partitions_committed(*partitions):
+    """Remember (year, month) partitions whose creating transaction has committed"""
+    _known_partitions.update((int(year), int(month)) for year, month in partitions)
+
+def exam_month_from_source(source_file):
+    """Parse (exam_date, year, month) from a 'Month YYYY.pdf' source file name"""
+    if source_file:
+        try:
+            from datetime import datetime
+            filename = os.path.basename(source_file).replace('.pdf', '')
+            exam_date = datetime.strptime(filename, '%B %Y').date()
+            return exam_date, exam_date.year, exam_date.month
+        except ValueError:
+            print(f"⚠️ Could not parse exam date from filename: {source_file}")
+    return None, DEFAULT_EXAM_YEAR, DEFAULT_EXAM_MONTH
+
 def insert_mcq(mcq, source_file=None):
-    """Insert a single MCQ into the database"""
+    """Insert a single MCQ into the question store"""
     try:
-        # Clean up the text by replacing \n with spaces and removing multiple spaces
-        def clean_text(text):
-            if text:
-                # Replace literal '\n' string with actual newline
-                text = text.replace('\\n', '\n')
-                # Replace newlines and multiple spaces with single space
-                text = ' '.join(text.split())
-            return text
-        
-        normalized = normalize_question(clean_text(mcq['question_text']))
-        
-        # Get options with explicit None for null values and clean them
-        options = mcq['options']
-        option_a = clean_text(options.get('A')) if options.get('A') != 'null' else None
-        option_b = clean_text(options.get('B')) if options.get('B') != 'null' else None
-        option_c = clean_text(options.get('C')) if options.get('C') != 'null' else None
-        option_d = clean_text(options.get('D')) if options.get('D') != 'null' else None
-        
-        # Clean question text
-        question_text = clean_text(mcq['question_text'])
-        
-        # Handle unknown subject by defaulting to Medicine
-        subject = mcq.get('subject')
-        if subject not in ('Surgery', 'Medicine', 'Gynae', 'Paeds'):
-            print(f"⚠️ Unknown subject '{subject}' for MCQ {mcq['question_number']}, defaulting to Medicine")
-            subject = 'Medicine'
-        
-        # Extract exam date from source file if possible (format: Month YYYY.pdf)
-        exam_date = None
-        if source_file:
-            try:
-                from datetime import datetime
-                filename = source_file.replace('.pdf', '')
-                exam_date = datetime.strptime(filename, '%B %Y').date()
-            except:
-                print(f"⚠️ Could not parse exam date from filename: {source_file}")
-        
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Try to insert or update the MCQ
-                cur.execute(
-                    """
-                    INSERT INTO march25_mcqs (
-                        question_number, question_text, normalized_question,
-                        option_a, option_b, option_c, option_d,
-                        correct_answer, explanation, subject, source_file, exam_date
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (normalized_question) 
-                    DO UPDATE SET
-                        appearance_count = march25_mcqs.appearance_count + 1,
-                        last_appearance = CURRENT_DATE,
-                        explanation = EXCLUDED.explanation
-                    RETURNING id, appearance_count;
-                    """,
-                    (
-                        mcq['question_number'],
-                        question_text,
-                        normalized,
-                        option_a,
-                        option_b,
-                        option_c,
-                        option_d,
-                        mcq['correct_answer'],
-                        mcq.get('explanation'),
-                        subject,
-                        source_file,
-                        exam_date
-                    )
-                )
-                mcq_id, count = cur.fetchone()
-                
-            conn.commit()
-        print(f"✅ {'Updated' if count > 1 else 'Inserted'} MCQ {mcq['question_number']} (ID: {mcq_id}, Appearances: {count})")
-        return mcq_id
+        report = bulk_load_mcqs([mcq], source_file, validate=False)[0]
+        if report['status'] == 'error':
+            raise ValueError(report['reason'])
+        print(f"✅ {'Updated' if report['status'] == 'updated' else 'Inserted'} MCQ {mcq['question_number']} (ID: {report['id']}, Appearances: {report['appearance_count']})")
+        return report['id']
     except Exception as e:
-        print(f"❌ Error inserting MCQ {mcq['question_number']}: {e}")
+        print(f"❌ Error inserting MCQ {mcq.get('question_number', 'Unknown')}: {e}")
         return None
 
-def batch_insert_mcqs(mcqs, source_file=None):
-    """Insert multiple MCQs in a batch with detailed verification"""
-    successful = 0
-    failed = 0
-    failed_mcqs = []
-    
-    print(f"\n💾 Starting batch insert of {len(mcqs)} MCQs...")
-    
-    for i, mcq in enumerate(mcqs, 1):
+# Column order of the COPY staging table used by bulk_load_mcqs()
+_STAGING_COLUMNS = [
+    'row_no', 'exam_year', 'exam_month', 'question_number', 'question_text',
+    'normalized_question', 'option_a', 'option_b', 'option_c', 'option_d',
+    'correct_answer', 'explanation', 'subject', 'source_file', 'exam_date',
+    'occurrences'
+]
+
+def _normalize_mcq_row(mcq, exam_date, exam_year, exam_month, source_file):
+    """Clean one MCQ dict into mcqs column values (no database access)"""
+    options = mcq['options']
+
+    def option(letter):
+        value = options.get(letter)
+        return clean_text(value) if value != 'null' else None
+
+    question_text = clean_text(mcq['question_text'])
+    # Handle unknown subject by defaulting to Medicine
+    subject = mcq.get('subject')
+    if subject not in VALID_SUBJECTS:
+        print(f"⚠️ Unknown subject '{subject}' for MCQ {mcq.get('question_number')}, defaulting to Medicine")
+        subject = 'Medicine'
+    return {
+        'exam_year': exam_year,
+        'exam_month': exam_month,
+        'question_number': mcq.get('question_number'),
+        'question_text': question_text,
+        'normalized_question': normalize_question(question_text),
+        'option_a': option('A'),
+        'option_b': option('B'),
+        'option_c': option('C'),
+        'option_d': option('D'),
+        'correct_answer': mcq['correct_answer'],
+        'explanation': mcq.get('explanation'),
+        'subject': subject,
+        'source_file': source_file,
+        'exam_date': exam_date,
+    }
+
+def _copy_value(value):
+    """Encode one value for COPY ... FROM STDIN in text format"""
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+def bulk_load_mcqs(mcqs, source_file=None, conn=None, validate=True, known_keys=None):
+    """Validate, normalize and upsert a whole batch of MCQs in one transaction.
+
+    The batch is staged with COPY into a temp table and merged into mcqs with
+    a single INSERT ... ON CONFLICT on normalized_question, keeping the
+    appearance_count / last_appearance semantics of inserting the MCQs one by
+    one. Rows are keyed per exam month, so appearance_count counts how often a
+    question was loaded for its own month (re-ingests of that paper); repeats
+    across months are separate rows sharing normalized_question, and consumers
+    that want the overall picture aggregate over them (see
+    get_mcq_statistics() and near_duplicates). Pass ``conn`` to join the caller's transaction (the caller commits,
+    and database errors are raised instead of reported); the caller then also
+    calls partitions_committed() for the source's exam month after committing.
+
+    ``known_keys`` is a set of normalized_question values this source has
+    already been counted for (e.g. a re-ingested page); those rows refresh
+    their content without incrementing appearance_count again.
+
+    Returns one report dict per input MCQ, in order, with ``status`` set to
+    'inserted', 'updated', 'merged' (repeat of an earlier MCQ in the same
+    batch), 'invalid' or 'error', plus ``id``, ``normalized_question``,
+    ``appearance_count`` and ``reason`` where they apply.
+    """
+    reports = [
+        {'index': i, 'question_number': mcq.get('question_number') if isinstance(mcq, dict) else None,
+         'status': None, 'id': None, 'normalized_question': None, 'appearance_count': None, 'reason': None}
+        for i, mcq in enumerate(mcqs)
+    ]
+    if not mcqs:
+        return reports
+
+    # Extract exam date from source file if possible (format: Month YYYY.pdf)
+    exam_date, exam_year, exam_month = exam_month_from_source(source_file)
+
+    # Validate and normalize in memory; repeats within the batch collapse onto
+    # the first occurrence, like sequential inserts would have
+    staged = {}  # (exam_year, exam_month, normalized_question) -> row dict
+    members = {}  # same key -> indexes of every MCQ that maps onto it
+    for i, mcq in enumerate(mcqs):
         try:
-            # Validate MCQ data before insertion
-            if not validate_mcq_data(mcq):
-                print(f"❌ [{i}/{len(mcqs)}] Invalid MCQ data for Q{mcq.get('question_number', 'Unknown')}")
-                failed += 1
-                failed_mcqs.append(f"Q{mcq.get('question_number', 'Unknown')}: Invalid data")
+            reason = _mcq_validation_error(mcq) if validate else None
+            if reason:
+                reports[i].update(status='invalid', reason=reason)
                 continue
-            
-            mcq_id = insert_mcq(mcq, source_file)
-            if mcq_id:
-                successful += 1
-                print(f"✅ [{i}/{len(mcqs)}] Saved Q{mcq['question_number']} (ID: {mcq_id})")
-            else:
-                failed += 1
-                failed_mcqs.append(f"Q{mcq['question_number']}: Insert failed")
-                print(f"❌ [{i}/{len(mcqs)}] Failed to save Q{mcq['question_number']}")
-                
+            row = _normalize_mcq_row(mcq, exam_date, exam_year, exam_month, source_file)
         except Exception as e:
-            print(f"❌ [{i}/{len(mcqs)}] Error saving Q{mcq.get('question_number', 'Unknown')}: {e}")
-            failed += 1
-            failed_mcqs.append(f"Q{mcq.get('question_number', 'Unknown')}: {str(e)}")
+            reports[i].update(status='error', reason=str(e))
+            continue
+        key = (row['exam_year'], row['exam_month'], row['normalized_question'])
+        if key in staged:
+            staged[key]['occurrences'] += 1
+            # Later repeats overwrite the explanation, as the per-row upsert did
+            staged[key]['explanation'] = row['explanation']
+            members[key].append(i)
+        else:
+            row['row_no'] = i
+            row['occurrences'] = 1
+            staged[key] = row
+            members[key] = [i]
+
+    if not staged:
+        return reports
+
+    known_keys = known_keys or set()
+    for key, row in staged.items():
+        if row['normalized_question'] in known_keys:
+            row['occurrences'] = 0
+
+    buffer = io.StringIO()
+    for row in staged.values():
+        buffer.write('\t'.join(_copy_value(row[c]) for c in _STAGING_COLUMNS))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    own_connection = conn is None
+    if own_connection:
+        conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            partitions = [
+                ensure_mcq_partition(cur, *partition)
+                for partition in {(row['exam_year'], row['exam_month']) for row in staged.values()}
+            ]
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS mcq_staging (
+                    row_no INTEGER PRIMARY KEY,
+                    exam_year SMALLINT,
+                    exam_month SMALLINT,
+                    question_number VARCHAR(20),
+                    question_text TEXT,
+                    normalized_question VARCHAR(32),
+                    option_a TEXT,
+                    option_b TEXT,
+                    option_c TEXT,
+                    option_d TEXT,
+                    correct_answer CHAR(1),
+                    explanation TEXT,
+                    subject TEXT,
+                    source_file VARCHAR(100),
+                    exam_date DATE,
+                    occurrences INTEGER
+                ) ON COMMIT DELETE ROWS
+            """)
+            cur.execute("TRUNCATE mcq_staging")
+            cur.copy_expert(
+                f"COPY mcq_staging ({', '.join(_STAGING_COLUMNS)}) FROM STDIN",
+                buffer
+            )
+            # Which staged rows already exist decides inserted vs updated
+            cur.execute("""
+                SELECT s.row_no
+                FROM mcq_staging s
+                JOIN mcqs m
+                  ON m.exam_year = s.exam_year
+                 AND m.exam_month = s.exam_month
+                 AND m.normalized_question = s.normalized_question
+            """)
+            existing = {row[0] for row in cur.fetchall()}
+            cur.execute("""
+                INSERT INTO mcqs (
+                    exam_year, exam_month,
+                    question_number, question_text, normalized_question,
+                    option_a, option_b, option_c, option_d,
+                    correct_answer, explanation, subject, source_file, exam_date,
+                    appearance_count
+                )
+                SELECT
+                    exam_year, exam_month,
+                    question_number, question_text, normalized_question,
+                    option_a, option_b, option_c, option_d,
+                    correct_answer, explanation, subject::medical_subject, source_file, exam_date,
+                    occurrences
+                FROM mcq_staging
+                ORDER BY row_no
+                ON CONFLICT (exam_year, exam_month, normalized_question)
+                DO UPDATE SET
+                    appearance_count = mcqs.appearance_count + EXCLUDED.appearance_count,
+                    last_appearance = CURRENT_DATE,
+                    explanation = EXCLUDED.explanation
+                RETURNING exam_year, exam_month, normalized_question, id, appearance_count
+            """)
+            results = {(r[0], r[1], r[2]): (r[3], r[4]) for r in cur.fetchall()}
+            if any(count == 0 for _id, count in results.values()):
+                # Already-counted MCQs that had been removed come back with one appearance
+                cur.execute("""
+                    UPDATE mcqs m SET appearance_count = 1
+                    FROM mcq_staging s
+                    WHERE m.exam_year = s.exam_year
+                      AND m.exam_month = s.exam_month
+                      AND m.normalized_question = s.normalized_question
+                      AND m.appearance_count = 0
+                """)
+                results = {key: (mcq_id, max(count, 1)) for key, (mcq_id, count) in results.items()}
+            if results:
+                bump_bank_version(cur)
+        if own_connection:
+            conn.commit()
+            partitions_committed(*partitions)
+    except Exception as e:
+        if not own_connection:
+            raise
+        conn.rollback()
+        print(f"❌ Bulk load of {len(staged)} MCQs failed: {e}")
+        for indexes in members.values():
+            for i in indexes:
+                reports[i].update(status='error', reason=str(e))
+        return reports
+    finally:
+        if own_connection:
+            conn.close()
+
+    for key, indexes in members.items():
+        mcq_id, count = results[key]
+        first, repeats = indexes[0], indexes[1:]
+        reports[first].update(
+            status='updated' if staged[key]['row_no'] in existing else 'inserted',
+            id=mcq_id, normalized_question=key[2], appearance_count=count
+        )
+        for i in repeats:
+            reports[i].update(status='merged', id=mcq_id, normalized_question=key[2], appearance_count=count)
+
+    if own_connection:
+        invalidate_question_bank_cache()
+    return reports
+
+def batch_insert_mcqs(mcqs, source_file=None):
+    """Insert multiple MCQs in one bulk transaction and print a summary.
+
+    Returns (successful, failed) like before; use bulk_load_mcqs() directly
+    for the per-row outcome report."""
+    print(f"\n💾 Starting batch insert of {len(mcqs)} MCQs...")
+    started = time.monotonic()
+    reports = bulk_load_mcqs(mcqs, source_file)
+    elapsed = time.monotonic() - started
+
+    counts = {}
+    for report in reports:
+        counts[report['status']] = counts.get(report['status'], 0) + 1
+    failed_mcqs = [
+        f"Q{r['question_number'] or 'Unknown'}: {r['reason']}"
+        for r in reports if r['status'] in ('invalid', 'error')
+    ]
+    successful = len(reports) - len(failed_mcqs)
+    failed = len(failed_mcqs)
     
-    print(f"\n📊 Batch Insert Summary:")
-    print(f"✅ Successfully inserted/updated: {successful}")
+    print(f"\n📊 Batch Insert Summary ({elapsed:.2f}s):")
+    print(f"✅ Successfully inserted/updated: {successful} "
+          f"(inserted {counts.get('inserted', 0)}, updated {counts.get('updated', 0)}, "
+          f"repeated in batch {counts.get('merged', 0)})")
     print(f"❌ Failed: {failed}")
     
     if failed_mcqs:
@@ -282,163 +824,412 @@ def batch_insert_mcqs(mcqs, source_file=None):
     
     return successful, failed
 
-def validate_mcq_data(mcq):
-    """Validate MCQ data before insertion"""
+def _mcq_validation_error(mcq):
+    """Return why an MCQ is invalid, or None if it can be inserted"""
+    if not isinstance(mcq, dict):
+        return "Not an MCQ dict"
+
     required_fields = ['question_text', 'correct_answer', 'options']
     
     # Check required fields
     for field in required_fields:
         if field not in mcq or not mcq[field]:
-            print(f"⚠️ Missing required field: {field}")
-            return False
+            return f"Missing required field: {field}"
     
     # Check question text
     if len(mcq['question_text'].strip()) < 10:
-        print(f"⚠️ Question text too short: {len(mcq['question_text'])} chars")
-        return False
+        return f"Question text too short: {len(mcq['question_text'])} chars"
     
     # Check correct answer
     if mcq['correct_answer'] not in mcq['options']:
-        print(f"⚠️ Correct answer '{mcq['correct_answer']}' not in options")
-        return False
+        return f"Correct answer '{mcq['correct_answer']}' not in options"
     
     # Check options
     valid_options = ['A', 'B', 'C', 'D']
     for opt in valid_options:
         if opt in mcq['options'] and mcq['options'][opt]:
             if len(mcq['options'][opt].strip()) < 2:
-                print(f"⚠️ Option {opt} too short")
-                return False
+                return f"Option {opt} too short"
     
+    return None
+
+def validate_mcq_data(mcq):
+    """Validate MCQ data before insertion"""
+    reason = _mcq_validation_error(mcq)
+    if reason:
+        print(f"⚠️ {reason}")
+        return False
     return True
 
+class QuestionBankCache:
+    """Bounded in-process cache for question-bank lists.
+
+    Entries expire after ``ttl`` seconds and the least recently used ones are
+    evicted once the estimated size of all entries exceeds ``max_bytes``.
+    Cached lists are shared between requests, so callers must not mutate them.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._size = 0
+        self._lock = threading.Lock()
+        # One loader per key at a time, so a cold key doesn't stampede the database
+        self._load_locks = {}
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'loads': 0}
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            value, size, expires_at = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value, size=None):
+        if not self.enabled:
+            return
+        size = _estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss"""
+        if not self.enabled:
+            return loader()
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            # Another thread may have loaded it while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and time.monotonic() < entry[2]:
+                    return entry[0]
+            value = loader()
+            with self._lock:
+                self._stats['loads'] += 1
+            self.put(key, value)
+            return value
+
+    def _remove(self, key):
+        _value, size, _expires_at = self._entries.pop(key)
+        self._size -= size
+
+    def invalidate(self, key=None):
+        """Drop one entry, or everything when ``key`` is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._size = 0
+            elif key in self._entries:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+            })
+        return stats
+
+def _estimate_size(value):
+    """Rough memory footprint of a list of MCQ dicts (strings dominate)"""
+    if isinstance(value, str):
+        return 49 + len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return 33 + len(value)
+    if isinstance(value, dict):
+        return 232 + sum(50 + _estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(8 + _estimate_size(v) for v in value)
+    if isinstance(value, array):
+        return 64 + len(value) * value.itemsize
+    return 28
+
+_bank_cache = QuestionBankCache(
+    max_bytes=int(float(os.getenv('MCQ_CACHE_MAX_MB', 64)) * 1024 * 1024),
+    ttl=float(os.getenv('MCQ_CACHE_TTL', 600)),
+)
+
+def get_cache_stats():
+    """Question-bank cache counters for this worker process"""
+    return _bank_cache.stats()
+
+def invalidate_question_bank_cache():
+    """Forget cached banks in this process (other workers catch up after MCQ_CACHE_TTL)"""
+    _bank_cache.invalidate()
+
+# How often each worker re-reads question_bank_version (seconds)
+BANK_VERSION_CHECK_INTERVAL = float(os.getenv('MCQ_BANK_VERSION_INTERVAL', 5))
+_bank_version = {'version': None, 'checked_at': 0.0}
+_bank_version_lock = threading.Lock()
+
+def bump_bank_version(cur):
+    """Record that the question banks changed; call inside the writing transaction"""
+    cur.execute("UPDATE question_bank_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP")
+
+def current_bank_version():
+    """Version of the question banks (bumped on every ingest/edit).
+
+    Re-read at most every MCQ_BANK_VERSION_INTERVAL seconds per worker. When it
+    moves, this worker's cached banks are dropped, so edits made by other
+    processes show up without waiting for MCQ_CACHE_TTL.
+    """
+    with _bank_version_lock:
+        if time.monotonic() - _bank_version['checked_at'] < BANK_VERSION_CHECK_INTERVAL \
+                and _bank_version['version'] is not None:
+            return _bank_version['version']
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            conn.execute_prepared(cur, "bank_version", "SELECT version FROM question_bank_version", ())
+            row = cur.fetchone()
+    version = row[0] if row else 0
+    with _bank_version_lock:
+        previous = _bank_version['version']
+        _bank_version.update(version=version, checked_at=time.monotonic())
+    if previous is not None and previous != version:
+        _bank_cache.invalidate()
+    return version
+
+def cached_result(key, loader):
+    """Cache a value derived from the question banks alongside them.
+    It shares their TTL, size budget and invalidation on ingest."""
+    return _bank_cache.get_or_load(key, loader)
+
+def warm_question_bank_cache():
+    """Load the subject banks into the cache; run at worker boot"""
+    started = time.monotonic()
+    for subject in VALID_SUBJECTS:
+        try:
+            get_mcqs_by_subject(subject)
+        except Exception as e:
+            print(f"⚠️ Could not warm cache for {subject}: {e}")
+    print(f"✅ Question bank cache warmed in {time.monotonic() - started:.2f}s: {get_cache_stats()}")
+
+def _load_mcqs_by_subject(subject):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # STRICT filtering: WHERE subject = %s ensures only exact matches
+            query = f"""
+                SELECT {MCQ_COLUMNS_SQL}
+                FROM mcqs
+                WHERE subject = %s
+                ORDER BY {SUBJECT_ORDER_COLUMNS_SQL}
+            """
+            conn.execute_prepared(cur, "mcqs_by_subject", query, (subject,))
+            rows = cur.fetchall()
+
+    # Build unified MCQ list with sequential display_number across all months
+    mcqs = []
+    for row in rows:
+        # Final check: verify subject matches (row[8] is the subject column)
+        if row[8] != subject:
+            print(f"⚠️ ERROR: MCQ {row[0]} has subject '{row[8]}' but expected '{subject}'. Skipping.")
+            continue
+        mcq = _row_to_mcq(row)
+        del mcq['question_number']
+        mcq['display_number'] = len(mcqs) + 1
+        # Keep the historical API shape for subject-wise practice
+        mcq['source_file'] = None
+        mcq['exam_date'] = None
+        mcqs.append(mcq)
+
+    print(f"✅ Loaded {len(mcqs)} MCQs for subject '{subject}' from the database")
+    return mcqs
+
+def iter_mcqs_by_subject(subject, chunk_size=500):
+    """Yield a subject bank in lists of up to ``chunk_size`` MCQs, in the same
+    order and shape as get_mcqs_by_subject(), reading from a server-side cursor
+    so memory stays bounded however large the bank is."""
+    if subject not in VALID_SUBJECTS:
+        raise ValueError(f"Invalid subject '{subject}'")
+    display_number = 0
+    with get_connection() as conn:
+        with conn.cursor(name='stream_mcqs_by_subject') as cur:
+            cur.itersize = chunk_size
+            cur.execute(f"""
+                SELECT {MCQ_COLUMNS_SQL}
+                FROM mcqs
+                WHERE subject = %s
+                ORDER BY {SUBJECT_ORDER_COLUMNS_SQL}
+            """, (subject,))
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    return
+                chunk = []
+                for row in rows:
+                    mcq = _row_to_mcq(row)
+                    del mcq['question_number']
+                    display_number += 1
+                    mcq['display_number'] = display_number
+                    mcq['source_file'] = None
+                    mcq['exam_date'] = None
+                    chunk.append(mcq)
+                yield chunk
+
 def get_mcqs_by_subject(subject):
-    """Retrieve MCQs for a specific subject from ALL month tables (e.g., january25_mcqs ... december25_mcqs).
-    STRICTLY filters by subject - only returns MCQs matching the exact subject name."""
+    """Retrieve MCQs for a specific subject across every exam month, oldest month first.
+    STRICTLY filters by subject - only returns MCQs matching the exact subject name.
+    Results are served from the question-bank cache when possible."""
     
     # Validate subject parameter
-    valid_subjects = ['Surgery', 'Medicine', 'Gynae', 'Paeds']
-    if subject not in valid_subjects:
-        print(f"❌ Invalid subject '{subject}'. Must be one of: {valid_subjects}")
+    if subject not in VALID_SUBJECTS:
+        print(f"❌ Invalid subject '{subject}'. Must be one of: {list(VALID_SUBJECTS)}")
         return []
-    
-    # List of month tables to search across; add/remove here as needed
-    month_tables = [
-        'january25_mcqs',
-        'february25_mcqs',
-        'march25_mcqs',
-        'april25_mcqs',
-        'may25_mcqs',
-        'june25_mcqs',
-        'july25_mcqs',
-        'august25_mcqs',
-        'september25_mcqs',
-        'october25_mcqs',
-        'november25_mcqs',
-        'december25_mcqs',
-    ]
 
     try:
-        all_rows = []
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                for table in month_tables:
-                    try:
-                        # STRICT filtering: WHERE subject = %s ensures only exact matches
-                        query = sql.SQL("""
-                            SELECT 
-                                id,
-                                question_number,
-                                question_text, 
-                                option_a,
-                                option_b,
-                                option_c,
-                                option_d,
-                                correct_answer,
-                                subject,
-                                explanation
-                            FROM {table}
-                            WHERE subject = %s
-                            ORDER BY 
-                                CASE 
-                                    WHEN question_number ~ '^[0-9]+' THEN CAST(regexp_replace(question_number, '[^0-9].*$', '') AS BIGINT)
-                                    ELSE 999999
-                                END,
-                                question_number
-                        """).format(table=sql.Identifier(table))
-                        cur.execute(query, (subject,))
-                        rows = cur.fetchall()
-                        
-                        # Verify each row's subject matches (double-check)
-                        for row in rows:
-                            row_subject = row[8]  # subject is at index 8
-                            if row_subject != subject:
-                                print(f"⚠️ WARNING: Found MCQ in {table} with subject '{row_subject}' when querying for '{subject}'. Skipping.")
-                                continue
-                            all_rows.append(row)
-                    except Exception as te:
-                        # Table might not exist yet or have different schema; skip but log
-                        print(f"⚠️ Skipping table {table} for subject {subject}: {te}")
-        
-        # Build unified MCQ list with sequential display_number across all months
-        # Final verification: ensure all MCQs are for the requested subject
-        mcqs = []
-        for idx, row in enumerate(all_rows, 1):
-            # Final check: verify subject matches (row[8] is the subject column)
-            row_subject = row[8]
-            if row_subject != subject:
-                print(f"⚠️ ERROR: MCQ {row[0]} has subject '{row_subject}' but expected '{subject}'. Skipping.")
-                continue
-                
-            options = {}
-            if row[3]: options['A'] = row[3]
-            if row[4]: options['B'] = row[4]
-            if row[5]: options['C'] = row[5]
-            if row[6]: options['D'] = row[6]
-            
-            mcqs.append({
-                'id': row[0],
-                'display_number': idx,
-                'question_text': row[2],
-                'options': options,
-                'correct_answer': row[7],
-                'subject': row_subject,  # Include subject in response for verification
-                # We don't have reliable per-table exam_date/source_file for all months,
-                # so keep them None for now to maintain API shape.
-                'source_file': None,
-                'exam_date': None,
-                'explanation': row[9]
-            })
-        
-        print(f"✅ Retrieved {len(mcqs)} MCQs for subject '{subject}' from {len(month_tables)} tables")
-        return mcqs
+        return _bank_cache.get_or_load(('subject', subject), lambda: _load_mcqs_by_subject(subject))
     except Exception as e:
         print(f"❌ Error retrieving MCQs for subject {subject}: {e}")
         return []
 
+MAX_PAGE_SIZE = 200
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not produced by get_mcqs_page_by_subject"""
+
+def _encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def _decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        year, month, sort_key, question_number, mcq_id, display_number = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not all(isinstance(v, int) for v in (year, month, sort_key, mcq_id, display_number)) \
+            or not isinstance(question_number, str):
+        raise InvalidCursor("Invalid cursor")
+    return (year, month, sort_key, question_number, mcq_id), display_number
+
+def get_subject_mcq_count(subject):
+    """Number of MCQs for a subject (cached like the banks)"""
+    def count():
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                conn.execute_prepared(cur, "mcqs_subject_count",
+                                      "SELECT COUNT(*) FROM mcqs WHERE subject = %s", (subject,))
+                return cur.fetchone()[0]
+    return _bank_cache.get_or_load(('subject_count', subject), count)
+
+def get_mcq_question(mcq_id):
+    """(question_text, correct_answer) of one MCQ by id, or None"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            conn.execute_prepared(cur, "mcq_question_by_id",
+                                  "SELECT question_text, correct_answer FROM mcqs WHERE id = %s", (mcq_id,))
+            return cur.fetchone()
+
+def get_mcqs_page_by_subject(subject, cursor=None, page_size=50):
+    """One keyset page of a subject bank, in the same order as get_mcqs_by_subject().
+
+    Returns {'items', 'next_cursor', 'total'}; pass next_cursor back to get the
+    following page (it is None on the last one). display_number continues
+    across pages. Raises InvalidCursor for a malformed cursor.
+    """
+    if subject not in VALID_SUBJECTS:
+        raise ValueError(f"Invalid subject '{subject}'")
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    columns = f"{MCQ_COLUMNS_SQL}, exam_year, exam_month, question_sort_key, COALESCE(question_number, '')"
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if cursor:
+                after, display_number = _decode_cursor(cursor)
+                conn.execute_prepared(cur, "mcqs_subject_page_after", f"""
+                    SELECT {columns}
+                    FROM mcqs
+                    WHERE subject = %s
+                      AND ({SUBJECT_ORDER_COLUMNS_SQL}) > (%s::smallint, %s::smallint, %s::bigint, %s::text, %s::bigint)
+                    ORDER BY {SUBJECT_ORDER_COLUMNS_SQL}
+                    LIMIT %s
+                """, (subject, *after, page_size + 1))
+            else:
+                display_number = 0
+                conn.execute_prepared(cur, "mcqs_subject_page_first", f"""
+                    SELECT {columns}
+                    FROM mcqs
+                    WHERE subject = %s
+                    ORDER BY {SUBJECT_ORDER_COLUMNS_SQL}
+                    LIMIT %s
+                """, (subject, page_size + 1))
+            rows = cur.fetchall()
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    items = []
+    for row in rows:
+        mcq = _row_to_mcq(row)
+        del mcq['question_number']
+        display_number += 1
+        mcq['display_number'] = display_number
+        mcq['source_file'] = None
+        mcq['exam_date'] = None
+        items.append(mcq)
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_cursor([last[10], last[11], last[12], last[13], last[0], display_number])
+    return {
+        'items': items,
+        'next_cursor': next_cursor,
+        'total': get_subject_mcq_count(subject),
+    }
+
 def get_mcqs_by_exam_date(exam_date):
     """Retrieve all MCQs for a specific exam date"""
     try:
+        if isinstance(exam_date, str):
+            from datetime import date
+            exam_date = date.fromisoformat(exam_date)
         with get_connection() as conn:
             with conn.cursor() as cur:
+                # Filtering on the partition keys as well lets Postgres prune to one partition
                 cur.execute(
-                    """
+                    f"""
                     SELECT 
                         question_number, question_text, 
                         option_a, option_b, option_c, option_d,
                         correct_answer, source_file, appearance_count,
                         subject, explanation
-                    FROM march25_mcqs 
-                    WHERE exam_date = %s
+                    FROM mcqs 
+                    WHERE exam_year = %s AND exam_month = %s AND exam_date = %s
                     ORDER BY 
                         subject,
-                        CASE 
-                            WHEN question_number ~ '^[0-9]+' THEN CAST(regexp_replace(question_number, '[^0-9].*$', '') AS BIGINT)
-                            ELSE 999999
-                        END,
-                        question_number
+                        {QUESTION_ORDER_SQL}
                     """,
-                    (exam_date,)
+                    (exam_date.year, exam_date.month, exam_date)
                 )
                 rows = cur.fetchall()
                 
@@ -474,56 +1265,133 @@ def get_mcqs_by_exam_date(exam_date):
         print(f"❌ Error retrieving MCQs for exam date {exam_date}: {e}")
         return []
 
+def _load_mcqs_by_exam_month(year, month):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            query = f"""
+                SELECT {MCQ_COLUMNS_SQL}
+                FROM mcqs
+                WHERE exam_year = %s AND exam_month = %s
+                ORDER BY 
+                    subject,
+                    {QUESTION_ORDER_SQL}
+            """
+            conn.execute_prepared(cur, "mcqs_by_exam_month", query, (year, month))
+            return [_row_to_mcq(row) for row in cur.fetchall()]
+
+def get_mcqs_by_exam_month(year, month):
+    """Retrieve all MCQs for one exam year/month (a single partition), cached"""
+    year, month = int(year), int(month)
+    try:
+        return _bank_cache.get_or_load(('exam', year, month), lambda: _load_mcqs_by_exam_month(year, month))
+    except Exception as e:
+        print(f"❌ Error retrieving MCQs for exam {month}/{year}: {e}")
+        return []
+
 def get_mcqs_by_exam_table(table_name):
-    """Retrieve all MCQs for a given month table (e.g., march25_mcqs)"""
+    """Retrieve all MCQs for a legacy month table name (e.g., march25_mcqs).
+
+    Kept for compatibility: the month tables now live as partitions of mcqs."""
+    exam = legacy_table_exam_month(table_name)
+    if not exam:
+        print(f"❌ Unknown exam table {table_name}")
+        return []
+    return get_mcqs_by_exam_month(*exam)
+
+# Mock test paper: 210 questions, 4 hours
+MOCK_TEST_SUBJECT_LIMITS = {
+    'Medicine': 63,
+    'Gynae': 53,
+    'Paeds': 52,
+    'Surgery': 42
+}
+
+def _load_mock_test_pool():
+    """Compact candidate arrays per subject: {subject: (years, months, ids)}.
+    Rows are ordered by id so a seed draws the same paper while the bank is unchanged."""
+    pool = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT subject::text, exam_year, exam_month, id
+                FROM mcqs
+                ORDER BY subject, id
+            """)
+            for subject, year, month, mcq_id in cur:
+                years, months, ids = pool.setdefault(subject, (array('h'), array('b'), array('q')))
+                years.append(year)
+                months.append(month)
+                ids.append(mcq_id)
+    return pool
+
+def new_mock_test_seed():
+    """Random seed token for sample_mock_test_mcqs (short base-36 string)"""
+    return _seed_token(secrets.randbits(48))
+
+def _seed_token(seed):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    token = ''
+    while True:
+        seed, digit = divmod(seed, 36)
+        token = digits[digit] + token
+        if not seed:
+            return token
+
+def parse_mock_test_seed(token):
+    """Seed token -> int, or None if it is not a valid token"""
+    if not token or len(token) > 12:
+        return None
     try:
+        return int(token, 36)
+    except ValueError:
+        return None
+
+def sample_mock_test_mcqs(subject_limits, seed=None):
+    """Draw a random paper, e.g. {'Medicine': 63, ...}, without replacement per subject.
+
+    Candidates come from cached per-subject id arrays, so a draw costs O(k)
+    rather than sorting the bank, and the chosen rows are fetched in one query.
+    Returns (mcqs, seed_token); passing the token back as ``seed`` reproduces
+    the same paper in the same order while the bank is unchanged.
+    """
+    token = seed if seed is not None else new_mock_test_seed()
+    seed_value = parse_mock_test_seed(token)
+    if seed_value is None:
+        raise ValueError(f"Invalid mock test seed '{token}'")
+    rng = random.Random(seed_value)
+    try:
+        pool = _bank_cache.get_or_load(('mock_test_pool',), _load_mock_test_pool)
+        years, months, ids = [], [], []
+        for subject in subject_limits:
+            subject_years, subject_months, subject_ids = pool.get(subject, ((), (), ()))
+            quota = min(int(subject_limits[subject]), len(subject_ids))
+            for i in rng.sample(range(len(subject_ids)), quota):
+                years.append(subject_years[i])
+                months.append(subject_months[i])
+                ids.append(subject_ids[i])
+        if not ids:
+            return [], token
+        # Mix subjects; part of the seeded draw so the order reproduces too
+        order = list(range(len(ids)))
+        rng.shuffle(order)
+        years = [years[i] for i in order]
+        months = [months[i] for i in order]
+        ids = [ids[i] for i in order]
+
         with get_connection() as conn:
             with conn.cursor() as cur:
-                query = sql.SQL("""
-                    SELECT 
-                        id,
-                        question_number,
-                        question_text,
-                        option_a,
-                        option_b,
-                        option_c,
-                        option_d,
-                        correct_answer,
-                        subject,
-                        explanation
-                    FROM {table}
-                    ORDER BY 
-                        subject,
-                        CASE 
-                            WHEN question_number ~ '^[0-9]+' THEN CAST(regexp_replace(question_number, '[^0-9].*$', '') AS BIGINT)
-                            ELSE 999999
-                        END,
-                        question_number
-                """).format(table=sql.Identifier(table_name))
-                cur.execute(query)
-                rows = cur.fetchall()
-                
-                mcqs = []
-                for row in rows:
-                    options = {}
-                    if row[3]: options['A'] = row[3]
-                    if row[4]: options['B'] = row[4]
-                    if row[5]: options['C'] = row[5]
-                    if row[6]: options['D'] = row[6]
-                    
-                    mcqs.append({
-                        'id': row[0],
-                        'question_number': row[1],
-                        'question_text': row[2],
-                        'options': options,
-                        'correct_answer': row[7],
-                        'subject': row[8],
-                        'explanation': row[9]
-                    })
-                return mcqs
+                # Partition keys are included so each pick is a primary-key lookup
+                cur.execute(f"""
+                    SELECT {MCQ_COLUMNS_SQL}
+                    FROM unnest(%s::smallint[], %s::smallint[], %s::bigint[])
+                        WITH ORDINALITY AS pick(exam_year, exam_month, id, position)
+                    JOIN mcqs USING (exam_year, exam_month, id)
+                    ORDER BY pick.position
+                """, (years, months, ids))
+                return [_row_to_mcq(row) for row in cur.fetchall()], token
     except Exception as e:
-        print(f"❌ Error retrieving MCQs from table {table_name}: {e}")
-        return []
+        print(f"❌ Error sampling mock test MCQs: {e}")
+        return [], token
 
 def get_mcq_statistics():
     """Get statistics about MCQs in the database"""
@@ -533,18 +1401,33 @@ def get_mcq_statistics():
                 print("\nMCQ Database Statistics:")
                 print("-" * 50)
                 
-                # Get stats by subject
+                # Get stats by subject. appearance_count is per exam month, so a
+                # question repeats if it was loaded twice for one month or
+                # appears (same normalized text) in more than one month
                 cur.execute("""
+                    WITH questions AS (
+                        SELECT subject, normalized_question,
+                               COUNT(*) AS months, SUM(appearance_count) AS appearances
+                        FROM mcqs
+                        GROUP BY subject, normalized_question
+                    ),
+                    repeats AS (
+                        SELECT subject, COUNT(*) AS repeated_questions
+                        FROM questions
+                        WHERE months > 1 OR appearances > 1
+                        GROUP BY subject
+                    )
                     SELECT 
-                        subject,
+                        m.subject,
                         COUNT(*) as total_mcqs,
-                        COUNT(DISTINCT source_file) as unique_sources,
-                        MIN(exam_date) as earliest_date,
-                        MAX(exam_date) as latest_date,
-                        SUM(CASE WHEN appearance_count > 1 THEN 1 ELSE 0 END) as repeated_questions
-                    FROM march25_mcqs  
-                    GROUP BY subject
-                    ORDER BY subject;
+                        COUNT(DISTINCT m.source_file) as unique_sources,
+                        MIN(m.exam_date) as earliest_date,
+                        MAX(m.exam_date) as latest_date,
+                        COALESCE(MAX(r.repeated_questions), 0) as repeated_questions
+                    FROM mcqs m
+                    LEFT JOIN repeats r ON r.subject = m.subject
+                    GROUP BY m.subject
+                    ORDER BY m.subject;
                 """)
                 
                 for row in cur.fetchall():
@@ -556,12 +1439,17 @@ def get_mcq_statistics():
                     print(f"Repeated Questions: {row[5]}")
                     print("-" * 50)
                 
-                # Get most repeated questions
+                # Get most repeated questions, totalled across exam months
                 cur.execute("""
-                    SELECT question_number, appearance_count
-                    FROM march25_mcqs 
-                    WHERE appearance_count > 1
-                    ORDER BY appearance_count DESC
+                    SELECT
+                        (ARRAY_AGG(question_number ORDER BY exam_year DESC, exam_month DESC))[1],
+                        SUM(appearance_count) AS appearances,
+                        COUNT(*) AS months,
+                        MAX(exam_year * 100 + exam_month) AS latest
+                    FROM mcqs
+                    GROUP BY normalized_question
+                    HAVING COUNT(*) > 1 OR SUM(appearance_count) > 1
+                    ORDER BY months DESC, appearances DESC
                     LIMIT 5;
                 """)
                 
@@ -569,17 +1457,18 @@ def get_mcq_statistics():
                 if repeated:
                     print("\nMost Repeated Questions:")
                     for row in repeated:
-                        print(f"Question {row[0]}: {row[1]} appearances")
+                        year, month = divmod(row[3], 100)
+                        print(f"Question {row[0]} (latest {MONTH_NAMES[month - 1].title()} {year}): "
+                              f"{row[1]} appearances in {row[2]} exam months")
                 
     except Exception as e:
         print(f"Error getting MCQ statistics: {e}")
 
 def ensure_all_tables_exist():
-    """Ensure all required tables exist - MINIMAL VERSION"""
+    """Ensure all required tables exist"""
     try:
-        # Initialize main database tables only
         initialize_database()
-        print("✅ Minimal database tables are ready (users + march25_mcqs only)")
+        print("✅ Database tables are ready (users + partitioned mcqs)")
     except Exception as e:
         print(f"Error ensuring all tables exist: {e}")
         raise
@@ -1,25 +1,22 @@
 from flask_mail import Mail, Message
 from flask import current_app
+from db_handler import get_connection
 import random
 import string
 
 # Initialize Flask-Mail
 mail = Mail()
 
+# NOTIFY channel that wakes email_worker.py when a message is queued
+OUTBOX_CHANNEL = 'email_outbox'
+
 def generate_verification_code():
     """Generate a 6-digit verification code"""
     return ''.join(random.choices(string.digits, k=6))
 
-def send_verification_email(email, verification_code):
-    """Send verification email to user"""
-    try:
-        msg = Message(
-            'Verify Your Email - GulfCertify',
-            sender=current_app.config['MAIL_DEFAULT_SENDER'],
-            recipients=[email]
-        )
-        
-        msg.body = f"""
+def verification_email(verification_code):
+    """(subject, text body, html body) of the verification email"""
+    body = f"""
         Welcome to GulfCertify!
         
         Your verification code is: {verification_code}
@@ -31,8 +28,7 @@ def send_verification_email(email, verification_code):
         Best Regards,
         GulfCertify
         """
-        
-        msg.html = f"""
+    html = f"""
         <h2>Welcome to GulfCertify!</h2>
         <p>Your verification code is: <strong>{verification_code}</strong></p>
         <p>Please enter this code to verify your email address.</p>
@@ -40,9 +36,46 @@ def send_verification_email(email, verification_code):
         <br>
         <p>Best Regards,<br>GulfCertify</p>
         """
-        
+    return 'Verify Your Email - GulfCertify', body, html
+
+def queue_email(recipient, subject, body, html=None):
+    """Write an email to the outbox; email_worker.py delivers it. Returns the outbox id."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO email_outbox (recipient, subject, body_text, body_html)
+                VALUES (%s, %s, %s, %s)
+                RETURNING id
+            """, (recipient, subject, body, html))
+            outbox_id = cur.fetchone()[0]
+            # Delivered to listeners when the transaction commits
+            cur.execute("SELECT pg_notify(%s, %s)", (OUTBOX_CHANNEL, str(outbox_id)))
+        conn.commit()
+    return outbox_id
+
+def queue_verification_email(email, verification_code):
+    """Queue the verification email (returns immediately; delivery is asynchronous)"""
+    try:
+        subject, body, html = verification_email(verification_code)
+        queue_email(email, subject, body, html)
+        return True
+    except Exception as e:
+        print(f"Error queueing verification email: {str(e)}")
+        return False
+
+def send_verification_email(email, verification_code):
+    """Send verification email to user right away (bypasses the outbox)"""
+    try:
+        subject, body, html = verification_email(verification_code)
+        msg = Message(
+            subject,
+            sender=current_app.config['MAIL_DEFAULT_SENDER'],
+            recipients=[email]
+        )
+        msg.body = body
+        msg.html = html
         mail.send(msg)
         return True
     except Exception as e:
         print(f"Error sending verification email: {str(e)}")
-        return False 
\ No newline at end of file
+        return False
@@ -0,0 +1,451 @@
+"""
+Delivery worker for the email outbox.
+
+Request handlers only INSERT into email_outbox (email_handler.queue_email), so
+registration no longer waits on the mail server. This worker:
+  - claims due messages in batches (FOR UPDATE SKIP LOCKED, so several
+    workers never send the same message) and wakes up immediately on the
+    NOTIFY that queue_email sends, polling every EMAIL_POLL_INTERVAL seconds
+    otherwise;
+  - sends them over a small pool of SMTP connections that are kept open and
+    reused between batches;
+  - retries temporary failures with exponential backoff and gives up after
+    EMAIL_MAX_ATTEMPTS (or at once on a permanent 5xx rejection);
+  - keeps delivery counters (sent/retried/failed, send latency) that it logs
+    after every busy batch.
+A message left in 'sending' by a crashed worker is picked up again once its
+claim expires.
+
+Each gunicorn worker runs it in a background thread (EMAIL_WORKER_IN_APP,
+default true); a Postgres advisory lock lets only one of them deliver at a time.
+
+Usage:
+    python email_worker.py run [--once]     # deliver (run alongside or instead of the in-app thread)
+    python email_worker.py status           # outbox counts by status
+    python email_worker.py sink [--port 1025]  # local SMTP sink that prints what it receives
+
+To test locally, start the sink and point the worker at it:
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false python email_worker.py run
+"""
+import argparse
+import os
+import random
+import select
+import smtplib
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from queue import Queue, Empty
+from dotenv import load_dotenv
+from db_handler import get_connection, connect_unpooled
+from email_handler import OUTBOX_CHANNEL
+
+load_dotenv()
+
+SMTP_HOST = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('MAIL_PORT', 587))
+SMTP_USE_TLS = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
+SMTP_USERNAME = os.getenv('MAIL_USERNAME')
+SMTP_PASSWORD = os.getenv('MAIL_PASSWORD')
+MAIL_SENDER = os.getenv('MAIL_DEFAULT_SENDER') or SMTP_USERNAME
+
+SMTP_CONNECTIONS = int(os.getenv('EMAIL_SMTP_CONNECTIONS', 2))
+SMTP_TIMEOUT = float(os.getenv('EMAIL_SMTP_TIMEOUT', 20))
+# Reconnect after this many messages or this long idle (servers drop idle sessions)
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+SMTP_MAX_IDLE = 60
+
+BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 20))
+POLL_INTERVAL = float(os.getenv('EMAIL_POLL_INTERVAL', 5))
+MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', 6))
+BACKOFF_BASE = float(os.getenv('EMAIL_BACKOFF_BASE', 30))
+BACKOFF_MAX = 3600
+# How long a claimed message stays reserved for the claiming worker
+CLAIM_SECONDS = 300
+
+# Arbitrary constant so only one in-app worker delivers at a time
+DELIVERY_LOCK_ID = 72_410_127
+
+class PermanentFailure(Exception):
+    """The server rejected the message for good (5xx); retrying will not help"""
+
+class SMTPPool:
+    """Up to ``size`` SMTP sessions, opened lazily and reused between messages"""
+
+    def __init__(self, size=SMTP_CONNECTIONS, host=SMTP_HOST, port=SMTP_PORT, use_tls=SMTP_USE_TLS,
+                 username=SMTP_USERNAME, password=SMTP_PASSWORD, timeout=SMTP_TIMEOUT):
+        self.size = size
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self.connects = 0
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        self.connects += 1
+        return {'smtp': smtp, 'sent': 0, 'used_at': time.monotonic()}
+
+    def _acquire(self):
+        while True:
+            try:
+                entry = self._idle.get_nowait()
+            except Empty:
+                with self._lock:
+                    can_open = self._open < self.size
+                    if can_open:
+                        self._open += 1
+                if not can_open:
+                    try:
+                        entry = self._idle.get(timeout=1)
+                    except Empty:
+                        continue
+                else:
+                    try:
+                        return self._connect()
+                    except BaseException:
+                        with self._lock:
+                            self._open -= 1
+                        raise
+            stale = (entry['sent'] >= SMTP_MAX_MESSAGES_PER_CONNECTION
+                     or time.monotonic() - entry['used_at'] > SMTP_MAX_IDLE)
+            if not stale:
+                return entry
+            self._discard(entry)
+
+    def _discard(self, entry):
+        try:
+            entry['smtp'].quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+
+    def send(self, message):
+        """Send one EmailMessage, reconnecting once if a pooled session went away"""
+        for attempt in range(2):
+            entry = self._acquire()
+            try:
+                entry['smtp'].send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                self._discard(entry)
+                if attempt:
+                    raise
+                continue
+            except smtplib.SMTPResponseException as e:
+                # The session itself is still usable after a rejected message
+                self._release(entry)
+                if 500 <= e.smtp_code < 600:
+                    raise PermanentFailure(f"{e.smtp_code} {e.smtp_error!r}") from e
+                raise
+            except smtplib.SMTPRecipientsRefused as e:
+                self._release(entry)
+                raise PermanentFailure(str(e.recipients)) from e
+            except BaseException:
+                self._discard(entry)
+                raise
+            entry['sent'] += 1
+            self._release(entry)
+            return
+
+    def _release(self, entry):
+        entry['used_at'] = time.monotonic()
+        self._idle.put(entry)
+
+    def close(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except Empty:
+                return
+
+def build_message(row):
+    message = EmailMessage()
+    message['Subject'] = row['subject']
+    message['From'] = MAIL_SENDER
+    message['To'] = row['recipient']
+    message.set_content(row['body_text'])
+    if row['body_html']:
+        message.add_alternative(row['body_html'], subtype='html')
+    return message
+
+def backoff_seconds(attempts):
+    """Delay before retry number ``attempts`` (exponential with jitter, capped)"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+def claim_batch(limit=BATCH_SIZE):
+    """Reserve up to ``limit`` due messages for this worker"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE email_outbox o
+                SET status = 'sending',
+                    attempts = o.attempts + 1,
+                    locked_until = now() + make_interval(secs => %s)
+                WHERE o.id IN (
+                    SELECT id FROM email_outbox
+                    WHERE (status = 'pending' AND next_attempt_at <= now())
+                       OR (status = 'sending' AND locked_until < now())
+                    ORDER BY next_attempt_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING o.id, o.recipient, o.subject, o.body_text, o.body_html, o.attempts
+            """, (CLAIM_SECONDS, limit))
+            columns = [c[0] for c in cur.description]
+            rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        conn.commit()
+    return rows
+
+def record_results(sent_ids, retries, failures):
+    """Write a batch's outcomes back: sent ids, [(id, delay, error)] to retry, [(id, error)] given up"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if sent_ids:
+                cur.execute("""
+                    UPDATE email_outbox
+                    SET status = 'sent', sent_at = now(), locked_until = NULL, last_error = NULL
+                    WHERE id = ANY(%s)
+                """, (sent_ids,))
+            for outbox_id, delay, error in retries:
+                cur.execute("""
+                    UPDATE email_outbox
+                    SET status = 'pending', locked_until = NULL, last_error = %s,
+                        next_attempt_at = now() + make_interval(secs => %s)
+                    WHERE id = %s
+                """, (error, delay, outbox_id))
+            for outbox_id, error in failures:
+                cur.execute("""
+                    UPDATE email_outbox
+                    SET status = 'failed', locked_until = NULL, last_error = %s
+                    WHERE id = %s
+                """, (error, outbox_id))
+        conn.commit()
+
+class EmailWorker:
+    """Claims due outbox messages and delivers them through an SMTPPool"""
+
+    def __init__(self, pool=None, batch_size=BATCH_SIZE):
+        self.pool = pool or SMTPPool()
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=self.pool.size, thread_name_prefix='smtp')
+        self._lock = threading.Lock()
+        self._stats = {
+            'batches': 0,
+            'sent': 0,
+            'retried': 0,
+            'failed': 0,
+            'send_time_total': 0.0,
+            'send_time_max': 0.0,
+        }
+
+    def _send(self, row):
+        started = time.monotonic()
+        try:
+            self.pool.send(build_message(row))
+            return row, None
+        except Exception as e:
+            return row, e
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._stats['send_time_total'] += elapsed
+                self._stats['send_time_max'] = max(self._stats['send_time_max'], elapsed)
+
+    def run_batch(self):
+        """Deliver one batch; returns how many messages were claimed"""
+        rows = claim_batch(self.batch_size)
+        if not rows:
+            return 0
+        sent_ids, retries, failures = [], [], []
+        for row, error in self._executor.map(self._send, rows):
+            if error is None:
+                sent_ids.append(row['id'])
+            elif isinstance(error, PermanentFailure) or row['attempts'] >= MAX_ATTEMPTS:
+                failures.append((row['id'], str(error)[:1000]))
+                print(f"❌ Giving up on email {row['id']} to {row['recipient']}: {error}")
+            else:
+                delay = backoff_seconds(row['attempts'])
+                retries.append((row['id'], delay, str(error)[:1000]))
+                print(f"⚠️ Email {row['id']} failed (attempt {row['attempts']}), retrying in {delay:.0f}s: {error}")
+        record_results(sent_ids, retries, failures)
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['sent'] += len(sent_ids)
+            self._stats['retried'] += len(retries)
+            self._stats['failed'] += len(failures)
+        self.log_stats()
+        return len(rows)
+
+    def drain(self):
+        """Deliver batches until nothing is due"""
+        while self.run_batch() >= self.batch_size:
+            pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        attempted = stats['sent'] + stats['retried'] + stats['failed']
+        stats['send_time_avg'] = stats['send_time_total'] / attempted if attempted else 0.0
+        stats['smtp_connects'] = self.pool.connects
+        return stats
+
+    def log_stats(self):
+        s = self.stats()
+        print(f"📧 Outbox: {s['sent']} sent, {s['retried']} retried, {s['failed']} failed "
+              f"(avg {s['send_time_avg'] * 1000:.0f} ms/message, max {s['send_time_max'] * 1000:.0f} ms, "
+              f"{s['smtp_connects']} SMTP connects)")
+
+    def run_forever(self, use_lock=True):
+        """LISTEN for new messages and deliver them (also polls, for retries)"""
+        conn = None
+        while True:
+            try:
+                if conn is None:
+                    conn = connect_unpooled()
+                    conn.autocommit = True
+                    with conn.cursor() as cur:
+                        if use_lock:
+                            cur.execute("SELECT pg_try_advisory_lock(%s)", (DELIVERY_LOCK_ID,))
+                            if not cur.fetchone()[0]:
+                                # Another worker delivers; check again later
+                                conn.close()
+                                conn = None
+                                time.sleep(POLL_INTERVAL * 6)
+                                continue
+                        cur.execute(f"LISTEN {OUTBOX_CHANNEL}")
+                self.drain()
+                if select.select([conn], [], [], POLL_INTERVAL)[0]:
+                    conn.poll()
+                    conn.notifies.clear()
+            except Exception as e:
+                print(f"⚠️ Email worker error: {e}")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+                time.sleep(POLL_INTERVAL)
+
+_worker = None
+
+def start_email_worker():
+    """Start the in-app delivery thread (gunicorn post_worker_init calls it)"""
+    global _worker
+    if os.getenv('EMAIL_WORKER_IN_APP', 'true').lower() != 'true' or _worker is not None:
+        return _worker
+    _worker = EmailWorker()
+    threading.Thread(target=_worker.run_forever, name='email-outbox', daemon=True).start()
+    return _worker
+
+def outbox_status():
+    """{status: count} plus the age of the oldest undelivered message"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT status, COUNT(*) FROM email_outbox GROUP BY status")
+            counts = dict(cur.fetchall())
+            cur.execute("""
+                SELECT EXTRACT(EPOCH FROM now() - MIN(created_at))
+                FROM email_outbox WHERE status IN ('pending', 'sending')
+            """)
+            oldest = cur.fetchone()[0]
+    return counts, float(oldest) if oldest is not None else None
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and print messages"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost email_worker sink')
+        envelope = {'from': None, 'to': []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                envelope = {'from': command[10:], 'to': []}
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                envelope['to'].append(command[8:])
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data in iter(self.rfile.readline, b''):
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data.decode(errors='replace').rstrip('\r\n'))
+                self.server.received += 1
+                subject = next((l[9:] for l in lines if l.lower().startswith('subject: ')), '')
+                print(f"📨 #{self.server.received} from {envelope['from']} to {', '.join(envelope['to'])}: {subject}")
+                self.reply('250 OK: queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+def run_sink(port):
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer(('127.0.0.1', port), _SinkHandler) as server:
+        server.daemon_threads = True
+        server.received = 0
+        print(f"📭 SMTP sink listening on 127.0.0.1:{port}")
+        server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deliver queued emails from the outbox")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="Deliver queued emails")
+    run.add_argument('--once', action='store_true', help="Deliver what is due now, then exit")
+    sub.add_parser('status', help="Show outbox counts")
+    sink = sub.add_parser('sink', help="Run a local SMTP sink for testing")
+    sink.add_argument('--port', type=int, default=1025)
+    args = parser.parse_args(argv)
+
+    if args.command == 'sink':
+        run_sink(args.port)
+        return 0
+    if args.command == 'status':
+        counts, oldest = outbox_status()
+        print(f"📊 Outbox: {counts.get('pending', 0)} pending, {counts.get('sending', 0)} sending, "
+              f"{counts.get('sent', 0)} sent, {counts.get('failed', 0)} failed"
+              + (f"; oldest undelivered {oldest:.0f}s" if oldest is not None else ""))
+        return 0
+
+    worker = EmailWorker()
+    try:
+        if args.once:
+            worker.drain()
+            worker.log_stats()
+        else:
+            # Standalone workers do not take the lock, so they can run next to the in-app thread
+            worker.run_forever(use_lock=False)
+    finally:
+        worker.pool.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Gemini explanations with a persistent, deduplicated cache.
+
+Explanations are keyed by the normalized question hash (normalize_question)
+and the correct option, and stored in the explanation_cache table, so the
+model is asked once per question/option no matter how many students open it.
+
+Concurrent requests for the same key share one model call:
+  - within a worker, QuestionBankCache.get_or_load() lets one thread load a key
+    while the others wait for it;
+  - across workers, the first one to take the row's lease calls the model and
+    the others poll the row until the explanation lands or the lease expires.
+Failed calls are never cached, so the next request simply tries again.
+"""
+import os
+import time
+import uuid
+import google.generativeai as genai
+from dotenv import load_dotenv
+from db_handler import get_connection, normalize_question, clean_text, QuestionBankCache
+from gemini_guard import guard_from_env
+
+load_dotenv()
+
+genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+
+# Initialize Gemini model behind a deadline, concurrency cap and circuit breaker
+model = guard_from_env(genai.GenerativeModel("models/gemini-1.5-pro-latest"))
+
+TRY_LATER_MESSAGE = "Explanations are temporarily unavailable. Please try again in a few minutes."
+
+# How long one worker may hold the right to generate an explanation
+LEASE_SECONDS = float(os.getenv('EXPLANATION_LEASE_SECONDS', 60))
+POLL_INTERVAL = 0.25
+_INSTANCE = uuid.uuid4().hex[:8]
+
+def _worker_id():
+    """Lease owner tag; includes the pid so forked workers never share one"""
+    return f"{os.getpid()}-{_INSTANCE}"
+
+_recent = QuestionBankCache(
+    max_bytes=int(float(os.getenv('EXPLANATION_CACHE_MAX_MB', 16)) * 1024 * 1024),
+    ttl=3600,
+)
+
+class ExplanationUnavailable(Exception):
+    """The model call failed or another worker's call did not finish in time"""
+
+def explanation_key(question, correct_option):
+    """(question_hash, option) cache key"""
+    return normalize_question(clean_text(question)), str(correct_option or '').strip().upper()[:1]
+
+def build_prompt(question, correct_option):
+    return f"Explain why the correct answer to the following MCQ is option {correct_option}:\n\n{question}"
+
+def _call_model(question, correct_option):
+    try:
+        response = model.generate_content(build_prompt(question, correct_option))
+        text = response.text
+    except Exception as e:
+        raise ExplanationUnavailable(str(e)) from e
+    if not text or not text.strip():
+        raise ExplanationUnavailable("empty response from model")
+    return text
+
+def lookup_explanation(question_hash, option):
+    """Stored explanation for a key, or None"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            conn.execute_prepared(cur, "explanation_lookup", """
+                SELECT explanation FROM explanation_cache
+                WHERE question_hash = %s AND correct_option = %s AND explanation IS NOT NULL
+            """, (question_hash, option))
+            row = cur.fetchone()
+    return row[0] if row else None
+
+def _take_lease(question_hash, option):
+    """True if this worker now owns the right to generate the explanation"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO explanation_cache (question_hash, correct_option, lease_owner, lease_expires)
+                VALUES (%s, %s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (question_hash, correct_option) DO UPDATE
+                SET lease_owner = EXCLUDED.lease_owner,
+                    lease_expires = EXCLUDED.lease_expires
+                WHERE explanation_cache.explanation IS NULL
+                  AND (explanation_cache.lease_expires IS NULL OR explanation_cache.lease_expires < now())
+                RETURNING lease_owner
+            """, (question_hash, option, _worker_id(), LEASE_SECONDS))
+            return cur.fetchone() is not None
+
+def store_explanation(question_hash, option, explanation):
+    """Save a successful explanation and release any lease on the key"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO explanation_cache (question_hash, correct_option, explanation)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (question_hash, correct_option) DO UPDATE
+                SET explanation = EXCLUDED.explanation,
+                    lease_owner = NULL,
+                    lease_expires = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (question_hash, option, explanation))
+
+def _release_lease(question_hash, option):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE explanation_cache SET lease_expires = NULL, lease_owner = NULL
+                WHERE question_hash = %s AND correct_option = %s AND lease_owner = %s
+            """, (question_hash, option, _worker_id()))
+
+def _load_or_generate(question, correct_option, question_hash, option):
+    deadline = time.monotonic() + LEASE_SECONDS * 2
+    while True:
+        explanation = lookup_explanation(question_hash, option)
+        if explanation:
+            return explanation
+        if not model.available():
+            # Upstream unhealthy: fail fast rather than take a lease we cannot use
+            raise ExplanationUnavailable(TRY_LATER_MESSAGE)
+        if _take_lease(question_hash, option):
+            try:
+                explanation = _call_model(question, correct_option)
+            except Exception:
+                _release_lease(question_hash, option)
+                raise
+            store_explanation(question_hash, option, explanation)
+            return explanation
+        # Another worker is generating it; wait for the row (or for its lease to lapse)
+        if time.monotonic() > deadline:
+            raise ExplanationUnavailable("timed out waiting for another worker")
+        time.sleep(POLL_INTERVAL)
+
+def get_explanation(question, correct_option):
+    """Explanation text for a question/option, generating it at most once.
+    Raises ExplanationUnavailable when it cannot be produced right now."""
+    question_hash, option = explanation_key(question, correct_option)
+    return _recent.get_or_load(
+        (question_hash, option),
+        lambda: _load_or_generate(question, correct_option, question_hash, option)
+    )
+
+def stream_explanation(question, correct_option):
+    """Yield the explanation text in chunks as the model produces them.
+
+    A stored explanation comes back as a single chunk. Otherwise this worker
+    takes the key's lease and streams the model output, saving the completed
+    text when the stream ends. If another worker already holds the lease, we
+    wait for its result instead of paying for a second model call. Raises
+    ExplanationUnavailable on failure (after any chunks already yielded).
+    """
+    question_hash, option = explanation_key(question, correct_option)
+    explanation = _recent.get((question_hash, option)) or lookup_explanation(question_hash, option)
+    if explanation:
+        _recent.put((question_hash, option), explanation)
+        yield explanation
+        return
+    if not model.available():
+        raise ExplanationUnavailable(TRY_LATER_MESSAGE)
+    if not _take_lease(question_hash, option):
+        yield get_explanation(question, correct_option)
+        return
+
+    parts = []
+    try:
+        try:
+            for chunk in model.generate_content(build_prompt(question, correct_option), stream=True):
+                text = chunk.text
+                if text:
+                    parts.append(text)
+                    yield text
+        except Exception as e:
+            raise ExplanationUnavailable(str(e)) from e
+        explanation = ''.join(parts)
+        if not explanation.strip():
+            raise ExplanationUnavailable("empty response from model")
+    except BaseException:
+        # Includes GeneratorExit when the student closes the modal mid-stream
+        _release_lease(question_hash, option)
+        raise
+    store_explanation(question_hash, option, explanation)
+    _recent.put((question_hash, option), explanation)
+
+def generate_explanation(question, correct_option):
+    """Explanation text, or a "try later"/"Error generating explanation" message (never cached)"""
+    try:
+        return get_explanation(question, correct_option)
+    except ExplanationUnavailable as e:
+        print(f"⚠️ Explanation unavailable: {e}")
+        return TRY_LATER_MESSAGE
+    except Exception as e:
+        return f"Error generating explanation: {str(e)}"
+
+def get_explanation_cache_stats():
+    """In-process explanation cache counters for this worker"""
+    return _recent.stats()
+
+def get_model_stats():
+    """Gemini call latency/error/breaker counters for this worker"""
+    return model.stats()
@@ -1,8 +1,38 @@
-import React from 'react';
-import { formatExplanation } from '../utils/api';
+import React, { useEffect, useState } from 'react';
+import { escapeHtml, formatExplanation, streamExplanation } from '../utils/api';
 
-function ExplanationModal({ explanation, onClose }) {
-  const formattedExplanation = formatExplanation(explanation);
+function ExplanationModal({ explanation, mcqId, onClose }) {
+  // Questions without a stored explanation get one streamed from Gemini
+  const shouldStream = (!explanation || explanation.trim() === '') && mcqId != null;
+  const [streamedText, setStreamedText] = useState('');
+  const [streamError, setStreamError] = useState(null);
+  const [streaming, setStreaming] = useState(shouldStream);
+
+  useEffect(() => {
+    if (!shouldStream) return undefined;
+    setStreamedText('');
+    setStreamError(null);
+    setStreaming(true);
+    return streamExplanation(mcqId, {
+      onText: setStreamedText,
+      onDone: () => setStreaming(false),
+      onError: (message) => {
+        setStreamError(message);
+        setStreaming(false);
+      },
+    });
+  }, [shouldStream, mcqId]);
+
+  let formattedExplanation;
+  if (!shouldStream) {
+    formattedExplanation = formatExplanation(explanation);
+  } else if (streamError && !streamedText) {
+    formattedExplanation = `<div style="padding: 20px; text-align: center; color: #666;"><p>${escapeHtml(streamError)}</p></div>`;
+  } else if (!streamedText) {
+    formattedExplanation = '<div style="padding: 20px; text-align: center; color: #666;"><p>Generating explanation...</p></div>';
+  } else {
+    formattedExplanation = formatExplanation(streamedText);
+  }
 
   return (
     <>
@@ -21,6 +51,7 @@ function ExplanationModal({ explanation, onClose }) {
         <div 
           id="explanation-content" 
           className="solution-content"
+          aria-busy={streaming}
           dangerouslySetInnerHTML={{ __html: formattedExplanation }}
         />
       </div>
@@ -29,4 +60,3 @@ function ExplanationModal({ explanation, onClose }) {
 }
 
 export default ExplanationModal;
-
@@ -83,7 +83,8 @@ function MCQView({
             if (!value) return null;
             const isCorrectAnswer = key === currentMCQ.correct_answer;
             // Show explanation button on correct answer after user has answered
-            const showExplanationBtn = !isMockTest && userAnswer !== null && currentMCQ.explanation && isCorrectAnswer;
+            // (questions without a stored explanation get one streamed from Gemini)
+            const showExplanationBtn = !isMockTest && userAnswer !== null && isCorrectAnswer;
             
             return (
               <div
@@ -176,6 +177,7 @@ function MCQView({
       {showExplanation && (
         <ExplanationModal
           explanation={currentMCQ.explanation}
+          mcqId={currentMCQ.id}
           onClose={() => setShowExplanation(false)}
         />
       )}
@@ -1,6 +1,6 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useQuizState } from '../hooks/useQuizState';
-import { fetchMCQsBySubject } from '../utils/api';
+import { fetchMCQPageBySubject } from '../utils/api';
 import MCQView from './MCQView';
 import ResultsView from './ResultsView';
 import SubjectSelector from './SubjectSelector';
@@ -9,6 +9,8 @@ function SubjectWise({ subject: propSubject, onBackToHome, showToast, setLoading
   const [subject, setSubject] = useState(propSubject || null);
   const [showResults, setShowResults] = useState(false);
   const quizState = useQuizState();
+  // Bumped on every load so pages of an abandoned subject are dropped
+  const loadToken = useRef(0);
 
   useEffect(() => {
     if (propSubject && propSubject !== subject) {
@@ -19,23 +21,42 @@ function SubjectWise({ subject: propSubject, onBackToHome, showToast, setLoading
   }, [propSubject]);
 
   const loadSubject = async (selectedSubject) => {
+    const token = ++loadToken.current;
     try {
       setLoading(true);
       setSubject(selectedSubject);
-      const data = await fetchMCQsBySubject(selectedSubject);
-      
-      if (data.error) {
-        throw new Error(data.error);
+      // Render as soon as the first small page arrives; the rest streams in behind it
+      const firstPage = await fetchMCQPageBySubject(selectedSubject);
+      if (token !== loadToken.current) return;
+      if (!firstPage.items.length) {
+        throw new Error(`No MCQs found for subject: ${selectedSubject}`);
       }
 
-      quizState.handleMCQData(data, '', selectedSubject);
+      quizState.handleMCQData(firstPage.items, '', selectedSubject);
       quizState.setIsMockTest(false);
-      showToast(`Loaded ${data.length} ${selectedSubject} MCQs`, 'success');
+      setLoading(false);
+      showToast(`Loaded ${firstPage.total} ${selectedSubject} MCQs`, 'success');
+
+      // The rest follows a page at a time on the cursor (pages have their own
+      // rate limit), so nothing is downloaded twice
+      let cursor = firstPage.next_cursor;
+      try {
+        while (cursor && token === loadToken.current) {
+          const page = await fetchMCQPageBySubject(selectedSubject, cursor, 200);
+          if (token !== loadToken.current) return;
+          quizState.appendMCQs(page.items);
+          cursor = page.next_cursor;
+        }
+      } catch (error) {
+        // Keep the questions already loaded; the student can carry on with them
+        showToast('Could not load the remaining MCQs', 'error');
+      }
     } catch (error) {
+      if (token !== loadToken.current) return;
       showToast(error.message || 'Failed to load subject MCQs', 'error');
       onBackToHome();
     } finally {
-      setLoading(false);
+      if (token === loadToken.current) setLoading(false);
     }
   };
 
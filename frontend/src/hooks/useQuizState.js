@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 
 const QUIZ_STATE_KEY = 'quizStateV1';
 const QUIZ_TIMER_KEY = 'quizTimerV1';
@@ -10,6 +10,9 @@ export function useQuizState() {
   const [attempted, setAttempted] = useState(0);
   const [userAnswers, setUserAnswers] = useState([]);
   const [isMockTest, setIsMockTest] = useState(false);
+  // Subject banks are saved by reference ({ subject }) and re-fetched on
+  // restore: their questions may still be arriving when progress is saved
+  const bankSource = useRef(null);
 
   const resetState = () => {
     setCurrentIndex(0);
@@ -18,6 +21,7 @@ export function useQuizState() {
     setAttempted(0);
     setUserAnswers([]);
     setIsMockTest(false);
+    bankSource.current = null;
   };
 
   const saveQuizState = (contextLabel) => {
@@ -29,9 +33,13 @@ export function useQuizState() {
         score,
         attempted,
         isMockTest,
-        currentMCQs: Array.isArray(currentMCQs) ? currentMCQs : [],
         timestamp: Date.now()
       };
+      if (bankSource.current) {
+        payload.bank = bankSource.current;
+      } else {
+        payload.currentMCQs = Array.isArray(currentMCQs) ? currentMCQs : [];
+      }
       localStorage.setItem(QUIZ_STATE_KEY, JSON.stringify(payload));
     } catch (e) {
       // Ignore storage errors
@@ -43,7 +51,7 @@ export function useQuizState() {
       const raw = localStorage.getItem(QUIZ_STATE_KEY);
       if (!raw) return null;
       const parsed = JSON.parse(raw);
-      if (!parsed || !Array.isArray(parsed.currentMCQs)) return null;
+      if (!parsed || !(Array.isArray(parsed.currentMCQs) || (parsed.bank && parsed.bank.subject))) return null;
       return parsed;
     } catch (e) {
       return null;
@@ -66,9 +74,16 @@ export function useQuizState() {
     setScore(0);
     setAttempted(0);
     setIsMockTest(subject === 'Mock Test');
+    bankSource.current = subject && subject !== 'Mock Test' ? { subject } : null;
     saveQuizState(subject ? `subject:${subject}` : month ? `month:${month}` : 'direct');
   };
 
+  // Add the rest of a progressively loaded bank without resetting progress
+  const appendMCQs = (items) => {
+    setCurrentMCQs(prev => [...prev, ...items]);
+    setUserAnswers(prev => [...prev, ...new Array(items.length).fill(null)]);
+  };
+
   const selectOption = (selected, correct) => {
     const newAnswers = [...userAnswers];
     newAnswers[currentIndex] = selected;
@@ -115,6 +130,7 @@ export function useQuizState() {
     loadQuizState,
     clearQuizState,
     handleMCQData,
+    appendMCQs,
     selectOption,
     setAllAnswers
   };
@@ -1,12 +1,66 @@
 const API_BASE = process.env.REACT_APP_API_BASE || '';
 
+// Question banks are requested in the compact columnar encoding (one array per
+// field, dictionary-encoded subjects); the server falls back to plain JSON.
+const COLUMNAR_TYPE = 'application/vnd.mcq-columnar+json';
+const BANK_ACCEPT = `${COLUMNAR_TYPE}, application/json;q=0.9`;
+const OPTION_KEYS = ['A', 'B', 'C', 'D'];
+
+function decodeColumn(column, count) {
+  if ('values' in column) return column.values;
+  if ('codes' in column) return column.codes.map((code) => column.dict[code]);
+  if ('options' in column) {
+    return column.options.map((row) => {
+      const options = {};
+      OPTION_KEYS.forEach((key, i) => {
+        if (row[i] != null) options[key] = row[i];
+      });
+      return options;
+    });
+  }
+  return new Array(count).fill(column.const);
+}
+
+// Turn a columnar bank ({ format, count, columns }) back into a list of MCQ objects
+export function decodeColumnarMCQs(data) {
+  const names = Object.keys(data.columns);
+  const columns = names.map((name) => decodeColumn(data.columns[name], data.count));
+  const mcqs = new Array(data.count);
+  for (let row = 0; row < data.count; row++) {
+    const mcq = {};
+    for (let i = 0; i < names.length; i++) mcq[names[i]] = columns[i][row];
+    mcqs[row] = mcq;
+  }
+  return mcqs;
+}
+
+async function readBank(response) {
+  const data = await response.json();
+  if (!(response.headers.get('Content-Type') || '').startsWith(COLUMNAR_TYPE)) return data;
+  if (data.format === 'mcq-columnar') return decodeColumnarMCQs(data);
+  // A page: { items: <columnar>, next_cursor, total }
+  return { ...data, items: decodeColumnarMCQs(data.items) };
+}
+
 export async function fetchMCQsBySubject(subject) {
-  const response = await fetch(`${API_BASE}/get_mcqs/${subject}`);
+  const response = await fetch(`${API_BASE}/get_mcqs/${subject}`, { headers: { Accept: BANK_ACCEPT } });
   if (!response.ok) {
     const error = await response.json();
     throw new Error(error.error || 'Failed to fetch MCQs');
   }
-  return response.json();
+  return readBank(response);
+}
+
+// One keyset page of a subject bank: { items, next_cursor, total }
+export async function fetchMCQPageBySubject(subject, cursor = null, pageSize = 50) {
+  const params = new URLSearchParams({ page_size: pageSize });
+  if (cursor) params.set('cursor', cursor);
+  const response = await fetch(`${API_BASE}/get_mcqs/${subject}?${params}`, { headers: { Accept: BANK_ACCEPT } });
+  if (!response.ok) {
+    const error = await response.json();
+    throw new Error(error.error || 'Failed to fetch MCQs');
+  }
+  return readBank(response);
 }
 
 export async function fetchMCQsByExam(year, month, options = {}) {
@@ -14,7 +68,7 @@ export async function fetchMCQsByExam(year, month, options = {}) {
   const monthLower = month.toLowerCase();
   const url = `${API_BASE}/get_mcqs/exam/${year}/${monthLower}`;
   
-  const response = await fetch(url, { signal: options.signal });
+  const response = await fetch(url, { signal: options.signal, headers: { Accept: BANK_ACCEPT } });
   
   if (!response.ok) {
     let errorMessage = 'Failed to fetch MCQs';
@@ -27,12 +81,13 @@ export async function fetchMCQsByExam(year, month, options = {}) {
     throw new Error(errorMessage);
   }
   
-  const data = await response.json();
-  return data;
+  return readBank(response);
 }
 
-export async function fetchMockTestMCQs() {
-  const response = await fetch(`${API_BASE}/get_mcqs/mock_test`);
+// Pass the seed token of an earlier paper to get exactly the same questions again
+export async function fetchMockTestMCQs(seed) {
+  const query = seed ? `?seed=${encodeURIComponent(seed)}` : '';
+  const response = await fetch(`${API_BASE}/get_mcqs/mock_test${query}`);
   if (!response.ok) {
     const error = await response.json();
     throw new Error(error.error || 'Failed to fetch mock test MCQs');
@@ -40,6 +95,34 @@ export async function fetchMockTestMCQs() {
   return response.json();
 }
 
+// Stream a Gemini explanation over Server-Sent Events. Calls onText with the
+// text received so far, then onDone or onError. Returns a function that stops the stream.
+export function streamExplanation(mcqId, { onText, onDone, onError }) {
+  const source = new EventSource(`${API_BASE}/gemini_explanation/stream/${encodeURIComponent(mcqId)}`, { withCredentials: true });
+  let text = '';
+
+  source.onmessage = (event) => {
+    text += JSON.parse(event.data).text;
+    if (onText) onText(text);
+  };
+  source.addEventListener('done', () => {
+    source.close();
+    if (onDone) onDone(text);
+  });
+  source.addEventListener('error', (event) => {
+    source.close();
+    let message = 'Error generating explanation. Please try again later.';
+    try {
+      message = JSON.parse(event.data).error || message;
+    } catch (e) {
+      // Connection error: the event carries no data
+    }
+    if (onError) onError(message);
+  });
+
+  return () => source.close();
+}
+
 export function escapeHtml(text) {
   return String(text)
     .replace(/&/g, '&amp;')
@@ -0,0 +1,302 @@
+"""
+Timeouts, bulkhead and circuit breaker around the Gemini client.
+
+GuardedModel wraps a model object with a generate_content(prompt, ...) method:
+  - every call has a deadline (GEMINI_TIMEOUT seconds), so a slow upstream
+    can no longer pin a gunicorn worker indefinitely; a streamed answer may
+    pause at most that long between chunks and must finish within
+    GEMINI_STREAM_TIMEOUT seconds;
+  - at most GEMINI_MAX_IN_FLIGHT calls run at once per process; extra callers
+    are rejected immediately instead of queueing behind a slow upstream;
+  - after GEMINI_BREAKER_FAILURES consecutive failures the circuit opens and
+    calls fail fast for GEMINI_BREAKER_RESET seconds, then a single trial call
+    decides whether to close it again.
+Rejected and failed calls raise ModelUnavailable; callers fall back to a
+cached explanation or a "try later" message.
+
+FakeModel injects latency and errors so all of this can be exercised locally.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+class ModelUnavailable(Exception):
+    """The model call was rejected, timed out or failed"""
+
+class CircuitOpen(ModelUnavailable):
+    """Failing fast because the upstream has been unhealthy"""
+
+class Overloaded(ModelUnavailable):
+    """Too many model calls already in flight in this process"""
+
+class ModelTimeout(ModelUnavailable):
+    """The model did not answer before the deadline"""
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return self._state
+
+    def allow(self):
+        """True if a call may go through now"""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = 'half_open'
+            # Half-open: exactly one trial call at a time
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def release_trial(self):
+        """Give back a half-open trial slot without judging the upstream"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """Returns True if this failure opened the circuit"""
+        with self._lock:
+            self._trial_in_flight = False
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                opened = self._state != 'open'
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+
+class GuardedModel:
+    """Drop-in wrapper for a Gemini GenerativeModel (see module docstring)"""
+
+    def __init__(self, model, timeout=20.0, max_in_flight=4, failure_threshold=5, reset_timeout=30,
+                 stream_timeout=120.0):
+        self.model = model
+        self.timeout = timeout
+        self.stream_timeout = stream_timeout
+        self.max_in_flight = max_in_flight
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        # Calls run here so the caller can stop waiting at the deadline. A timed
+        # out call keeps its bulkhead slot until it really returns.
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='gemini')
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'rejected_open': 0,
+            'rejected_overloaded': 0,
+            'circuit_opened': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def available(self):
+        """False while the circuit is open (callers can skip straight to a fallback)"""
+        return self.breaker.state != 'open'
+
+    def _enter(self):
+        if not self.breaker.allow():
+            self._count('rejected_open')
+            raise CircuitOpen("Gemini is temporarily unavailable")
+        if not self._slots.acquire(blocking=False):
+            # Not the upstream's fault
+            self.breaker.release_trial()
+            self._count('rejected_overloaded')
+            raise Overloaded(f"{self.max_in_flight} Gemini calls already in flight")
+        self._count('calls')
+
+    def _finish(self, started, error=None):
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._stats['latency_total'] += elapsed
+            self._stats['latency_max'] = max(self._stats['latency_max'], elapsed)
+            self._stats['successes' if error is None else 'failures'] += 1
+            if isinstance(error, ModelTimeout):
+                self._stats['timeouts'] += 1
+        if error is None:
+            self.breaker.record_success()
+        elif self.breaker.record_failure():
+            self._count('circuit_opened')
+            print(f"⚠️ Gemini circuit opened after repeated failures: {error}")
+
+    def _run(self, fn, deadline):
+        """Run fn() on the executor, giving up at ``deadline``"""
+        future = self._executor.submit(fn)
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            # Not cancelled: a queued call must still run to release its slot
+            raise ModelTimeout(f"Gemini did not answer within {self.timeout:.0f}s") from None
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self._enter()
+        started = time.monotonic()
+        deadline = started + (self.stream_timeout if stream else self.timeout)
+        kwargs.setdefault('request_options', {'timeout': self.stream_timeout if stream else self.timeout})
+
+        if stream:
+
+            def open_stream():
+                try:
+                    return iter(self.model.generate_content(prompt, stream=True, **kwargs))
+                except BaseException:
+                    self._slots.release()
+                    raise
+
+            future = self._executor.submit(open_stream)
+            try:
+                chunks = future.result(timeout=self.timeout)
+            except FutureTimeout:
+                # The slot is released once the abandoned call really returns
+                future.add_done_callback(lambda f: f.exception() is None and self._slots.release())
+                error = ModelTimeout(f"Gemini did not answer within {self.timeout:.0f}s")
+                self._finish(started, error)
+                raise error from None
+            except Exception as e:
+                self._finish(started, e)
+                raise ModelUnavailable(str(e)) from e
+            return self._guarded_stream(chunks, started, deadline)
+
+        def call():
+            try:
+                response = self.model.generate_content(prompt, **kwargs)
+                # .text raises on blocked/empty responses; resolve it inside the deadline
+                response.text
+                return response
+            finally:
+                self._slots.release()
+
+        try:
+            response = self._run(call, deadline)
+        except ModelUnavailable as e:
+            self._finish(started, e)
+            raise
+        except Exception as e:
+            self._finish(started, e)
+            raise ModelUnavailable(str(e)) from e
+        self._finish(started)
+        return response
+
+    def _guarded_stream(self, chunks, started, deadline):
+        """Yield chunks; each must arrive within ``timeout`` seconds of the previous
+        one and the whole stream within ``stream_timeout``"""
+        _done = object()
+        release_slot = True
+        try:
+            while True:
+                wait = min(self.timeout, deadline - time.monotonic())
+                future = self._executor.submit(lambda: next(chunks, _done))
+                try:
+                    chunk = future.result(timeout=max(0.0, wait))
+                except FutureTimeout:
+                    # The executor thread is still blocked in next(): the slot is
+                    # released once that call really returns, not now
+                    release_slot = False
+                    future.add_done_callback(lambda f: self._slots.release())
+                    if time.monotonic() >= deadline:
+                        error = ModelTimeout(f"Gemini stream did not finish within {self.stream_timeout:.0f}s")
+                    else:
+                        error = ModelTimeout(f"Gemini stream stalled for {self.timeout:.0f}s")
+                    self._finish(started, error)
+                    raise error from None
+                except Exception as e:
+                    self._finish(started, e)
+                    raise ModelUnavailable(str(e)) from e
+                if chunk is _done:
+                    self._finish(started)
+                    return
+                yield chunk
+        finally:
+            # Also reached when the client disconnects mid-stream (not counted either way)
+            if release_slot:
+                self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats['successes'] + stats['failures']
+        stats['latency_avg'] = stats['latency_total'] / completed if completed else 0.0
+        stats['circuit_state'] = self.breaker.state
+        stats['max_in_flight'] = self.max_in_flight
+        stats['timeout'] = self.timeout
+        stats['stream_timeout'] = self.stream_timeout
+        return stats
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """Local stand-in for GenerativeModel that injects latency and errors.
+
+    ``delay`` seconds (plus up to ``jitter``) per call, and each call fails
+    with probability ``error_rate``. Set ``hang=True`` to never answer.
+    """
+
+    def __init__(self, delay=0.0, jitter=0.0, error_rate=0.0, hang=False, text="Fake explanation.", seed=None):
+        self.delay = delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.hang = hang
+        self.text = text
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _behave(self):
+        with self._lock:
+            pause = self.delay + self._random.random() * self.jitter
+            fail = self._random.random() < self.error_rate
+        if self.hang:
+            threading.Event().wait()
+        time.sleep(pause)
+        if fail:
+            raise RuntimeError("injected upstream error")
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self._behave()
+        if not stream:
+            return _FakeResponse(self.text)
+        return (_FakeResponse(word + ' ') for word in self.text.split())
+
+def guard_from_env(model):
+    """GuardedModel configured from the GEMINI_* environment variables"""
+    return GuardedModel(
+        model,
+        timeout=float(os.getenv('GEMINI_TIMEOUT', 20)),
+        max_in_flight=int(os.getenv('GEMINI_MAX_IN_FLIGHT', 4)),
+        failure_threshold=int(os.getenv('GEMINI_BREAKER_FAILURES', 5)),
+        reset_timeout=float(os.getenv('GEMINI_BREAKER_RESET', 30)),
+        stream_timeout=float(os.getenv('GEMINI_STREAM_TIMEOUT', 120)),
+    )
@@ -0,0 +1,30 @@
+"""
+Gunicorn hooks. Gunicorn loads ./gunicorn.conf.py automatically, so the
+command line in README.md (workers, bind address) stays the same.
+"""
+import os
+import threading
+
+def on_starting(server):
+    """Apply pending schema migrations once, in the master, before workers fork"""
+    if os.getenv('RUN_MIGRATIONS_ON_START', 'true').lower() == 'true':
+        from migrations import run_migrations
+        run_migrations()
+
+def post_worker_init(worker):
+    """Warm the question-bank and response caches and start the mock test pool
+    refiller, Google metadata refresher and email outbox worker as each worker boots"""
+    from db_handler import warm_question_bank_cache
+    from responses import warm_bank_responses
+    from mock_test_pool import start_pool_refresher
+    from auth import start_google_metadata_refresher
+    from email_worker import start_email_worker
+
+    def warm_up():
+        warm_question_bank_cache()
+        warm_bank_responses()
+
+    threading.Thread(target=warm_up, name='mcq-cache-warmup', daemon=True).start()
+    start_pool_refresher()
+    start_google_metadata_refresher()
+    start_email_worker()
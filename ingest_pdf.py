@@ -0,0 +1,482 @@
+"""
+Extract MCQs from a past-paper PDF and load them into the question store.
+
+Pages are rasterized and OCR'd across a process pool (pages that already
+carry a text layer skip OCR), parsed in page order into the MCQ dict shape
+validate_mcq_data() expects, and bulk-loaded in batches on a writer thread
+while later pages are still being processed. Only a bounded window of pages
+and batches is in memory at any time.
+
+Every committed page is recorded in ingest_pages with a content hash, so
+re-running on a corrected file only re-extracts the pages that changed, and
+a crashed run picks up after the last committed page.
+
+Usage:
+    python ingest_pdf.py "pdf_files/March 2025.pdf"
+    python ingest_pdf.py "pdf_files/March 2025.pdf" 10 40      # pages 10-40 only
+    python ingest_pdf.py "pdf_files/March 2025.pdf" --dry-run  # parse, don't write
+    python ingest_pdf.py "pdf_files/March 2025.pdf" --force    # re-process every page
+
+The exam month comes from the file name (format: Month YYYY.pdf).
+"""
+import argparse
+import hashlib
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import fitz  # PyMuPDF
+
+# Pages with at least this much embedded text are read directly instead of OCR'd
+MIN_TEXT_LAYER_CHARS = 200
+
+SUBJECT_HEADINGS = {
+    'Surgery': re.compile(r'^(general\s+)?surgery$', re.I),
+    'Medicine': re.compile(r'^(internal\s+)?medicine$', re.I),
+    'Gynae': re.compile(r'^(gynae|gynaecology|gynecology|obstetrics\s*(and|&)\s*gyn\w*|ob\s*/?\s*gyn\w*)$', re.I),
+    'Paeds': re.compile(r'^(paeds|peds|paediatrics|pediatrics)$', re.I),
+}
+QUESTION_START = re.compile(r'^\s*(?:Q(?:uestion)?\s*\.?\s*)?(\d{1,4})\s*[.):]\s+(.*)$', re.I)
+OPTION_LINE = re.compile(r'^\s*\(?([A-Da-d])\s*[.)]\s+(.*)$')
+ANSWER_LINE = re.compile(r'^\s*(?:correct\s+)?(?:answer|ans)\b\s*[:.\-]?\s*\(?([A-Da-d])\)?\b.*$', re.I)
+EXPLANATION_LINE = re.compile(r'^\s*explanation\s*[:.\-]\s*(.*)$', re.I)
+
+# ---------------------------------------------------------------------------
+# Worker side: one PDF handle per process, reused for every page it is given
+# ---------------------------------------------------------------------------
+
+_worker_documents = {}
+
+def _init_worker():
+    # Tesseract spawns its own threads; one per process avoids oversubscribing cores
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+def _worker_document(pdf_path):
+    doc = _worker_documents.get(pdf_path)
+    if doc is None:
+        doc = _worker_documents[pdf_path] = fitz.open(pdf_path)
+    return doc
+
+def extract_page_text(pdf_path, page_number, dpi=300, lang='eng'):
+    """Return (page_number, text) for one 0-based page, OCR'ing it if needed"""
+    page = _worker_document(pdf_path)[page_number]
+    text = page.get_text('text')
+    if len(text.strip()) >= MIN_TEXT_LAYER_CHARS:
+        return page_number, text
+
+    import pytesseract
+    from PIL import Image
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+    return page_number, pytesseract.image_to_string(image, lang=lang)
+
+# ---------------------------------------------------------------------------
+# Main process: incremental parser fed with page text in page order
+# ---------------------------------------------------------------------------
+
+class QuestionParser:
+    """Turns a stream of page text into MCQ dicts.
+
+    Questions may continue across page boundaries, so a question is only
+    emitted once the next one starts (or finish() is called). The current
+    subject is taken from section headings like 'Surgery' or 'Paediatrics'.
+    """
+
+    def __init__(self, subject=None):
+        self.subject = subject
+        self._current = None
+        self._field = None
+
+    def feed(self, page_number, text):
+        """Parse one page; returns the questions completed so far"""
+        completed = []
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line:
+                continue
+
+            heading = self._match_subject(line)
+            if heading:
+                completed.extend(self._close())
+                self.subject = heading
+                continue
+
+            match = QUESTION_START.match(line)
+            if match and not (self._current and self._field == 'question' and not self._current['options']):
+                completed.extend(self._close())
+                self._current = {
+                    'question_number': match.group(1),
+                    'question_text': match.group(2),
+                    'options': {},
+                    'correct_answer': None,
+                    'subject': self.subject,
+                    'explanation': None,
+                    'page': page_number,
+                }
+                self._field = 'question'
+                continue
+
+            if self._current is None:
+                continue
+
+            match = ANSWER_LINE.match(line)
+            if match:
+                self._current['correct_answer'] = match.group(1).upper()
+                self._field = None
+                continue
+
+            match = EXPLANATION_LINE.match(line)
+            if match:
+                self._current['explanation'] = match.group(1)
+                self._field = 'explanation'
+                continue
+
+            match = OPTION_LINE.match(line)
+            if match and self._field != 'explanation':
+                letter = match.group(1).upper()
+                self._current['options'][letter] = match.group(2)
+                self._field = letter
+                continue
+
+            self._append(line)
+        return completed
+
+    def finish(self):
+        """Flush the last open question"""
+        return self._close()
+
+    @property
+    def open_page(self):
+        """Page the still-open question started on, or None"""
+        return self._current['page'] if self._current else None
+
+    @staticmethod
+    def _match_subject(line):
+        candidate = line.rstrip(':').strip()
+        for subject, pattern in SUBJECT_HEADINGS.items():
+            if pattern.match(candidate):
+                return subject
+        return None
+
+    def _append(self, line):
+        if self._field == 'question':
+            self._current['question_text'] += ' ' + line
+        elif self._field == 'explanation':
+            self._current['explanation'] += ' ' + line
+        elif self._field in ('A', 'B', 'C', 'D'):
+            self._current['options'][self._field] += ' ' + line
+
+    def _close(self):
+        current, self._current, self._field = self._current, None, None
+        return [current] if current else []
+
+# ---------------------------------------------------------------------------
+# Page manifest: content hashes make re-runs incremental and resumable
+# ---------------------------------------------------------------------------
+
+def page_content_hash(doc, page_number):
+    """SHA-256 of a page's drawing instructions, embedded images and geometry"""
+    page = doc[page_number]
+    digest = hashlib.sha256()
+    digest.update(f"{page.rect}|{page.rotation}".encode())
+    digest.update(page.read_contents() or b'')
+    for image in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(image[0]) or b'')
+    return digest.hexdigest()
+
+def load_manifest(source_file):
+    """Return {page_number: {'hash', 'subject_after', 'keys'}} for pages already ingested"""
+    from db_handler import get_connection
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT page_number, content_hash, subject_after, question_keys
+                FROM ingest_pages
+                WHERE source_file = %s
+            """, (source_file,))
+            return {
+                row[0]: {'hash': row[1], 'subject_after': row[2], 'keys': set(row[3] or [])}
+                for row in cur.fetchall()
+            }
+
+def plan_pages(pages, hashes, manifest, force=False):
+    """Decide which pages to re-emit and which to read.
+
+    Returns (changed, emit, read): pages whose hash changed (or all pages with
+    ``force``); pages whose questions are re-upserted, which adds the page
+    before each changed page because its last question may continue onto it;
+    and pages to OCR, which adds the page after each emitted page so
+    questions running off its end can be completed.
+    """
+    page_set = set(pages)
+    changed = {p for p in pages if force or manifest.get(p, {}).get('hash') != hashes[p]}
+    emit = changed | {p - 1 for p in changed if p - 1 in page_set}
+    read = emit | {p + 1 for p in emit if p + 1 in page_set}
+    return changed, emit, sorted(read)
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+def _ordered_page_text(pdf_path, pages, workers, dpi, lang):
+    """Yield (page_number, text) in page order while pages are OCR'd in parallel.
+
+    At most ``2 * workers`` pages are in flight or waiting to be consumed, so
+    memory stays bounded regardless of the document size.
+    """
+    pages = list(pages)
+    window = max(2, workers * 2)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        in_flight = set()
+        done = {}
+        submitted = 0
+        for expected in pages:
+            while submitted < len(pages) and len(in_flight) + len(done) < window:
+                in_flight.add(pool.submit(extract_page_text, pdf_path, pages[submitted], dpi, lang))
+                submitted += 1
+            while expected not in done:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    page_number, text = future.result()
+                    done[page_number] = text
+            yield expected, done.pop(expected)
+
+class _PageWriter(threading.Thread):
+    """Commits finished pages while extraction keeps running.
+
+    Each flush is one transaction holding the MCQs of one or more whole pages
+    plus their manifest rows, so an interrupted run resumes after the last
+    committed page and a re-processed page never counts its questions twice.
+    """
+
+    def __init__(self, source_file, manifest, batch_size=200, dry_run=False):
+        super().__init__(name='mcq-page-writer', daemon=True)
+        self.source_file = source_file
+        self.manifest = manifest
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        # Small bound: if the database falls behind, extraction waits instead of buffering
+        self.pages = queue.Queue(maxsize=64)
+        self.counts = {}
+        self.pages_committed = 0
+        self.error = None
+
+    def run(self):
+        pending, pending_mcqs = [], 0
+        while True:
+            unit = self.pages.get()
+            if unit is not None:
+                pending.append(unit)
+                pending_mcqs += len(unit['mcqs'])
+                if pending_mcqs < self.batch_size:
+                    continue
+            if pending and not self.error:
+                try:
+                    self._flush(pending)
+                except Exception as e:
+                    self.error = e
+            pending, pending_mcqs = [], 0
+            if unit is None:
+                return
+
+    def _flush(self, units):
+        if self.dry_run:
+            self._count('parsed', sum(len(u['mcqs']) for u in units))
+            self.pages_committed += len(units)
+            return
+
+        from psycopg2.extras import execute_values
+        from db_handler import (
+            get_connection, bulk_load_mcqs, exam_month_from_source, invalidate_question_bank_cache,
+            bump_bank_version, partitions_committed
+        )
+        _exam_date, exam_year, exam_month = exam_month_from_source(self.source_file)
+        mcqs, owners = [], []
+        known_keys = set()
+        for unit in units:
+            known_keys |= self.manifest.get(unit['page'], {}).get('keys', set())
+            for mcq in unit['mcqs']:
+                mcq = dict(mcq)
+                mcq.pop('page', None)
+                mcqs.append(mcq)
+                owners.append(unit['page'])
+
+        with get_connection() as conn:
+            reports = bulk_load_mcqs(mcqs, self.source_file, conn=conn, known_keys=known_keys)
+            new_keys = {unit['page']: set() for unit in units}
+            for page, report in zip(owners, reports):
+                self._count(report['status'])
+                if report['normalized_question']:
+                    new_keys[page].add(report['normalized_question'])
+                elif report['status'] in ('invalid', 'error'):
+                    print(f"⚠️ Page {page + 1} Q{report['question_number']}: {report['reason']}")
+
+            # Questions that vanished from a corrected page lose this appearance
+            still_present = set().union(*new_keys.values())
+            removed = [
+                key for unit in units
+                for key in self.manifest.get(unit['page'], {}).get('keys', set()) - still_present
+            ]
+            with conn.cursor() as cur:
+                if removed:
+                    cur.execute("""
+                        DELETE FROM mcqs
+                        WHERE exam_year = %s AND exam_month = %s
+                          AND normalized_question = ANY(%s)
+                          AND appearance_count <= 1 AND source_file = %s
+                    """, (exam_year, exam_month, removed, self.source_file))
+                    cur.execute("""
+                        UPDATE mcqs SET appearance_count = appearance_count - 1
+                        WHERE exam_year = %s AND exam_month = %s
+                          AND normalized_question = ANY(%s)
+                          AND appearance_count > 1
+                    """, (exam_year, exam_month, removed))
+                    bump_bank_version(cur)
+                    self._count('retired', len(removed))
+                execute_values(cur, """
+                    INSERT INTO ingest_pages (source_file, page_number, content_hash, subject_after, question_keys)
+                    VALUES %s
+                    ON CONFLICT (source_file, page_number) DO UPDATE SET
+                        content_hash = EXCLUDED.content_hash,
+                        subject_after = EXCLUDED.subject_after,
+                        question_keys = EXCLUDED.question_keys,
+                        ingested_at = CURRENT_TIMESTAMP
+                """, [
+                    (self.source_file, unit['page'], unit['hash'], unit['subject_after'],
+                     sorted(new_keys[unit['page']]))
+                    for unit in units
+                ], template="(%s, %s, %s, %s::medical_subject, %s::varchar(32)[])")
+
+        partitions_committed((exam_year, exam_month))
+        invalidate_question_bank_cache()
+        for unit in units:
+            self.manifest[unit['page']] = {
+                'hash': unit['hash'], 'subject_after': unit['subject_after'],
+                'keys': new_keys[unit['page']]
+            }
+        self.pages_committed += len(units)
+
+    def _count(self, status, n=1):
+        self.counts[status] = self.counts.get(status, 0) + n
+
+def ingest_pdf(pdf_path, first_page=None, last_page=None, workers=None, batch_size=200,
+               dpi=300, lang='eng', dry_run=False, force=False):
+    """Extract and load the MCQs of ``pdf_path`` whose pages changed since the last run.
+
+    Returns outcome counts. ``force`` re-processes every page (without
+    counting already-ingested questions again). ``dry_run`` never touches the
+    database, so it parses every page in the range as if it were new.
+    """
+    started = time.monotonic()
+    workers = workers or os.cpu_count() or 1
+    source_file = os.path.basename(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        first = (first_page or 1) - 1
+        last = min(last_page or page_count, page_count)
+        pages = list(range(first, last))
+        hashes = {p: page_content_hash(doc, p) for p in pages}
+
+    # Dry runs stay offline: without the manifest every page counts as changed
+    manifest = {} if dry_run else load_manifest(source_file)
+    changed, emit, read = plan_pages(pages, hashes, manifest, force=force)
+    if not changed:
+        print(f"✅ {source_file}: all {len(pages)} pages unchanged since last ingestion")
+        return {}
+    print(f"📄 {source_file}: {len(changed)} of {len(pages)} pages changed; "
+          f"re-extracting {len(emit)} pages (reading {len(read)}) on {workers} workers")
+
+    writer = _PageWriter(source_file, manifest, batch_size=batch_size, dry_run=dry_run)
+    writer.start()
+    parser = None
+    previous_page = None
+    open_pages = {}  # emitted page -> questions starting on it, until it is complete
+    subject_after = {}  # page -> parser subject at the end of that page
+    parsed = 0
+
+    def release_complete_pages(final=False):
+        """Hand pages to the writer once none of their questions can still grow"""
+        open_page = None if final else parser.open_page
+        for page in sorted(open_pages):
+            if open_page is not None and page >= open_page:
+                break
+            writer.pages.put({
+                'page': page, 'hash': hashes[page],
+                'subject_after': subject_after.get(page),
+                'mcqs': open_pages.pop(page),
+            })
+
+    def collect(questions):
+        nonlocal parsed
+        for question in questions:
+            if question['page'] in open_pages:
+                open_pages[question['page']].append(question)
+                parsed += 1
+
+    try:
+        for page_number, text in _ordered_page_text(pdf_path, read, workers, dpi, lang):
+            if previous_page is None or page_number != previous_page + 1:
+                # Start of a run of pages: finish the last run, seed the subject
+                if parser is not None:
+                    collect(parser.finish())
+                    release_complete_pages(final=True)
+                seed = manifest.get(page_number - 1, {}).get('subject_after')
+                parser = QuestionParser(subject=seed)
+            if page_number in emit:
+                open_pages[page_number] = []
+            collect(parser.feed(page_number, text))
+            subject_after[page_number] = parser.subject
+            release_complete_pages()
+            previous_page = page_number
+            if writer.error:
+                raise writer.error
+        if parser is not None:
+            collect(parser.finish())
+            release_complete_pages(final=True)
+    finally:
+        writer.pages.put(None)
+        writer.join()
+    if writer.error:
+        print(f"❌ Stopped after committing {writer.pages_committed} pages; re-run to resume")
+        raise writer.error
+
+    elapsed = time.monotonic() - started
+    print(f"\n📊 {source_file}: {parsed} questions from {len(emit)} pages in {elapsed:.1f}s "
+          f"({len(read) / elapsed if elapsed else 0:.1f} pages/s)")
+    for status, count in sorted(writer.counts.items()):
+        print(f"  {status}: {count}")
+    if not dry_run and writer.counts.get('inserted'):
+        # New questions join the cross-month near-duplicate index right away
+        from near_duplicates import update_index
+        update_index()
+    return writer.counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract MCQs from a past-paper PDF into the database")
+    parser.add_argument('pdf', help="PDF named like 'March 2025.pdf'")
+    parser.add_argument('first_page', nargs='?', type=int, help="First page to process (1-based)")
+    parser.add_argument('last_page', nargs='?', type=int, help="Last page to process (inclusive)")
+    parser.add_argument('--workers', type=int, default=None, help="OCR processes (default: all cores)")
+    parser.add_argument('--batch-size', type=int, default=200, help="MCQs per database transaction")
+    parser.add_argument('--dpi', type=int, default=300, help="Rasterization resolution for OCR")
+    parser.add_argument('--lang', default='eng', help="Tesseract language")
+    parser.add_argument('--force', action='store_true', help="Re-process pages even if unchanged")
+    parser.add_argument('--dry-run', action='store_true', help="Parse every page offline; don't read or write the database")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.pdf):
+        print(f"❌ File not found: {args.pdf}")
+        return 1
+    ingest_pdf(
+        args.pdf, args.first_page, args.last_page,
+        workers=args.workers, batch_size=args.batch_size,
+        dpi=args.dpi, lang=args.lang, dry_run=args.dry_run, force=args.force
+    )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
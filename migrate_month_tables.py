@@ -0,0 +1,167 @@
+"""
+Move MCQs from the legacy per-month tables (january25_mcqs ... december25_mcqs,
+or any <month><yy>_mcqs table) into the partitioned mcqs question store.
+
+Usage:
+    python migrate_month_tables.py                 # migrate every legacy table found
+    python migrate_month_tables.py march25_mcqs    # migrate specific tables only
+    python migrate_month_tables.py --dry-run       # show what would be migrated
+
+The migration is idempotent: rows already present in the target partition
+(same normalized question) are skipped, so it is safe to re-run. Legacy
+tables are left in place; drop them manually once the new store is verified.
+"""
+import argparse
+import sys
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from db_handler import (
+    get_connection,
+    ensure_all_tables_exist,
+    ensure_mcq_partition,
+    partitions_committed,
+    bump_bank_version,
+    legacy_table_exam_month,
+    normalize_question,
+    clean_text,
+    VALID_SUBJECTS,
+)
+
+BATCH_SIZE = 1000
+
+# Columns every legacy month table has (the ones the API has always read)
+REQUIRED_COLUMNS = [
+    'question_number', 'question_text',
+    'option_a', 'option_b', 'option_c', 'option_d',
+    'correct_answer', 'subject', 'explanation'
+]
+
+# Columns only some legacy tables have (march25_mcqs was the full schema)
+OPTIONAL_COLUMNS = ['source_file', 'exam_date', 'appearance_count', 'last_appearance', 'created_at']
+
+def find_legacy_tables(cur):
+    """Return legacy month tables in the public schema, oldest exam month first"""
+    cur.execute("""
+        SELECT table_name
+        FROM information_schema.tables
+        WHERE table_schema = 'public' AND table_name LIKE %s
+    """, ('%\\_mcqs',))
+    tables = [row[0] for row in cur.fetchall() if legacy_table_exam_month(row[0])]
+    return sorted(tables, key=legacy_table_exam_month)
+
+def table_columns(cur, table):
+    cur.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s
+    """, (table,))
+    return {row[0] for row in cur.fetchall()}
+
+def migrate_table(conn, table, dry_run=False):
+    """Copy one legacy table into its mcqs partition. Returns (read, inserted)."""
+    year, month = legacy_table_exam_month(table)
+    with conn.cursor() as cur:
+        columns = table_columns(cur, table)
+        missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+        if missing:
+            print(f"⚠️ Skipping {table}: missing columns {missing}")
+            return 0, 0
+        extra = [c for c in OPTIONAL_COLUMNS if c in columns]
+        if not dry_run:
+            ensure_mcq_partition(cur, year, month)
+
+    select_columns = REQUIRED_COLUMNS + extra
+    target_columns = ['exam_year', 'exam_month', 'normalized_question'] + select_columns
+
+    read = inserted = 0
+    # Named (server-side) cursor so large tables are streamed, not loaded at once
+    with conn.cursor(name=f"migrate_{table}") as src:
+        src.itersize = BATCH_SIZE
+        src.execute(sql.SQL("SELECT {columns} FROM {table} ORDER BY id").format(
+            columns=sql.SQL(', ').join(map(sql.Identifier, select_columns)),
+            table=sql.Identifier(table)
+        ))
+        with conn.cursor() as dst:
+            while True:
+                rows = src.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                read += len(rows)
+                values = []
+                for row in rows:
+                    record = dict(zip(select_columns, row))
+                    if record['subject'] not in VALID_SUBJECTS:
+                        print(f"⚠️ Unknown subject '{record['subject']}' for {table} Q{record['question_number']}, defaulting to Medicine")
+                        record['subject'] = 'Medicine'
+                    normalized = normalize_question(clean_text(record['question_text']))
+                    values.append([year, month, normalized] + [record[c] for c in select_columns])
+                if dry_run:
+                    continue
+                result = execute_values(
+                    dst,
+                    sql.SQL("""
+                        INSERT INTO mcqs ({columns}) VALUES %s
+                        ON CONFLICT (exam_year, exam_month, normalized_question) DO NOTHING
+                        RETURNING id
+                    """).format(
+                        columns=sql.SQL(', ').join(map(sql.Identifier, target_columns))
+                    ).as_string(dst),
+                    values,
+                    page_size=BATCH_SIZE,
+                    fetch=True
+                )
+                inserted += len(result)
+    if inserted:
+        with conn.cursor() as cur:
+            bump_bank_version(cur)
+    return read, inserted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate legacy month MCQ tables into the partitioned mcqs table")
+    parser.add_argument('tables', nargs='*', help="Legacy tables to migrate (default: all found)")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be migrated")
+    args = parser.parse_args(argv)
+
+    for table in args.tables:
+        if not legacy_table_exam_month(table):
+            print(f"❌ {table} is not a legacy month table name (expected e.g. march25_mcqs)")
+            return 1
+
+    if not args.dry_run:
+        ensure_all_tables_exist()
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            found = find_legacy_tables(cur)
+        tables = [t for t in args.tables if t in found] if args.tables else found
+        for table in set(args.tables) - set(found):
+            print(f"⚠️ Table {table} does not exist, skipping")
+
+        if not tables:
+            print("No legacy month tables to migrate")
+            return 0
+
+        total_read = total_inserted = 0
+        for table in tables:
+            year, month = legacy_table_exam_month(table)
+            try:
+                read, inserted = migrate_table(conn, table, dry_run=args.dry_run)
+                conn.commit()
+                if not args.dry_run:
+                    partitions_committed((year, month))
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Error migrating {table}: {e}")
+                return 1
+            total_read += read
+            total_inserted += inserted
+            if args.dry_run:
+                print(f"🔎 {table} -> mcqs ({year}-{month:02d}): {read} rows would be migrated")
+            else:
+                print(f"✅ {table} -> mcqs ({year}-{month:02d}): {inserted} inserted, {read - inserted} already present")
+
+    print(f"\n📊 Migrated {total_inserted} of {total_read} rows from {len(tables)} tables")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
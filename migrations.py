@@ -0,0 +1,354 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. Run them as a deploy step (gunicorn.conf.py also
+runs them once in the gunicorn master at startup) - never from a request.
+
+Usage:
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending migrations
+
+To change the schema, append a new function to MIGRATIONS; never edit one
+that has already shipped.
+"""
+import argparse
+import sys
+from db_handler import _open_connection
+
+# Arbitrary constant so concurrent deploys/workers apply migrations one at a time
+MIGRATION_LOCK_ID = 72_410_125
+
+def _0001_baseline(cur):
+    """users table, medical_subject enum and the partitioned mcqs store"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            is_verified BOOLEAN DEFAULT TRUE,
+            google_id VARCHAR(64) UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'medical_subject') THEN
+                CREATE TYPE medical_subject AS ENUM ('Surgery', 'Medicine', 'Gynae', 'Paeds');
+            END IF;
+        END $$;
+    """)
+    # Single question store, partitioned by exam year and then exam month.
+    # Partitions are created on demand by db_handler.ensure_mcq_partition().
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mcqs (
+            id BIGSERIAL,
+            exam_year SMALLINT NOT NULL,
+            exam_month SMALLINT NOT NULL CHECK (exam_month BETWEEN 1 AND 12),
+            question_number VARCHAR(20),
+            question_text TEXT NOT NULL,
+            normalized_question VARCHAR(32),
+            option_a TEXT,
+            option_b TEXT,
+            option_c TEXT,
+            option_d TEXT,
+            correct_answer CHAR(1) NOT NULL,
+            explanation TEXT,
+            subject medical_subject NOT NULL,
+            source_file VARCHAR(100),
+            exam_date DATE,
+            appearance_count INTEGER DEFAULT 1,
+            last_appearance DATE DEFAULT CURRENT_DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (exam_year, exam_month, id),
+            UNIQUE (exam_year, exam_month, normalized_question)
+        ) PARTITION BY LIST (exam_year)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS mcqs_subject_exam_idx
+        ON mcqs (subject, exam_year, exam_month)
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS mcqs_exam_subject_idx
+        ON mcqs (exam_year, exam_month, subject)
+    """)
+
+def _0002_users_google_id(cur):
+    """google_id for databases created before Google login existed"""
+    cur.execute("""
+        ALTER TABLE users
+        ADD COLUMN IF NOT EXISTS google_id VARCHAR(64) UNIQUE
+    """)
+
+def _0003_mcq_sort_key(cur):
+    """Stored numeric question sort key and the indexes the MCQ ORDER BYs use"""
+    cur.execute("""
+        ALTER TABLE mcqs
+        ADD COLUMN IF NOT EXISTS question_sort_key BIGINT GENERATED ALWAYS AS (
+            CASE
+                WHEN question_number ~ '^[0-9]+' THEN CAST(regexp_replace(question_number, '[^0-9].*$', '') AS BIGINT)
+                ELSE 999999
+            END
+        ) STORED
+    """)
+    # Subject-wise practice: WHERE subject = ? ORDER BY exam_year, exam_month, sort key
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS mcqs_subject_sort_idx
+        ON mcqs (subject, exam_year, exam_month, question_sort_key, question_number)
+    """)
+    # Exam-wise practice: WHERE exam_year = ? AND exam_month = ? ORDER BY subject, sort key
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS mcqs_exam_sort_idx
+        ON mcqs (exam_year, exam_month, subject, question_sort_key, question_number)
+    """)
+    # Both are prefixes of the new indexes
+    cur.execute("DROP INDEX IF EXISTS mcqs_subject_exam_idx")
+    cur.execute("DROP INDEX IF EXISTS mcqs_exam_subject_idx")
+
+def _0004_users_lower_email(cur):
+    """Expression index for the case-insensitive email lookup at login"""
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS users_lower_email_idx
+        ON users (LOWER(email))
+    """)
+
+def _0005_ingest_pages(cur):
+    """Per-page content hash manifest for resumable, incremental PDF ingestion"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_pages (
+            source_file VARCHAR(100) NOT NULL,
+            page_number INTEGER NOT NULL,
+            content_hash CHAR(64) NOT NULL,
+            subject_after medical_subject,
+            question_keys VARCHAR(32)[] NOT NULL DEFAULT '{}',
+            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source_file, page_number)
+        )
+    """)
+
+def _0006_near_duplicate_index(cur):
+    """MinHash signatures and LSH buckets for cross-month near-duplicate detection"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mcq_minhash (
+            mcq_id BIGINT PRIMARY KEY,
+            exam_year SMALLINT NOT NULL,
+            exam_month SMALLINT NOT NULL,
+            signature BYTEA NOT NULL,
+            indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mcq_lsh_buckets (
+            band SMALLINT NOT NULL,
+            bucket BIGINT NOT NULL,
+            mcq_id BIGINT NOT NULL,
+            PRIMARY KEY (band, bucket, mcq_id)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS mcq_lsh_buckets_mcq_idx
+        ON mcq_lsh_buckets (mcq_id)
+    """)
+
+def _0007_mock_test_pool(cur):
+    """Pre-generated mock test papers and who has been served each one"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mock_test_papers (
+            id BIGSERIAL PRIMARY KEY,
+            seed VARCHAR(12) NOT NULL,
+            payload TEXT NOT NULL,
+            question_count INTEGER NOT NULL,
+            served_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS mock_test_papers_serve_idx
+        ON mock_test_papers (served_count, id)
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS mock_test_deliveries (
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            paper_id BIGINT NOT NULL REFERENCES mock_test_papers (id) ON DELETE CASCADE,
+            delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (paper_id, user_id)
+        )
+    """)
+
+def _0008_explanation_cache(cur):
+    """Gemini explanations keyed by normalized question hash and correct option"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS explanation_cache (
+            question_hash VARCHAR(32) NOT NULL,
+            correct_option CHAR(1) NOT NULL,
+            explanation TEXT,
+            lease_owner VARCHAR(64),
+            lease_expires TIMESTAMPTZ,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (question_hash, correct_option)
+        )
+    """)
+
+def _0009_job_checkpoints(cur):
+    """Resume points for long-running offline jobs (e.g. explanation backfill)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job_name VARCHAR(100) PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0,
+            state JSONB,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _0010_question_bank_version(cur):
+    """Single-row counter bumped whenever MCQs change (drives ETags and cache refresh)"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS question_bank_version (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("INSERT INTO question_bank_version DEFAULT VALUES ON CONFLICT DO NOTHING")
+
+def _0011_users_username_pattern(cur):
+    """Prefix index for the next-free-suffix lookup when creating Google users"""
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS users_username_pattern_idx
+        ON users (username varchar_pattern_ops)
+    """)
+
+def _0012_email_outbox(cur):
+    """Outbox of emails written by request handlers and delivered by email_worker.py"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            recipient VARCHAR(255) NOT NULL,
+            subject TEXT NOT NULL,
+            body_text TEXT NOT NULL,
+            body_html TEXT,
+            status VARCHAR(10) NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            locked_until TIMESTAMPTZ,
+            last_error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            sent_at TIMESTAMPTZ
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS email_outbox_due_idx
+        ON email_outbox (next_attempt_at)
+        WHERE status IN ('pending', 'sending')
+    """)
+
+def _0013_mcqs_id_index(cur):
+    """Lookups by MCQ id alone (the primary key leads with the partition keys)"""
+    cur.execute("CREATE INDEX IF NOT EXISTS mcqs_id_idx ON mcqs (id)")
+
+def _0014_mcqs_subject_keyset_index(cur):
+    """Index matching SUBJECT_ORDER_COLUMNS_SQL exactly, so subject banks and
+    keyset pages are read in index order instead of sorted"""
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS mcqs_subject_keyset_idx
+        ON mcqs (subject, exam_year, exam_month, question_sort_key, (COALESCE(question_number, '')), id)
+    """)
+    # Every subject query orders by the columns above now
+    cur.execute("DROP INDEX IF EXISTS mcqs_subject_sort_idx")
+
+MIGRATIONS = [
+    (1, 'baseline schema', _0001_baseline),
+    (2, 'users.google_id', _0002_users_google_id),
+    (3, 'mcqs question sort key', _0003_mcq_sort_key),
+    (4, 'users lower(email) index', _0004_users_lower_email),
+    (5, 'ingest_pages manifest', _0005_ingest_pages),
+    (6, 'near-duplicate MinHash/LSH index', _0006_near_duplicate_index),
+    (7, 'mock test paper pool', _0007_mock_test_pool),
+    (8, 'explanation cache', _0008_explanation_cache),
+    (9, 'job checkpoints', _0009_job_checkpoints),
+    (10, 'question bank version', _0010_question_bank_version),
+    (11, 'users username prefix index', _0011_users_username_pattern),
+    (12, 'email outbox', _0012_email_outbox),
+    (13, 'mcqs id index', _0013_mcqs_id_index),
+    (14, 'mcqs subject keyset index', _0014_mcqs_subject_keyset_index),
+]
+
+def _applied_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+def run_migrations():
+    """Apply every pending migration. Returns the list of versions applied."""
+    applied_now = []
+    conn = _open_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            with conn.cursor() as cur:
+                applied = _applied_versions(cur)
+            conn.commit()
+            for version, name, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                try:
+                    with conn.cursor() as cur:
+                        migrate(cur)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                            (version, name)
+                        )
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"❌ Migration {version:04d} ({name}) failed: {e}")
+                    raise
+                applied_now.append(version)
+                print(f"✅ Applied migration {version:04d}: {name}")
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    finally:
+        conn.close()
+    if not applied_now:
+        print("✅ Database schema is up to date")
+    return applied_now
+
+def migration_status():
+    """Return [(version, name, applied)] for every known migration"""
+    conn = _open_connection()
+    try:
+        with conn.cursor() as cur:
+            applied = _applied_versions(cur)
+        conn.commit()
+    finally:
+        conn.close()
+    return [(version, name, version in applied) for version, name, _migrate in MIGRATIONS]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply versioned database migrations")
+    parser.add_argument('--status', action='store_true', help="List migrations without applying them")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        for version, name, applied in migration_status():
+            print(f"{'✅' if applied else '⏳'} {version:04d} {name}")
+        return 0
+
+    run_migrations()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Pool of ready-made mock test papers.
+
+Papers are sampled ahead of time with sample_mock_test_mcqs() and stored as
+pre-serialized JSON in mock_test_papers, so serving a mock test is a single
+statement that claims a paper and records the delivery. A paper is reused by
+up to MOCK_TEST_PAPER_MAX_USES different users (never twice for the same user)
+and retired after MOCK_TEST_PAPER_MAX_AGE so new questions reach the pool.
+
+A background thread in each gunicorn worker tops the pool up to the high-water
+mark whenever it drops below the low-water mark; a Postgres advisory lock keeps
+workers from filling it at the same time.
+
+Usage:
+    python mock_test_pool.py fill      # top the pool up to the high-water mark now
+    python mock_test_pool.py status    # show how many papers are available
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from psycopg2.extras import execute_values
+from db_handler import get_connection, sample_mock_test_mcqs, MOCK_TEST_SUBJECT_LIMITS
+
+POOL_LOW_WATER = int(os.getenv('MOCK_TEST_POOL_LOW', 50))
+POOL_HIGH_WATER = int(os.getenv('MOCK_TEST_POOL_HIGH', 200))
+PAPER_MAX_USES = int(os.getenv('MOCK_TEST_PAPER_MAX_USES', 20))
+PAPER_MAX_AGE = int(os.getenv('MOCK_TEST_PAPER_MAX_AGE', 86400))
+POOL_CHECK_INTERVAL = float(os.getenv('MOCK_TEST_POOL_INTERVAL', 30))
+
+# Arbitrary constant so only one worker fills the pool at a time
+POOL_FILL_LOCK_ID = 72_410_126
+INSERT_BATCH = 20
+
+def claim_paper(user_id):
+    """Claim a pooled paper for ``user_id``.
+
+    Returns (payload_json, seed_token, available_after) or None when the pool
+    has nothing this user has not already seen.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH picked AS (
+                    SELECT p.id
+                    FROM mock_test_papers p
+                    WHERE p.served_count < %(max_uses)s
+                      AND p.created_at > now() - make_interval(secs => %(max_age)s)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM mock_test_deliveries d
+                          WHERE d.paper_id = p.id AND d.user_id = %(user_id)s
+                      )
+                    ORDER BY p.served_count, p.id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                ), served AS (
+                    UPDATE mock_test_papers p
+                    SET served_count = p.served_count + 1
+                    FROM picked
+                    WHERE p.id = picked.id
+                    RETURNING p.id, p.seed, p.payload, p.served_count
+                ), delivered AS (
+                    INSERT INTO mock_test_deliveries (user_id, paper_id)
+                    SELECT %(user_id)s, id FROM served
+                )
+                SELECT payload, seed,
+                       (SELECT COUNT(*) FROM mock_test_papers
+                        WHERE served_count < %(max_uses)s
+                          AND created_at > now() - make_interval(secs => %(max_age)s))
+                       - CASE WHEN served_count >= %(max_uses)s THEN 1 ELSE 0 END
+                FROM served
+            """, {'user_id': user_id, 'max_uses': PAPER_MAX_USES, 'max_age': PAPER_MAX_AGE})
+            return cur.fetchone()
+
+def available_papers():
+    """Number of papers that can still be served"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT COUNT(*) FROM mock_test_papers
+                WHERE served_count < %s AND created_at > now() - make_interval(secs => %s)
+            """, (PAPER_MAX_USES, PAPER_MAX_AGE))
+            return cur.fetchone()[0]
+
+def fill_pool(target=None):
+    """Retire used-up papers and generate new ones up to ``target`` (default
+    POOL_HIGH_WATER). Returns the number generated, or None if another process
+    is already filling the pool."""
+    target = POOL_HIGH_WATER if target is None else target
+    generated = 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (POOL_FILL_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM mock_test_papers
+                    WHERE served_count >= %s OR created_at <= now() - make_interval(secs => %s)
+                """, (PAPER_MAX_USES, PAPER_MAX_AGE))
+                cur.execute("""
+                    SELECT COUNT(*) FROM mock_test_papers
+                    WHERE served_count < %s AND created_at > now() - make_interval(secs => %s)
+                """, (PAPER_MAX_USES, PAPER_MAX_AGE))
+                missing = target - cur.fetchone()[0]
+            conn.commit()
+
+            while missing > 0:
+                papers = []
+                for _ in range(min(INSERT_BATCH, missing)):
+                    mcqs, seed = sample_mock_test_mcqs(MOCK_TEST_SUBJECT_LIMITS)
+                    if not mcqs:
+                        break
+                    papers.append((seed, json.dumps(mcqs), len(mcqs)))
+                if not papers:
+                    print("⚠️ Mock test pool: no MCQs available to build papers")
+                    break
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO mock_test_papers (seed, payload, question_count) VALUES %s
+                    """, papers)
+                conn.commit()
+                generated += len(papers)
+                missing -= len(papers)
+        finally:
+            # After a failed INSERT the transaction is aborted and the unlock
+            # would fail too, leaving the session lock on a pooled connection
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (POOL_FILL_LOCK_ID,))
+            conn.commit()
+    if generated:
+        print(f"✅ Mock test pool: generated {generated} papers")
+    return generated
+
+class PoolRefresher(threading.Thread):
+    """Background thread that keeps the pool above the low-water mark.
+    It checks every POOL_CHECK_INTERVAL seconds, or immediately when nudged."""
+
+    def __init__(self):
+        super().__init__(name='mock-test-pool', daemon=True)
+        self._wake = threading.Event()
+
+    def nudge(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            try:
+                if available_papers() < POOL_LOW_WATER:
+                    fill_pool()
+            except Exception as e:
+                print(f"⚠️ Mock test pool refill failed: {e}")
+            self._wake.wait(POOL_CHECK_INTERVAL)
+            self._wake.clear()
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def start_pool_refresher():
+    """Start this process's refill thread (gunicorn post_worker_init calls it)"""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = PoolRefresher()
+            _refresher.start()
+    return _refresher
+
+def request_refill():
+    """Ask the refill thread to check the pool now"""
+    if _refresher is not None:
+        _refresher.nudge()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the pre-generated mock test paper pool")
+    sub = parser.add_subparsers(dest='command', required=True)
+    fill = sub.add_parser('fill', help="Top the pool up now")
+    fill.add_argument('--papers', type=int, default=POOL_HIGH_WATER, help="Target number of available papers")
+    sub.add_parser('status', help="Show available papers")
+    args = parser.parse_args(argv)
+
+    if args.command == 'fill':
+        if fill_pool(args.papers) is None:
+            print("⏳ Another process is filling the pool")
+    print(f"📊 {available_papers()} mock test papers available "
+          f"(low-water {POOL_LOW_WATER}, high-water {POOL_HIGH_WATER}, {PAPER_MAX_USES} users per paper)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
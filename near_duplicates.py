@@ -0,0 +1,256 @@
+"""
+Near-duplicate index for recurring exam questions.
+
+normalize_question() only catches exact repeats. This module finds reworded
+repeats across every exam month: each question stem is shingled into word
+3-grams, summarized as a MinHash signature, and split into LSH bands stored
+in mcq_lsh_buckets. Questions sharing a bucket are candidate pairs, verified
+against their estimated Jaccard similarity and grouped into clusters. Work is
+linear in the number of questions (plus the size of shared buckets) instead
+of comparing all pairs.
+
+Usage:
+    python near_duplicates.py update             # index questions not indexed yet
+    python near_duplicates.py rebuild            # drop and rebuild the whole index
+    python near_duplicates.py clusters [--threshold 0.5] [--subject Medicine]
+"""
+import argparse
+import hashlib
+import random
+import re
+import struct
+import sys
+import zlib
+from psycopg2.extras import execute_values
+from db_handler import get_connection, cached_result, MONTH_NAMES, VALID_SUBJECTS
+
+NUM_PERM = 128
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS  # 4 rows -> candidates from roughly 0.4 Jaccard
+SHINGLE_SIZE = 3
+# Buckets shared by more questions than this are boilerplate ("which of the following")
+MAX_BUCKET_SIZE = 50
+DEFAULT_THRESHOLD = 0.5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: signatures must stay comparable across runs and processes
+_rng = random.Random(20250301)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+def shingles(text):
+    """Set of 32-bit hashes of the word 3-grams of a question stem"""
+    words = re.sub(r'[^a-z0-9\s]', ' ', (text or '').lower()).split()
+    if len(words) < SHINGLE_SIZE:
+        grams = [' '.join(words)] if words else []
+    else:
+        grams = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return {zlib.crc32(gram.encode()) for gram in grams}
+
+def minhash(shingle_set):
+    """MinHash signature (NUM_PERM ints) of a shingle set"""
+    if not shingle_set:
+        return [_MAX_HASH] * NUM_PERM
+    values = list(shingle_set)
+    return [
+        min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in values)
+        for a, b in _PERMUTATIONS
+    ]
+
+def lsh_buckets(signature):
+    """[(band, bucket)] keys for a signature; similar questions share some"""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'<{ROWS_PER_BAND}I', *rows), digest_size=8).digest()
+        buckets.append((band, struct.unpack('<q', digest)[0]))
+    return buckets
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+def _pack(signature):
+    return struct.pack(f'<{NUM_PERM}I', *signature)
+
+def _unpack(data):
+    return list(struct.unpack(f'<{NUM_PERM}I', bytes(data)))
+
+def update_index(rebuild=False, batch_size=1000):
+    """Index every MCQ that has no signature yet. Returns the number indexed."""
+    indexed = 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if rebuild:
+                cur.execute("TRUNCATE mcq_lsh_buckets, mcq_minhash")
+            else:
+                # Questions removed from the bank drop out of the index
+                cur.execute("""
+                    DELETE FROM mcq_minhash h
+                    WHERE NOT EXISTS (SELECT 1 FROM mcqs m WHERE m.id = h.mcq_id)
+                """)
+                cur.execute("""
+                    DELETE FROM mcq_lsh_buckets b
+                    WHERE NOT EXISTS (SELECT 1 FROM mcq_minhash h WHERE h.mcq_id = b.mcq_id)
+                """)
+
+        with conn.cursor(name='near_duplicate_scan') as src:
+            src.itersize = batch_size
+            src.execute("""
+                SELECT m.id, m.exam_year, m.exam_month, m.question_text
+                FROM mcqs m
+                WHERE NOT EXISTS (SELECT 1 FROM mcq_minhash h WHERE h.mcq_id = m.id)
+                ORDER BY m.id
+            """)
+            with conn.cursor() as dst:
+                while True:
+                    rows = src.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    signatures, buckets = [], []
+                    for mcq_id, exam_year, exam_month, question_text in rows:
+                        signature = minhash(shingles(question_text))
+                        signatures.append((mcq_id, exam_year, exam_month, _pack(signature)))
+                        buckets.extend((band, bucket, mcq_id) for band, bucket in lsh_buckets(signature))
+                    execute_values(dst, """
+                        INSERT INTO mcq_minhash (mcq_id, exam_year, exam_month, signature)
+                        VALUES %s ON CONFLICT (mcq_id) DO NOTHING
+                    """, signatures, page_size=batch_size)
+                    execute_values(dst, """
+                        INSERT INTO mcq_lsh_buckets (band, bucket, mcq_id)
+                        VALUES %s ON CONFLICT DO NOTHING
+                    """, buckets, page_size=batch_size * BANDS)
+                    indexed += len(rows)
+    if indexed:
+        print(f"✅ Indexed {indexed} questions for near-duplicate detection")
+    return indexed
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+def _find_clusters(threshold, subject):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH usable AS (
+                    SELECT band, bucket
+                    FROM mcq_lsh_buckets
+                    GROUP BY band, bucket
+                    HAVING COUNT(*) BETWEEN 2 AND %s
+                )
+                SELECT DISTINCT a.mcq_id, b.mcq_id
+                FROM usable u
+                JOIN mcq_lsh_buckets a ON a.band = u.band AND a.bucket = u.bucket
+                JOIN mcq_lsh_buckets b ON b.band = u.band AND b.bucket = u.bucket
+                WHERE a.mcq_id < b.mcq_id
+            """, (MAX_BUCKET_SIZE,))
+            pairs = cur.fetchall()
+            if not pairs:
+                return []
+
+            ids = sorted({i for pair in pairs for i in pair})
+            cur.execute("SELECT mcq_id, signature FROM mcq_minhash WHERE mcq_id = ANY(%s)", (ids,))
+            signatures = {row[0]: _unpack(row[1]) for row in cur.fetchall()}
+
+            groups = _UnionFind()
+            for a, b in pairs:
+                if a in signatures and b in signatures and similarity(signatures[a], signatures[b]) >= threshold:
+                    groups.union(a, b)
+            members = {}
+            for mcq_id in list(groups.parent):
+                members.setdefault(groups.find(mcq_id), []).append(mcq_id)
+            clustered = [i for group in members.values() if len(group) > 1 for i in group]
+            if not clustered:
+                return []
+
+            cur.execute("""
+                SELECT id, exam_year, exam_month, question_number, question_text, subject, appearance_count
+                FROM mcqs
+                WHERE id = ANY(%s)
+            """, (clustered,))
+            details = {row[0]: row for row in cur.fetchall()}
+
+    clusters = []
+    for root, group in members.items():
+        rows = [details[i] for i in sorted(group) if i in details]
+        if subject:
+            rows = [r for r in rows if r[5] == subject]
+        if len(rows) < 2:
+            continue
+        rows.sort(key=lambda r: (r[1], r[2], r[0]))
+        clusters.append({
+            'size': len(rows),
+            # appearance_count is per exam month; the cluster total spans them all
+            'appearances': sum(r[6] or 0 for r in rows),
+            'months': sorted({f"{MONTH_NAMES[r[2] - 1].title()} {r[1]}" for r in rows},
+                             key=lambda m: (int(m.split()[1]), MONTH_NAMES.index(m.split()[0].lower()))),
+            'questions': [
+                {
+                    'id': r[0],
+                    'exam_year': r[1],
+                    'exam_month': r[2],
+                    'question_number': r[3],
+                    'question_text': r[4],
+                    'subject': r[5],
+                    'appearance_count': r[6],
+                }
+                for r in rows
+            ],
+        })
+    clusters.sort(key=lambda c: (-c['size'], -c['appearances'], c['questions'][0]['id']))
+    return clusters
+
+def get_repeated_question_clusters(threshold=DEFAULT_THRESHOLD, subject=None):
+    """Clusters of questions that recur (possibly reworded) across exam months.
+
+    Each cluster is {'size', 'appearances', 'months', 'questions': [...]},
+    largest first; ``appearances`` sums the per-month appearance_count of its
+    questions.
+    Results are cached like the question banks.
+    """
+    threshold = round(float(threshold), 2)
+    return cached_result(
+        ('repeated', threshold, subject),
+        lambda: _find_clusters(threshold, subject)
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Near-duplicate question index")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('update', help="Index questions that are not indexed yet")
+    sub.add_parser('rebuild', help="Drop and rebuild the whole index")
+    clusters = sub.add_parser('clusters', help="Print clusters of repeated questions")
+    clusters.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    clusters.add_argument('--subject', choices=VALID_SUBJECTS)
+    args = parser.parse_args(argv)
+
+    if args.command in ('update', 'rebuild'):
+        update_index(rebuild=args.command == 'rebuild')
+        return 0
+
+    found = _find_clusters(args.threshold, args.subject)
+    for cluster in found:
+        print(f"\n🔁 {cluster['size']} questions ({cluster['appearances']} appearances) across {', '.join(cluster['months'])}")
+        for q in cluster['questions']:
+            print(f"  - [{MONTH_NAMES[q['exam_month'] - 1].title()} {q['exam_year']} Q{q['question_number']}] {q['question_text'][:100]}")
+    print(f"\n📊 {len(found)} clusters")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
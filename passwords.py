@@ -0,0 +1,117 @@
+"""
+Password hashing for the login hot path.
+
+Hashes use PASSWORD_HASH_METHOD (any werkzeug method string, e.g.
+``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``), so the cost can be tuned
+per deployment. Verification runs on a small per-process thread pool
+(hashlib's scrypt/pbkdf2 release the GIL) with a bounded queue: during a
+login spike extra attempts are turned away with PasswordCheckBusy instead of
+piling up behind the CPU. Hashes made with other parameters are upgraded the
+next time their owner logs in (see needs_rehash).
+
+Usage:
+    python passwords.py bench [--seconds 5] [--method scrypt:16384:8:1]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+# Verifications allowed to wait for a free worker before new ones are rejected
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', PASSWORD_HASH_WORKERS * 4))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+class PasswordCheckBusy(Exception):
+    """Too many password checks already queued in this process"""
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password')
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+def _method_params(method):
+    """Full parameter string werkzeug records for ``method`` ('scrypt' -> 'scrypt:32768:8:1')"""
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+_current_params = _method_params(PASSWORD_HASH_METHOD)
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+def needs_rehash(password_hash):
+    """True if the hash was made with a method or cost other than PASSWORD_HASH_METHOD"""
+    return password_hash.split('$', 1)[0] != _current_params
+
+def _submit(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordCheckBusy("Too many login attempts in progress, please try again")
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _f: _slots.release())
+    return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+
+def verify_password(password_hash, password):
+    """check_password_hash on the bounded pool. Raises PasswordCheckBusy when saturated."""
+    return _submit(check_password_hash, password_hash, password)
+
+def upgraded_hash(password_hash, password):
+    """A new hash for ``password`` if ``password_hash`` uses outdated parameters, else None.
+    Only call after verify_password succeeded."""
+    if not needs_rehash(password_hash):
+        return None
+    try:
+        return _submit(hash_password, password)
+    except Exception as e:
+        # Not worth failing the login over; we will try again next time
+        print(f"⚠️ Could not rehash password: {e}")
+        return None
+
+def benchmark(seconds=5.0, method=None):
+    """Verify one hash in a loop on every pool worker; returns logins/second (total and per core)"""
+    method = method or PASSWORD_HASH_METHOD
+    stored = generate_password_hash('Correct-Horse-1', method=method)
+    deadline = time.monotonic() + seconds
+    counts = [0] * PASSWORD_HASH_WORKERS
+
+    def loop(i):
+        while time.monotonic() < deadline:
+            check_password_hash(stored, 'Correct-Horse-1')
+            counts[i] += 1
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(PASSWORD_HASH_WORKERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    total = sum(counts) / elapsed
+    return {
+        'method': _method_params(method),
+        'workers': PASSWORD_HASH_WORKERS,
+        'cores': os.cpu_count(),
+        'logins_per_second': total,
+        'logins_per_second_per_core': total / min(PASSWORD_HASH_WORKERS, os.cpu_count() or 1),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Password hashing tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help="Measure password verifications per second")
+    bench.add_argument('--seconds', type=float, default=5.0)
+    bench.add_argument('--method', help="werkzeug hash method (default: PASSWORD_HASH_METHOD)")
+    args = parser.parse_args(argv)
+
+    result = benchmark(args.seconds, args.method)
+    print(f"📊 {result['method']}: {result['logins_per_second']:.1f} logins/s with {result['workers']} workers "
+          f"on {result['cores']} cores = {result['logins_per_second_per_core']:.1f} logins/s/core")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
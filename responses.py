@@ -0,0 +1,216 @@
+"""
+Conditional, precompressed JSON responses for the question-bank endpoints.
+
+Bank responses only change when the MCQs do, so they are identified by the
+question bank version (db_handler.current_bank_version) plus the request key:
+  - the weak ETag is derived from both, and a matching If-None-Match gets an
+    empty 304 without touching the bank at all;
+  - the JSON body is serialized once per version and kept, along with its
+    gzip and (if the optional brotli package is installed) brotli encodings,
+    in a size-bounded cache, so repeat requests only pick a ready-made body.
+Bodies are encoded with orjson when it is installed (several times faster than
+the stdlib json module), and the subject banks are pre-encoded at worker boot
+so even the first request after a deploy skips serialization.
+
+Clients that send ``Accept: application/vnd.mcq-columnar+json`` get the same
+data column by column (see to_columnar), which drops the per-question keys and
+repeated subject strings; frontend/src/utils/api.js decodes it.
+"""
+import gzip
+import hashlib
+import json
+import os
+from flask import Response, request, stream_with_context
+from db_handler import QuestionBankCache, current_bank_version, get_mcqs_by_subject, VALID_SUBJECTS
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+_bodies = QuestionBankCache(
+    max_bytes=int(float(os.getenv('MCQ_RESPONSE_CACHE_MAX_MB', 64)) * 1024 * 1024),
+    ttl=float(os.getenv('MCQ_CACHE_TTL', 600)),
+)
+
+def accepted_encodings():
+    """Content codings the client accepts (q > 0)"""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding)
+    return accepted
+
+def choose_encoding():
+    accepted = accepted_encodings()
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return 'identity'
+
+def dumps(payload):
+    """JSON-encode ``payload`` to bytes with the fastest encoder available"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+
+COLUMNAR_MIMETYPE = 'application/vnd.mcq-columnar+json'
+# Columns with at most this many distinct string values are dictionary-encoded
+_DICTIONARY_MAX_VALUES = 32
+_OPTION_KEYS = ('A', 'B', 'C', 'D')
+
+def _wants_columnar():
+    return request.accept_mimetypes[COLUMNAR_MIMETYPE] > request.accept_mimetypes['application/json']
+
+def _encode_column(name, values):
+    if name == 'options':
+        # Fixed positions A-D, null where an option is missing
+        return {'options': [[opts.get(k) for k in _OPTION_KEYS] for opts in values]}
+    distinct = set(values)
+    if len(distinct) == 1:
+        return {'const': values[0]}
+    if len(distinct) <= _DICTIONARY_MAX_VALUES and all(v is None or isinstance(v, str) for v in distinct):
+        dictionary = sorted(distinct, key=lambda v: (v is None, v or ''))
+        codes = {v: i for i, v in enumerate(dictionary)}
+        return {'dict': dictionary, 'codes': [codes[v] for v in values]}
+    return {'values': values}
+
+def to_columnar(payload):
+    """Columnar form of a list of MCQ dicts (or of a page's 'items').
+
+    {"format": "mcq-columnar", "version": 1, "count": N, "columns": {name: column}}
+    where each column is {"values": [...]}, {"const": value} (same on every
+    row), {"dict": [...], "codes": [...]} (e.g. subject, correct_answer) or
+    {"options": [[A, B, C, D], ...]}.
+    """
+    if isinstance(payload, dict) and isinstance(payload.get('items'), list):
+        return dict(payload, items=to_columnar(payload['items']))
+    names = []
+    for item in payload:
+        for name in item:
+            if name not in names:
+                names.append(name)
+    return {
+        'format': 'mcq-columnar',
+        'version': 1,
+        'count': len(payload),
+        'columns': {
+            name: _encode_column(name, [item.get(name) for item in payload]) for name in names
+        },
+    }
+
+def _etag(key, version, fmt='json'):
+    digest = hashlib.sha1(repr((key, fmt)).encode()).hexdigest()[:12]
+    return f"v{version}-{digest}"
+
+def _encode(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    # mtime=0 keeps the bytes identical across workers
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+def _headers(etag):
+    return {
+        'ETag': f'W/"{etag}"',
+        # Per-user (login required) and must be revalidated, which is cheap
+        'Cache-Control': 'private, no-cache',
+        'Vary': 'Accept, Accept-Encoding',
+    }
+
+def encoded_body(key, version, build, encoding='identity', fmt='json'):
+    """Bytes of ``build()`` as JSON (``fmt`` 'json' or 'columnar', optionally
+    gzip/br encoded), built once per version. Empty results are cached as b''
+    so a missing bank is not rebuilt per request."""
+    def serialize():
+        payload = build()
+        if not payload:
+            return b''
+        return dumps(to_columnar(payload) if fmt == 'columnar' else payload)
+
+    body = _bodies.get_or_load((key, version, fmt, 'identity'), serialize)
+    if encoding == 'identity' or not body:
+        return body
+    return _bodies.get_or_load((key, version, fmt, encoding), lambda: _encode(body, encoding))
+
+def bank_json_response(key, build):
+    """Serve ``build()`` as JSON identified by ``key`` and the bank version.
+
+    Returns a 304 when the client already has this version, the (compressed)
+    JSON response otherwise, or None when ``build()`` returns nothing, so the
+    caller can send its usual 404.
+    """
+    version = current_bank_version()
+    fmt = 'columnar' if _wants_columnar() else 'json'
+    etag = _etag(key, version, fmt)
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=_headers(etag))
+
+    body = encoded_body(key, version, build, 'identity', fmt)
+    if not body:
+        return None
+
+    encoding = choose_encoding() if len(body) >= COMPRESS_MIN_BYTES else 'identity'
+    headers = _headers(etag)
+    if encoding != 'identity':
+        body = encoded_body(key, version, build, encoding, fmt)
+        headers['Content-Encoding'] = encoding
+    mimetype = COLUMNAR_MIMETYPE if fmt == 'columnar' else 'application/json'
+    return Response(body, mimetype=mimetype, headers=headers)
+
+def warm_bank_responses():
+    """Pre-encode the subject banks in the variants clients negotiate: the
+    columnar form the React app asks for (br and gzip) and the plain JSON
+    fallback (gzip); run at worker boot"""
+    version = current_bank_version()
+    encodings = ['gzip'] if brotli is None else ['br', 'gzip']
+    variants = [('columnar', encoding) for encoding in encodings] + [('json', 'gzip')]
+    for subject in VALID_SUBJECTS:
+        for fmt, encoding in variants:
+            try:
+                encoded_body(('subject', subject), version, lambda: get_mcqs_by_subject(subject), encoding, fmt)
+            except Exception as e:
+                print(f"⚠️ Could not pre-encode {subject} bank ({fmt}, {encoding}): {e}")
+                break
+
+def stream_json_array(chunks):
+    """Streaming JSON array response from an iterable of item lists.
+    Only one chunk is held in memory at a time."""
+    def generate():
+        yield b'['
+        first = True
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                body = b','.join(dumps(item) for item in chunk)
+                yield body if first else b',' + body
+                first = False
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated array
+            print(f"❌ Error while streaming JSON: {e}")
+            raise
+        yield b']'
+
+    return Response(stream_with_context(generate()), mimetype='application/json',
+                    headers={'Cache-Control': 'private, no-cache', 'X-Accel-Buffering': 'no'})
+
+def get_response_cache_stats():
+    """Encoded-body cache counters for this worker"""
+    stats = _bodies.stats()
+    stats['brotli'] = brotli is not None
+    stats['orjson'] = orjson is not None
+    return stats
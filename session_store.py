@@ -0,0 +1,259 @@
+"""
+Server-side sessions.
+
+The session cookie only carries a signed, random session id; the data
+(pending_registration, user_id, OAuth state, flashes, ...) lives in a store:
+  - RedisSessionStore when SESSION_BACKEND=redis (shared by every worker and
+    node; needs the optional redis package);
+  - SQLiteSessionStore when SESSION_BACKEND=sqlite, a local file shared by
+    the workers of one host (single-host deploys, development and tests).
+Entries expire after the session lifetime (TTL eviction), and the stored data
+is only read when a view actually touches the session, so static files and
+most API calls never hit the store. Without SESSION_BACKEND (or
+SESSION_REDIS_URL) Flask's signed-cookie sessions are kept.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+
+try:
+    import redis
+except ImportError:  # optional: only needed for SESSION_BACKEND=redis
+    redis = None
+
+# Lifetime of non-permanent (browser) sessions in the store
+SESSION_TTL = int(os.getenv('SESSION_TTL', 86400))
+
+class RedisSessionStore:
+    """Sessions as Redis strings with a native TTL"""
+
+    def __init__(self, url, prefix='session:'):
+        if redis is None:
+            raise RuntimeError("SESSION_BACKEND=redis needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        data = self.client.get(self.prefix + sid)
+        return data.decode() if data is not None else None
+
+    def save(self, sid, data, ttl):
+        self.client.set(self.prefix + sid, data, ex=ttl)
+
+    def touch(self, sid, ttl):
+        self.client.expire(self.prefix + sid, ttl)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+class SQLiteSessionStore:
+    """Sessions in a local SQLite file (one connection per thread, WAL mode).
+    Expired rows are ignored on read and purged every ``purge_interval`` seconds."""
+
+    def __init__(self, path, purge_interval=300):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._purged_at = 0.0
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            if self.path != ':memory:':
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data, ttl):
+        now = time.time()
+        self._conn().execute("""
+            INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+        """, (sid, data, now + ttl))
+        if now - self._purged_at > self.purge_interval:
+            self._purged_at = now
+            self._conn().execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+    def touch(self, sid, ttl):
+        self._conn().execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (time.time() + ttl, sid))
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+class LazySession(SessionMixin):
+    """Session dict that reads the store on first access"""
+
+    def __init__(self, sid, loader=None, new=False):
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.replaced_sid = None
+        self._loader = loader
+        self._data = None if loader else {}
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _items(self):
+        self.accessed = True
+        if self._data is None:
+            self._data = self._loader() or {}
+        return self._data
+
+    def __getitem__(self, key):
+        return self._items()[key]
+
+    def __setitem__(self, key, value):
+        self._items()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._items()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._items())
+
+    def __len__(self):
+        return len(self._items())
+
+    def __contains__(self, key):
+        return key in self._items()
+
+    def regenerate(self):
+        """Move the data to a fresh id and drop the old one (call on login, so a
+        session id planted before authentication never becomes an authenticated one)"""
+        self._items()
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+    def clear(self):
+        # A cleared session (e.g. on logout) continues under a fresh id
+        self.regenerate()
+        self._data = {}
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by one of the stores above"""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def _ttl(self, app, session):
+        if session.permanent:
+            return int(app.permanent_session_lifetime.total_seconds())
+        return SESSION_TTL
+
+    def _load(self, sid):
+        data = self.store.load(sid)
+        if data is None:
+            return {}
+        try:
+            return self.serializer.loads(data)
+        except ValueError:
+            return {}
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+                return LazySession(sid, loader=lambda: self._load(sid))
+            except BadSignature:
+                pass
+        return LazySession(secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        if not session.loaded:
+            # The view never looked at the session: nothing to write
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.replaced_sid:
+            self.store.delete(session.replaced_sid)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        response.vary.add('Cookie')
+        ttl = self._ttl(app, session)
+        if session.modified:
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), ttl)
+        else:
+            # Sliding expiry for sessions in use
+            self.store.touch(session.sid, ttl)
+        if not self.should_set_cookie(app, session):
+            return
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+def regenerate_session(session):
+    """Give the current session a fresh id if the backend supports it (signed
+    cookie sessions carry their data and need nothing)"""
+    if isinstance(session, LazySession):
+        session.regenerate()
+
+def init_session_store(app):
+    """Install the server-side session interface configured by SESSION_BACKEND"""
+    # Default stays Flask's signed cookies: a sqlite store is local to one host,
+    # so it has to be chosen explicitly
+    backend = os.getenv('SESSION_BACKEND', 'redis' if os.getenv('SESSION_REDIS_URL') else 'cookie').lower()
+    if backend == 'cookie':
+        return None
+    if backend == 'redis':
+        store = RedisSessionStore(os.getenv('SESSION_REDIS_URL') or os.getenv('REDIS_URL'))
+    elif backend == 'sqlite':
+        store = SQLiteSessionStore(os.getenv('SESSION_SQLITE_PATH', os.path.join(app.instance_path, 'sessions.sqlite3')))
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend} (expected redis, sqlite or cookie)")
+    app.session_interface = ServerSideSessionInterface(store)
+    print(f"✅ Server-side sessions: {backend}")
+    return store
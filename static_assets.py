@@ -0,0 +1,141 @@
+"""
+SPA shell and static asset serving.
+
+The React shell (static/index.html) is held in memory and only re-read when
+its modification time changes, so page loads do no file I/O beyond a stat at
+most once a second.
+
+Files under /static are served by serve_static() instead of Flask's default
+handler:
+  - content-hashed build assets (listed in static/asset-hashes.json, which
+    build_and_deploy.py writes, or named like main.<hash>.js) get
+    ``Cache-Control: public, max-age=31536000, immutable``;
+  - when the client accepts it, a precompressed ``.br`` or ``.gz`` sibling is
+    sent instead of the original, with the matching Content-Encoding.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+import time
+from flask import Response, request, send_from_directory
+from werkzeug.security import safe_join
+from responses import accepted_encodings
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+SHELL_PATH = os.path.join(STATIC_DIR, 'index.html')
+MANIFEST_PATH = os.path.join(STATIC_DIR, 'asset-hashes.json')
+SHELL_CHECK_INTERVAL = 1.0
+
+IMMUTABLE_MAX_AGE = 31536000
+# Create React App names build output like main.28b5186d.js / main.9e141d6f.css
+# (source maps: main.28b5186d.js.map). Shared with build_and_deploy.py.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.(?:chunk\.)?(?:js|css|(?:(?:js|css)\.)?map|woff2?|ttf|svg|png|jpe?g|gif|webp)$')
+SIBLING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+class ShellCache:
+    """In-memory copy of a file, reloaded when its mtime/size change"""
+
+    def __init__(self, path, check_interval=SHELL_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._body = None
+        self._etag = None
+        self._checked_at = 0.0
+
+    def get(self):
+        """(body, etag), or (None, None) when the file does not exist"""
+        now = time.monotonic()
+        if self._body is not None and now - self._checked_at < self.check_interval:
+            return self._body, self._etag
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._stamp = self._body = self._etag = None
+                return None, None
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp != self._stamp:
+                with open(self.path, 'rb') as f:
+                    body = f.read()
+                self._body = body
+                self._etag = hashlib.sha1(body).hexdigest()[:16]
+                self._stamp = stamp
+            self._checked_at = now
+            return self._body, self._etag
+
+_shell = ShellCache(SHELL_PATH)
+_manifest_file = ShellCache(MANIFEST_PATH)
+_manifest = {'etag': None, 'files': {}}
+
+def deployed_assets():
+    """{path relative to static/: {sha256, size, immutable, encodings}} from the last deploy"""
+    body, etag = _manifest_file.get()
+    if etag != _manifest['etag']:
+        try:
+            files = json.loads(body).get('files', {}) if body else {}
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable asset manifest: {e}")
+            files = {}
+        _manifest['files'], _manifest['etag'] = files, etag
+    return _manifest['files']
+
+def shell_response():
+    """The SPA shell (revalidated on every load, 304 when unchanged), or None
+    when the frontend has not been built"""
+    body, etag = _shell.get()
+    if body is None:
+        return None
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='text/html', headers=headers)
+
+def is_immutable(filename):
+    """True for content-hashed files, which never change under the same name"""
+    entry = deployed_assets().get(filename)
+    return entry['immutable'] if entry else bool(HASHED_NAME.search(filename))
+
+def _precompressed(filename):
+    """(sibling filename, encoding) for the best precompressed variant the
+    client accepts, or (filename, None)"""
+    accepted = accepted_encodings()
+    entry = deployed_assets().get(filename)
+    for encoding, suffix in SIBLING_SUFFIXES.items():
+        if encoding not in accepted and '*' not in accepted:
+            continue
+        # Deployed files list their siblings; anything else needs a stat
+        if encoding in entry['encodings'] if entry else _sibling_exists(filename + suffix):
+            return filename + suffix, encoding
+    return filename, None
+
+def _sibling_exists(name):
+    # safe_join refuses paths escaping static/ (None), so the stat never
+    # answers questions about files outside it
+    path = safe_join(STATIC_DIR, name)
+    return path is not None and os.path.isfile(path)
+
+def serve_static(filename):
+    """Replacement for Flask's static view (see module docstring)"""
+    immutable = is_immutable(filename)
+    max_age = IMMUTABLE_MAX_AGE if immutable else None
+    sibling, encoding = _precompressed(filename)
+    if encoding is None:
+        response = send_from_directory(STATIC_DIR, filename, max_age=max_age)
+    else:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(STATIC_DIR, sibling, max_age=max_age, mimetype=mimetype,
+                                       download_name=filename)
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+def init_static(app):
+    """Route /static through serve_static (keeps url_for('static', ...) working)"""
+    app.view_functions['static'] = serve_static
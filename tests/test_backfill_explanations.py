@@ -0,0 +1,100 @@
+import contextlib
+import json
+import threading
+import time
+
+import pytest
+
+import backfill_explanations as bf
+
+class FakeStore:
+    """In-memory stand-in for the mcqs rows and job_checkpoints row the backfill touches"""
+
+    def __init__(self, count):
+        self.rows = [
+            {'id': i, 'exam_year': 2025, 'exam_month': 3, 'question_text': f"Question {i}?",
+             'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd', 'correct_answer': 'A'}
+            for i in range(1, count + 1)
+        ]
+        self.explanations = {}
+        self.checkpoint = 0
+        self.saves = []
+        self._lock = threading.Lock()
+
+    def load_checkpoint(self, restart=False):
+        return 0 if restart else self.checkpoint
+
+    def save_checkpoint(self, conn, last_id, counts):
+        with self._lock:
+            # Every question up to the checkpoint must already be explained
+            unexplained = [r['id'] for r in self.rows if r['id'] <= last_id and r['id'] not in self.explanations]
+            self.saves.append((last_id, unexplained))
+            self.checkpoint = last_id
+
+    def scan_pending(self, after_id, subject=None, limit=None):
+        for row in self.rows:
+            if row['id'] > after_id and row['id'] not in self.explanations:
+                yield row
+
+    def write_explanations(self, conn, rows, results):
+        with self._lock:
+            self.explanations.update(results)
+
+class BatchModel(bf.StubModel):
+    """StubModel that is slow on some questions and fails on others"""
+
+    def __init__(self, slow_ids=(), failing_ids=()):
+        super().__init__()
+        self.slow_ids = set(slow_ids)
+        self.failing_ids = set(failing_ids)
+        self.seen = []
+
+    def generate_content(self, prompt):
+        ids = {item['id'] for item in json.loads(prompt[prompt.index('['):])}
+        self.seen.extend(sorted(ids))
+        if ids & self.slow_ids:
+            time.sleep(0.2)
+        if ids & self.failing_ids:
+            raise RuntimeError("stub model failure")
+        return super().generate_content(prompt)
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeStore(20)
+    monkeypatch.setattr(bf, 'get_connection', contextlib.nullcontext)
+    monkeypatch.setattr(bf, 'load_checkpoint', store.load_checkpoint)
+    monkeypatch.setattr(bf, 'save_checkpoint', store.save_checkpoint)
+    monkeypatch.setattr(bf, 'scan_pending', store.scan_pending)
+    monkeypatch.setattr(bf, 'write_explanations', store.write_explanations)
+    # One attempt per batch, so failures don't sleep through the retry backoff
+    monkeypatch.setattr(bf, 'MAX_ATTEMPTS', 1)
+    return store
+
+def run_backfill(model):
+    return bf.backfill(model, batch_size=2, concurrency=4, rpm=60000)
+
+def test_checkpoint_waits_for_slow_earlier_batch(store):
+    counts = run_backfill(BatchModel(slow_ids={1}))
+
+    assert counts == {'written': 20, 'failed': 0, 'batches': 10}
+    assert store.checkpoint == 20
+    checkpoints = [last_id for last_id, _ in store.saves]
+    assert checkpoints == sorted(checkpoints)
+    assert all(not unexplained for _, unexplained in store.saves)
+
+def test_failed_batch_holds_checkpoint_until_resume(store):
+    counts = run_backfill(BatchModel(failing_ids={5}))
+
+    assert counts['failed'] == 2
+    assert store.checkpoint == 4
+    assert set(store.explanations) == set(range(1, 21)) - {5, 6}
+    assert all(not unexplained for _, unexplained in store.saves)
+
+    # The next run starts after the checkpoint and only sees what is still pending
+    model = BatchModel()
+    counts = run_backfill(model)
+
+    assert model.seen == [5, 6]
+    assert counts == {'written': 2, 'failed': 0, 'batches': 1}
+    assert set(store.explanations) == set(range(1, 21))
+    assert store.checkpoint == 6
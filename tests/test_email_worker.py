@@ -0,0 +1,86 @@
+import socketserver
+import threading
+
+import pytest
+
+import email_worker
+
+class FakeOutbox:
+    """In-memory email_outbox: claim_batch/record_results without Postgres"""
+
+    def __init__(self, count):
+        self.pending = [
+            {'id': i, 'recipient': f"student{i}@example.com", 'subject': f"Code {i}",
+             'body_text': f"Your code is {i}", 'body_html': f"<p>Your code is {i}</p>", 'attempts': 0}
+            for i in range(1, count + 1)
+        ]
+        self.sent = []
+        self.retries = []
+        self.failures = []
+        self.claims = 0
+
+    def claim_batch(self, limit=email_worker.BATCH_SIZE):
+        self.claims += 1
+        batch, self.pending = self.pending[:limit], self.pending[limit:]
+        for row in batch:
+            row['attempts'] += 1
+        return batch
+
+    def record_results(self, sent_ids, retries, failures):
+        self.sent.extend(sent_ids)
+        self.retries.extend(retries)
+        self.failures.extend(failures)
+
+@pytest.fixture
+def sink():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), email_worker._SinkHandler)
+    server.daemon_threads = True
+    server.received = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def outbox(monkeypatch):
+    outbox = FakeOutbox(45)
+    monkeypatch.setattr(email_worker, 'claim_batch', outbox.claim_batch)
+    monkeypatch.setattr(email_worker, 'record_results', outbox.record_results)
+    return outbox
+
+def test_drain_delivers_everything_over_reused_connections(sink, outbox):
+    pool = email_worker.SMTPPool(size=2, host='127.0.0.1', port=sink.server_address[1],
+                                 use_tls=False, username=None, password=None, timeout=5)
+    worker = email_worker.EmailWorker(pool=pool, batch_size=20)
+    try:
+        worker.drain()
+    finally:
+        pool.close()
+
+    assert sorted(outbox.sent) == list(range(1, 46))
+    assert outbox.retries == [] and outbox.failures == []
+    # 20 + 20 + 5: the short batch ends the drain
+    assert outbox.claims == 3
+    assert sink.received == 45
+    # Three batches, yet never more sessions than the pool size
+    stats = worker.stats()
+    assert stats['sent'] == 45 and stats['batches'] == 3
+    assert 1 <= stats['smtp_connects'] <= 2
+
+def test_unreachable_server_schedules_retries(outbox):
+    # Nothing listens on the sink's port once it is closed
+    server = socketserver.TCPServer(('127.0.0.1', 0), socketserver.BaseRequestHandler)
+    port = server.server_address[1]
+    server.server_close()
+
+    pool = email_worker.SMTPPool(size=1, host='127.0.0.1', port=port,
+                                 use_tls=False, username=None, password=None, timeout=1)
+    worker = email_worker.EmailWorker(pool=pool, batch_size=5)
+    assert worker.run_batch() == 5
+
+    assert outbox.sent == [] and outbox.failures == []
+    assert [outbox_id for outbox_id, _delay, _error in outbox.retries] == [1, 2, 3, 4, 5]
+    assert all(delay > 0 for _id, delay, _error in outbox.retries)
+    # Failed connects don't leak pool capacity
+    assert pool._open == 0
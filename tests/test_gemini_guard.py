@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from gemini_guard import FakeModel, GuardedModel, ModelTimeout, Overloaded
+
+class StallingModel:
+    """Streams one chunk, then blocks until ``resume`` is set"""
+
+    def __init__(self):
+        self.resume = threading.Event()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        def chunks():
+            yield 'first '
+            self.resume.wait()
+            yield 'second'
+        return chunks()
+
+def free_slots(guard):
+    """Number of bulkhead slots not held by a call"""
+    acquired = 0
+    while guard._slots.acquire(blocking=False):
+        acquired += 1
+    for _ in range(acquired):
+        guard._slots.release()
+    return acquired
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_timed_out_call_keeps_its_slot_until_it_returns():
+    model = FakeModel(delay=0.3)
+    guard = GuardedModel(model, timeout=0.05, max_in_flight=1)
+
+    with pytest.raises(ModelTimeout):
+        guard.generate_content('prompt')
+    # The abandoned call is still running upstream: no new call may start
+    with pytest.raises(Overloaded):
+        guard.generate_content('prompt')
+
+    assert wait_for(lambda: free_slots(guard) == 1)
+    model.delay = 0.0
+    assert guard.generate_content('prompt').text == 'Fake explanation.'
+    assert free_slots(guard) == 1
+    stats = guard.stats()
+    assert (stats['timeouts'], stats['rejected_overloaded'], stats['successes']) == (1, 1, 1)
+
+def test_stalled_stream_releases_slot_only_when_read_returns():
+    model = StallingModel()
+    guard = GuardedModel(model, timeout=0.05, max_in_flight=1, stream_timeout=5.0)
+
+    stream = guard.generate_content('prompt', stream=True)
+    assert next(stream) == 'first '
+    with pytest.raises(ModelTimeout):
+        next(stream)
+    # The executor thread is still blocked inside the model's stream
+    assert free_slots(guard) == 0
+    with pytest.raises(Overloaded):
+        guard.generate_content('prompt', stream=True)
+
+    model.resume.set()
+    assert wait_for(lambda: free_slots(guard) == 1)
+
+def test_stream_total_deadline():
+    model = FakeModel(text='slow drip of words')
+    guard = GuardedModel(model, timeout=1.0, max_in_flight=1, stream_timeout=0.2)
+
+    def drip(prompt, stream=False, **kwargs):
+        for word in model.text.split():
+            time.sleep(0.1)
+            yield word
+    model.generate_content = drip
+
+    with pytest.raises(ModelTimeout, match='did not finish'):
+        list(guard.generate_content('prompt', stream=True))
+    assert wait_for(lambda: free_slots(guard) == 1)
+
+def test_abandoned_stream_releases_slot():
+    guard = GuardedModel(FakeModel(text='one two three'), timeout=1.0, max_in_flight=1)
+
+    stream = guard.generate_content('prompt', stream=True)
+    next(stream)
+    assert free_slots(guard) == 0
+    # Client disconnects mid-stream
+    stream.close()
+    assert free_slots(guard) == 1